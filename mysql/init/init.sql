@@ -41,7 +41,17 @@ INSERT INTO `config` (`id`, `config_key`, `config_value`, `description`, `is_act
 (7, 'LOAD_TO_D1M_TEMP', './load_to_dm_temp', NULL, 1, '2025-11-21 13:45:10'),
 (8, 'STAGING_DIR', './staging', NULL, 1, '2025-11-23 14:55:02'),
 (9, 'EXPORT_DATA_FROM_STG_PROCEDURE', 'sp_export_from_stg_by_date', NULL, 1, '2025-11-24 04:26:10'),
-(10, 'LOAD_DM_PROCEDURE', 'sp_load_mart_daily', NULL, 1, '2025-11-24 09:30:42');
+(10, 'LOAD_DM_PROCEDURE', 'sp_load_mart_daily', NULL, 1, '2025-11-24 09:30:42'),
+(11, 'BROWSER_POOL_SIZE', '2', 'so Chromium giu san trong pool crawler', 1, '2025-11-25 03:35:00'),
+(12, 'BROWSER_MAX_USES', '20', 'so lan dung toi da truoc khi tao lai Chromium', 1, '2025-11-25 03:35:00'),
+(13, 'CRAWLER_MODE', 'selenium', 'selenium | http (post form ASP.NET, khong can Chromium)', 1, '2025-11-25 03:35:00'),
+(14, 'CRAWL_OVERLAP_DAYS', '1', 'So ngay crawl lai truoc watermark (du lieu cap nhat tre)', 1, '2025-11-25 03:35:00'),
+(15, 'STAGING_RETENTION_DAYS', '30', 'So ngay giu partition stg_products (<= 0: giu tat ca)', 1, '2025-11-25 03:35:00'),
+(16, 'STAGING_LOAD_MODE', 'file', 'file (CSV + LOAD DATA) | direct (insert tu bo nho, bo qua CSV)', 1, '2025-11-25 03:35:00'),
+(17, 'STAGING_ARCHIVE_CSV', '0', 'Che do direct: 1 = van luu CSV lam ban luu tru', 1, '2025-11-25 03:35:00'),
+(18, 'DW_TRANSFER_MODE', 'sql', 'sql (INSERT ... SELECT cung server) | stream (cursor -> executemany, khac server) | file (OUTFILE + LOAD DATA, snapshot CSV)', 1, '2025-11-25 03:35:00'),
+(19, 'STG_FACT_RETENTION_DAYS', '0', 'So ngay giu partition fact_product_price o staging (0 = giu toan bo)', 1, '2025-11-25 03:35:00'),
+(20, 'DW_FACT_RETENTION_DAYS', '0', 'So ngay giu partition fact_product_price o DW (0 = giu toan bo)', 1, '2025-11-25 03:35:00');
 
 -- --------------------------------------------------------
 
@@ -61,6 +71,24 @@ CREATE TABLE `config_log` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `crawl_file_hash`
+--
+
+CREATE TABLE `crawl_file_hash` (
+  `id` bigint NOT NULL,
+  `window_start` date NOT NULL COMMENT 'Ngày bắt đầu cửa sổ crawl',
+  `window_end` date NOT NULL COMMENT 'Ngày kết thúc cửa sổ crawl (target_date)',
+  `content_hash` char(64) NOT NULL COMMENT 'SHA-256 của file CSV sau chuyển đổi',
+  `record_count` int DEFAULT NULL,
+  `file_name` varchar(255) DEFAULT NULL,
+  `status` varchar(20) NOT NULL COMMENT 'CS: dữ liệu mới, CU: trùng với lần crawl trước',
+  `load_status` varchar(20) DEFAULT NULL COMMENT 'LS khi nội dung này đã được load_to_staging nạp thành công',
+  `created_at` datetime DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `load_history`
 --
@@ -100,7 +128,8 @@ INSERT INTO `process_config` (`id`, `process_name`, `source_table`, `target_tabl
 (3, 'transform', NULL, NULL, NULL, 1, '2025-11-05 09:37:55'),
 (4, 'load_to_dw', NULL, NULL, NULL, 1, '2025-11-20 14:58:03'),
 (5, 'insert_aggre_data', NULL, NULL, NULL, 1, '2025-11-21 13:48:08'),
-(6, 'load_to_dm', NULL, NULL, NULL, 1, '2025-11-05 09:41:21');
+(6, 'load_to_dm', NULL, NULL, NULL, 1, '2025-11-05 09:41:21'),
+(7, 'backfill', NULL, NULL, NULL, 1, '2025-11-25 03:35:00');
 
 -- --------------------------------------------------------
 
@@ -121,6 +150,26 @@ CREATE TABLE `process_log` (
   `records_tranform` int DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `process_row_counts`
+--
+
+CREATE TABLE `process_row_counts` (
+  `id` bigint NOT NULL,
+  `process_config_id` int NOT NULL,
+  `process_name` varchar(100) NOT NULL,
+  `start_time` datetime NOT NULL COMMENT 'Khớp process_log.start_time của lần chạy',
+  `table_name` varchar(100) NOT NULL,
+  `rows_inserted` int NOT NULL DEFAULT '0',
+  `rows_updated` int NOT NULL DEFAULT '0',
+  `rows_deleted` int NOT NULL DEFAULT '0',
+  `rows_exported` int NOT NULL DEFAULT '0' COMMENT 'Số dòng ghi ra file (SELECT ... INTO OUTFILE)',
+  `rows_loaded` int NOT NULL DEFAULT '0' COMMENT 'Số dòng LOAD DATA',
+  `created_at` datetime DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
 --
 -- Indexes for dumped tables
 --
@@ -138,6 +187,13 @@ ALTER TABLE `config`
 ALTER TABLE `config_log`
   ADD PRIMARY KEY (`id`);
 
+--
+-- Indexes for table `crawl_file_hash`
+--
+ALTER TABLE `crawl_file_hash`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `idx_window` (`window_end`,`window_start`);
+
 --
 -- Indexes for table `process_config`
 --
@@ -152,6 +208,14 @@ ALTER TABLE `process_log`
   ADD PRIMARY KEY (`id`),
   ADD KEY `process_config_id` (`process_config_id`);
 
+--
+-- Indexes for table `process_row_counts`
+--
+ALTER TABLE `process_row_counts`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `idx_process_run` (`process_name`,`start_time`),
+  ADD KEY `process_config_id` (`process_config_id`);
+
 --
 -- AUTO_INCREMENT for dumped tables
 --
@@ -160,7 +224,7 @@ ALTER TABLE `process_log`
 -- AUTO_INCREMENT for table `config`
 --
 ALTER TABLE `config`
-  MODIFY `id` int NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=11;
+  MODIFY `id` int NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=21;
 
 --
 -- AUTO_INCREMENT for table `config_log`
@@ -168,6 +232,12 @@ ALTER TABLE `config`
 ALTER TABLE `config_log`
   MODIFY `id` int NOT NULL AUTO_INCREMENT;
 
+--
+-- AUTO_INCREMENT for table `crawl_file_hash`
+--
+ALTER TABLE `crawl_file_hash`
+  MODIFY `id` bigint NOT NULL AUTO_INCREMENT;
+
 --
 -- AUTO_INCREMENT for table `process_config`
 --
@@ -180,6 +250,12 @@ ALTER TABLE `process_config`
 ALTER TABLE `process_log`
   MODIFY `id` bigint NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=116;
 
+--
+-- AUTO_INCREMENT for table `process_row_counts`
+--
+ALTER TABLE `process_row_counts`
+  MODIFY `id` bigint NOT NULL AUTO_INCREMENT;
+
 --
 -- Constraints for dumped tables
 --
@@ -189,6 +265,12 @@ ALTER TABLE `process_log`
 --
 ALTER TABLE `process_log`
   ADD CONSTRAINT `process_log_ibfk_1` FOREIGN KEY (`process_config_id`) REFERENCES `process_config` (`id`);
+
+--
+-- Constraints for table `process_row_counts`
+--
+ALTER TABLE `process_row_counts`
+  ADD CONSTRAINT `process_row_counts_ibfk_1` FOREIGN KEY (`process_config_id`) REFERENCES `process_config` (`id`);
 COMMIT;
 
 
@@ -215,21 +297,19 @@ DELIMITER $$
 -- Procedures
 --
 CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_from_stg_by_date` (IN `p_load_date` DATE)   BEGIN
+    -- Số dòng ghi ra file: ROW_COUNT() ngay sau SELECT ... INTO OUTFILE
     DECLARE cnt_product INT DEFAULT 0;
     DECLARE cnt_province INT DEFAULT 0;
     DECLARE cnt_fact INT DEFAULT 0;
 
-    -- ============================================================
-    -- 1. EXPORT DIM_PRODUCT
-    -- ============================================================
-    -- Đếm xem có dữ liệu không
-    SELECT COUNT(*) INTO cnt_product
-    FROM dim_product d
-    JOIN fact_product_price f ON d.product_id = f.product_id
-    WHERE DATE(f.load_date) = p_load_date;
-
-    -- SỬA: Chỉ xuất file nếu có dữ liệu (>0), ngược lại thì bỏ qua (không báo lỗi)
-    IF cnt_product > 0 THEN
+    -- SỬA: Chỉ xuất file nếu có dữ liệu, ngược lại thì bỏ qua (không báo lỗi)
+    IF EXISTS (
+        SELECT 1 FROM fact_product_price f
+        WHERE f.load_date >= p_load_date AND f.load_date < p_load_date + INTERVAL 1 DAY
+    ) THEN
+        -- ============================================================
+        -- 1. EXPORT DIM_PRODUCT
+        -- ============================================================
         SET @sql_product = CONCAT(
             "SELECT DISTINCT d.product_id, d.product_name ",
             "INTO OUTFILE '/DW/load_to_dw_temp/export_product_", DATE_FORMAT(p_load_date, '%Y-%m-%d'), ".csv' ",
@@ -238,27 +318,18 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_from_stg_by_date` (IN `p_load_dat
             "LINES TERMINATED BY '\\n' ",
             "FROM dim_product d ",
             "JOIN fact_product_price f ON d.product_id = f.product_id ",
-            "WHERE DATE(f.load_date) = '", p_load_date, "'"
+            "WHERE f.load_date >= '", p_load_date, "' AND f.load_date < '", p_load_date + INTERVAL 1 DAY, "'"
         );
         PREPARE stmt FROM @sql_product;
         EXECUTE stmt;
+        SET cnt_product = ROW_COUNT();
         DEALLOCATE PREPARE stmt;
         
         SELECT CONCAT('Exported Product: ', cnt_product, ' rows') as status;
-    ELSE
-        SELECT 'No Product data to export' as status;
-    END IF;
 
-    -- ============================================================
-    -- 2. EXPORT DIM_PROVINCE
-    -- ============================================================
-    SELECT COUNT(*) INTO cnt_province
-    FROM dim_province p
-    JOIN fact_product_price f ON p.province_id = f.province_id
-    WHERE DATE(f.load_date) = p_load_date;
-
-    -- SỬA: Tương tự, chỉ xuất nếu > 0
-    IF cnt_province > 0 THEN
+        -- ============================================================
+        -- 2. EXPORT DIM_PROVINCE
+        -- ============================================================
         SET @sql_province = CONCAT(
             "SELECT DISTINCT p.province_id, p.province_name ",
             "INTO OUTFILE '/DW/load_to_dw_temp/export_province_", DATE_FORMAT(p_load_date, '%Y-%m-%d'), ".csv' ",
@@ -267,25 +338,18 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_from_stg_by_date` (IN `p_load_dat
             "LINES TERMINATED BY '\\n' ",
             "FROM dim_province p ",
             "JOIN fact_product_price f ON p.province_id = f.province_id ",
-            "WHERE DATE(f.load_date) = '", p_load_date, "'"
+            "WHERE f.load_date >= '", p_load_date, "' AND f.load_date < '", p_load_date + INTERVAL 1 DAY, "'"
         );
         PREPARE stmt FROM @sql_province;
         EXECUTE stmt;
+        SET cnt_province = ROW_COUNT();
         DEALLOCATE PREPARE stmt;
         
         SELECT CONCAT('Exported Province: ', cnt_province, ' rows') as status;
-    ELSE
-        SELECT 'No Province data to export' as status;
-    END IF;
-
-    -- ============================================================
-    -- 3. EXPORT FACT_PRODUCT_PRICE
-    -- ============================================================
-    SELECT COUNT(*) INTO cnt_fact
-    FROM fact_product_price
-    WHERE DATE(load_date) = p_load_date;
 
-    IF cnt_fact > 0 THEN
+        -- ============================================================
+        -- 3. EXPORT FACT_PRODUCT_PRICE
+        -- ============================================================
         SET @sql_fact = CONCAT(
             'SELECT f.fact_id, f.product_id, f.province_id, f.date_id, f.price, f.date_create, f.expire_date, f.is_delete, f.load_date ',
             'INTO OUTFILE ''/DW/load_to_dw_temp/export_fact_', DATE_FORMAT(p_load_date, '%Y-%m-%d'), '.csv'' ',
@@ -293,11 +357,12 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_from_stg_by_date` (IN `p_load_dat
             'ENCLOSED BY ''"'' ',
             'LINES TERMINATED BY ''\\n'' ',
             'FROM fact_product_price f ',
-            'WHERE DATE(f.load_date) = ''', p_load_date, ''''
+            'WHERE f.load_date >= ''', p_load_date, ''' AND f.load_date < ''', p_load_date + INTERVAL 1 DAY, ''''
         );
         
         PREPARE stmt FROM @sql_fact;
         EXECUTE stmt;
+        SET cnt_fact = ROW_COUNT();
         DEALLOCATE PREPARE stmt;
         
         SELECT CONCAT('Exported Fact: ', cnt_fact, ' rows') as status;
@@ -305,6 +370,11 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_from_stg_by_date` (IN `p_load_dat
         SELECT 'WARNING: No Fact data found for this date' as status;
     END IF;
 
+    -- Số dòng (tbl, op, cnt) cho script Python, không COUNT(*) lại
+    SELECT 'dim_product' AS tbl, 'exported' AS op, cnt_product AS cnt
+    UNION ALL SELECT 'dim_province', 'exported', cnt_province
+    UNION ALL SELECT 'fact_product_price', 'exported', cnt_fact;
+
 END$$
 
 CREATE DEFINER=`root`@`%` PROCEDURE `sp_load_agri_product_price_daily` ()   BEGIN
@@ -344,12 +414,18 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_load_agri_product_price_daily` ()   BEGI
 
     -- 4. LOAD DIMENSIONS (Chỉ thêm mới, không xóa cũ)
     -- Thêm sản phẩm mới chưa có trong kho
-    INSERT IGNORE INTO dim_product (product_name)
-    SELECT DISTINCT name FROM stg_products_transformed;
+    INSERT INTO dim_product (product_name)
+    SELECT DISTINCT t.name
+    FROM stg_products_transformed t
+    LEFT JOIN dim_product dp ON dp.product_name = t.name
+    WHERE t.name IS NOT NULL AND dp.product_id IS NULL;
 
     -- Thêm tỉnh mới chưa có trong kho
-    INSERT IGNORE INTO dim_province (province_name)
-    SELECT DISTINCT province FROM stg_products_transformed;
+    INSERT INTO dim_province (province_name)
+    SELECT DISTINCT t.province
+    FROM stg_products_transformed t
+    LEFT JOIN dim_province dv ON dv.province_name = t.province
+    WHERE t.province IS NOT NULL AND dv.province_id IS NULL;
 
     -- 5. CHUẨN BỊ DỮ LIỆU ĐỂ LOAD FACT (Map ID)
     -- Đưa vào bảng standardized để dễ xử lý logic SCD
@@ -410,12 +486,31 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_load_fact_daily` (IN `p_load_date` DATE)
     DECLARE v_current_load_date DATE;
     SET v_current_load_date = IFNULL(p_load_date, CURDATE());
 
+    -- 0. Resolve surrogate key 1 lần (dòng mới của ngày + dòng bị đóng hôm trước)
+    DROP TEMPORARY TABLE IF EXISTS tmp_scd_keys;
+    CREATE TEMPORARY TABLE tmp_scd_keys (
+        std_id INT NOT NULL PRIMARY KEY,
+        product_id INT NOT NULL,
+        province_id INT NOT NULL,
+        KEY idx_keys (product_id, province_id)
+    );
+
+    INSERT INTO tmp_scd_keys (std_id, product_id, province_id)
+    SELECT s.id, dp.product_id, dv.province_id
+    FROM stg_products_standardized s
+    JOIN dim_product dp ON dp.product_name = s.name
+    JOIN dim_province dv ON dv.province_name = s.province
+    WHERE s.date_create = v_current_load_date
+       OR (s.is_delete = 1 AND s.expire_date = DATE_SUB(v_current_load_date, INTERVAL 1 DAY));
+
     -- 1. SCD trên Fact: Đóng các bản ghi cũ (Expire)
     UPDATE fact_product_price f
-    JOIN stg_products_standardized s 
-        ON f.product_id = (SELECT product_id FROM dim_product WHERE product_name = s.name)
-       AND f.province_id = (SELECT province_id FROM dim_province WHERE province_name = s.province)
-       AND f.date_create = s.date_create 
+    JOIN tmp_scd_keys k
+        ON f.product_id = k.product_id
+       AND f.province_id = k.province_id
+    JOIN stg_products_standardized s
+        ON s.id = k.std_id
+       AND f.date_create = DATE(s.date_create)
     SET f.expire_date = s.expire_date,
         f.is_delete = s.is_delete
     WHERE s.is_delete = 1;
@@ -425,118 +520,109 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_load_fact_daily` (IN `p_load_date` DATE)
         product_id, province_id, date_id, price, date_create, expire_date, is_delete
     )
     SELECT 
-        dp.product_id,
-        dv.province_id,
+        k.product_id,
+        k.province_id,
         s.date_id,
         s.price,
         s.date_create,
         s.expire_date,
         s.is_delete
     FROM stg_products_standardized s
-    JOIN dim_product dp ON s.name = dp.product_name
-    JOIN dim_province dv ON s.province = dv.province_name
+    JOIN tmp_scd_keys k ON k.std_id = s.id
     WHERE s.date_create = v_current_load_date
       AND NOT EXISTS (
           SELECT 1 FROM fact_product_price f
-          WHERE f.product_id = dp.product_id
-            AND f.province_id = dv.province_id
-            AND f.date_create = s.date_create
+          WHERE f.product_id = k.product_id
+            AND f.province_id = k.province_id
+            AND f.date_create = v_current_load_date
       );
 
     SELECT ROW_COUNT() AS Records_Loaded;
+    DROP TEMPORARY TABLE IF EXISTS tmp_scd_keys;
 END$$
 
 CREATE DEFINER=`root`@`%` PROCEDURE `sp_load_mart_daily` (IN `p_load_date` DATE)   BEGIN
-    -- Logic: Xóa dữ liệu cũ -> Nạp dữ liệu mới vào Mart
-    -- Giả sử bảng Mart là: mart_weekly_price_trend, mart_product_summary...
-    
+    -- Logic: build bản mới vào <mart>_new (LIKE -> giữ index) -> 1 câu RENAME TABLE publish cả nhóm.
+    -- Bản trước giữ ở <mart>_old để rollback (scripts/table_publish.py --db STAGING --rollback).
+    DECLARE cnt_weekly INT DEFAULT 0;
+    DECLARE cnt_product INT DEFAULT 0;
+    DECLARE cnt_province INT DEFAULT 0;
+
+    -- Lần chạy đầu: tạo bảng mart theo cấu trúc rpt nếu chưa có
+    CREATE TABLE IF NOT EXISTS mart_weekly_price_trend LIKE rpt_weekly_price_trend;
+    CREATE TABLE IF NOT EXISTS mart_product_price_summary LIKE rpt_product_price_summary;
+    CREATE TABLE IF NOT EXISTS mart_province_price_summary LIKE rpt_province_price_summary;
+
     -- 1. MART: Xu hướng giá tuần
-    DROP TABLE IF EXISTS mart_weekly_price_trend;
-    CREATE TABLE mart_weekly_price_trend AS
+    DROP TABLE IF EXISTS mart_weekly_price_trend_new;
+    CREATE TABLE mart_weekly_price_trend_new LIKE mart_weekly_price_trend;
+    INSERT INTO mart_weekly_price_trend_new
     SELECT * FROM rpt_weekly_price_trend; -- Lấy từ bảng rpt đã tạo ở bước trước
+    SET cnt_weekly = ROW_COUNT();
 
     -- 2. MART: Tổng hợp theo sản phẩm
-    DROP TABLE IF EXISTS mart_product_price_summary;
-    CREATE TABLE mart_product_price_summary AS
+    DROP TABLE IF EXISTS mart_product_price_summary_new;
+    CREATE TABLE mart_product_price_summary_new LIKE mart_product_price_summary;
+    INSERT INTO mart_product_price_summary_new
     SELECT * FROM rpt_product_price_summary;
+    SET cnt_product = ROW_COUNT();
 
     -- 3. MART: Tổng hợp theo tỉnh
-    DROP TABLE IF EXISTS mart_province_price_summary;
-    CREATE TABLE mart_province_price_summary AS
+    DROP TABLE IF EXISTS mart_province_price_summary_new;
+    CREATE TABLE mart_province_price_summary_new LIKE mart_province_price_summary;
+    INSERT INTO mart_province_price_summary_new
     SELECT * FROM rpt_province_price_summary;
-
-    -- Trả về kết quả
-    SELECT 1 AS Records_Loaded; 
-END$$
-
-CREATE DEFINER=`root`@`%` PROCEDURE `sp_load_weekly_product_price` (IN `p_load_date` DATE, IN `p_is_cleanup` TINYINT)   BEGIN
-    -- 1. Xóa dữ liệu nếu p_is_cleanup = 1
-    IF p_is_cleanup = 1 THEN
-        DELETE FROM agg_product_price_weekly
-		WHERE DATE(load_date) = p_load_date; 
-
-    END IF;
-
-    -- 2. Insert dữ liệu aggregation
-    INSERT INTO agg_product_price_weekly (
-        year,
-        week_of_year,
-        product_id,
-        province_id,
-        avg_price,
-        min_price,
-        max_price,
-        record_count,
-        created_at,
-        load_date
-    )
-    SELECT
-        d.year,
-        d.week_of_year_monday AS week_of_year,
-        f.product_id,
-        f.province_id,
-        AVG(f.price) AS avg_price,
-        MIN(f.price) AS min_price,
-        MAX(f.price) AS max_price,
-        COUNT(*) AS record_count,
-        NOW() AS created_at,
-        MIN(DATE(f.load_date)) AS load_date
-
-    FROM fact_product_price f
-    JOIN dim_date d ON f.date_id = d.date_id
-    WHERE f.is_delete = 0
-      AND DATE(f.load_date) = p_load_date
-    GROUP BY
-        d.year,
-        d.week_of_year_monday,
-        f.product_id,
-        f.province_id;
-
-    -- 3. Refresh report tables
-    DROP TABLE IF EXISTS rpt_weekly_price_trend;
-    CREATE TABLE rpt_weekly_price_trend AS
-    SELECT * FROM vw_weekly_price_chart;
-
-    DROP TABLE IF EXISTS rpt_product_price_summary;
-    CREATE TABLE rpt_product_price_summary AS
-    SELECT * FROM vw_product_price_summary;
-
-    DROP TABLE IF EXISTS rpt_province_price_summary;
-    CREATE TABLE rpt_province_price_summary AS
-    SELECT * FROM vw_province_price_summary;
-
+    SET cnt_province = ROW_COUNT();
+
+    -- 4. Publish: đổi cả 3 bảng trong 1 câu RENAME TABLE (atomic).
+    --    Bản _old hiện có dời sang _drop trong cùng câu RENAME, chỉ DROP sau khi RENAME thành công.
+    DROP TABLE IF EXISTS mart_weekly_price_trend_drop, mart_product_price_summary_drop, mart_province_price_summary_drop;
+    SET @publish_sql = CONCAT(
+        'RENAME TABLE ',
+        IF(EXISTS(SELECT 1 FROM information_schema.TABLES
+                  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'mart_weekly_price_trend_old'),
+           'mart_weekly_price_trend_old TO mart_weekly_price_trend_drop, ', ''),
+        'mart_weekly_price_trend TO mart_weekly_price_trend_old, ',
+        'mart_weekly_price_trend_new TO mart_weekly_price_trend, ',
+        IF(EXISTS(SELECT 1 FROM information_schema.TABLES
+                  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'mart_product_price_summary_old'),
+           'mart_product_price_summary_old TO mart_product_price_summary_drop, ', ''),
+        'mart_product_price_summary TO mart_product_price_summary_old, ',
+        'mart_product_price_summary_new TO mart_product_price_summary, ',
+        IF(EXISTS(SELECT 1 FROM information_schema.TABLES
+                  WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'mart_province_price_summary_old'),
+           'mart_province_price_summary_old TO mart_province_price_summary_drop, ', ''),
+        'mart_province_price_summary TO mart_province_price_summary_old, ',
+        'mart_province_price_summary_new TO mart_province_price_summary'
+    );
+    PREPARE stmt FROM @publish_sql;
+    EXECUTE stmt;
+    DEALLOCATE PREPARE stmt;
+    DROP TABLE IF EXISTS mart_weekly_price_trend_drop, mart_product_price_summary_drop, mart_province_price_summary_drop;
+
+    -- Số dòng (tbl, op, cnt) cho script Python
+    SELECT 'mart_weekly_price_trend' AS tbl, 'loaded' AS op, cnt_weekly AS cnt
+    UNION ALL SELECT 'mart_product_price_summary', 'loaded', cnt_product
+    UNION ALL SELECT 'mart_province_price_summary', 'loaded', cnt_province;
 END$$
 
 CREATE DEFINER=`root`@`%` PROCEDURE `sp_transform_products` (IN `p_load_date` DATE)   BEGIN
     -- 1. KHAI BÁO BIẾN
     DECLARE v_current_load_date DATE;
-    DECLARE v_max_stg_load_date DATE;
+    -- Số dòng thực tế của từng câu lệnh (ROW_COUNT()), trả về ở bước 6
+    DECLARE v_transformed INT DEFAULT 0;
+    DECLARE v_dim_product INT DEFAULT 0;
+    DECLARE v_dim_province INT DEFAULT 0;
+    DECLARE v_std_closed INT DEFAULT 0;
+    DECLARE v_std_inserted INT DEFAULT 0;
+    DECLARE v_fact_closed INT DEFAULT 0;
+    DECLARE v_fact_inserted INT DEFAULT 0;
+    DECLARE v_no_date INT DEFAULT 0;
 
     SET v_current_load_date = IFNULL(p_load_date, CURDATE());
-    SET v_max_stg_load_date = (SELECT MAX(load_date) FROM stg_products);
-
-    IF v_max_stg_load_date IS NULL THEN
-        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'LỖI: Bảng stg_products đang trống!';
+    -- Chỉ kiểm tra tồn tại trong partition của ngày cần transform (không quét MAX toàn bảng)
+    IF NOT EXISTS (SELECT 1 FROM stg_products WHERE load_date = v_current_load_date) THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'LỖI: stg_products không có dữ liệu cho ngày cần transform!';
     END IF;
 
     SELECT CONCAT('Bắt đầu Transform ngày: ', v_current_load_date) AS Status;
@@ -552,173 +638,235 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_transform_products` (IN `p_load_date` DA
     -- ==================================
     -- 1. LOAD & CHUẨN HÓA DỮ LIỆU (KÈM FIX LỖI NGÀY THÁNG)
     -- ==================================
-    INSERT INTO stg_products_transformed (name, province, price, date, load_date)
+    INSERT INTO stg_products_transformed (name, province, price, date, load_date, product_id, province_id)
     SELECT
-        TRIM(name),
-        -- 1.1 Logic Gộp Tỉnh (Giữ nguyên của bạn)
-        CASE TRIM(province)
-            WHEN 'Hà Giang' THEN 'Tuyên Quang'
-            WHEN 'Tuyên Quang' THEN 'Tuyên Quang'
-            WHEN 'Lào Cai' THEN 'Lào Cai'
-            WHEN 'Yên Bái' THEN 'Lào Cai'
-            WHEN 'Bắc Kạn' THEN 'Thái Nguyên'
-            WHEN 'Thái Nguyên' THEN 'Thái Nguyên'
-            WHEN 'Vĩnh Phúc' THEN 'Phú Thọ'
-            WHEN 'Hòa Bình' THEN 'Phú Thọ'
-            WHEN 'Phú Thọ' THEN 'Phú Thọ'
-            WHEN 'Bắc Ninh' THEN 'Bắc Ninh'
-            WHEN 'Bắc Giang' THEN 'Bắc Ninh'
-            WHEN 'Hưng Yên' THEN 'Hưng Yên'
-            WHEN 'Thái Bình' THEN 'Hưng Yên'
-            WHEN 'Hải Dương' THEN 'Hải Phòng'
-            WHEN 'Hải Phòng' THEN 'Hải Phòng'
-            WHEN 'Hà Nam' THEN 'Ninh Bình'
-            WHEN 'Nam Định' THEN 'Ninh Bình'
-            WHEN 'Ninh Bình' THEN 'Ninh Bình'
-            WHEN 'Quảng Bình' THEN 'Quảng Trị'
-            WHEN 'Quảng Trị' THEN 'Quảng Trị'
-            WHEN 'Quảng Nam' THEN 'Đà Nẵng'
-            WHEN 'Đà Nẵng' THEN 'Đà Nẵng'
-            WHEN 'Kon Tum' THEN 'Quảng Ngãi'
-            WHEN 'Quảng Ngãi' THEN 'Quảng Ngãi'
-            WHEN 'Gia Lai' THEN 'Gia Lai'
-            WHEN 'Bình Định' THEN 'Gia Lai'
-            WHEN 'Khánh Hòa' THEN 'Khánh Hòa'
-            WHEN 'Ninh Thuận' THEN 'Khánh Hòa'
-            WHEN 'Lâm Đồng' THEN 'Lâm Đồng'
-            WHEN 'Đắk Nông' THEN 'Lâm Đồng'
-            WHEN 'Bình Thuận' THEN 'Lâm Đồng'
-            WHEN 'Đắk Lắk' THEN 'Đắk Lắk'
-            WHEN 'Phú Yên' THEN 'Đắk Lắk'
-            WHEN 'Hồ Chí Minh City' THEN 'Hồ Chí Minh City'
-            WHEN 'Bình Dương' THEN 'Hồ Chí Minh City'
-            WHEN 'Bà Rịa – Vũng Tàu' THEN 'Hồ Chí Minh City'
-            WHEN 'Đồng Nai' THEN 'Đồng Nai'
-            WHEN 'Bình Phước' THEN 'Đồng Nai'
-            WHEN 'Tây Ninh' THEN 'Tây Ninh'
-            WHEN 'Long An' THEN 'Tây Ninh'
-            WHEN 'Cần Thơ' THEN 'Cần Thơ'
-            WHEN 'Sóc Trăng' THEN 'Cần Thơ'
-            WHEN 'Hậu Giang' THEN 'Cần Thơ'
-            WHEN 'Vĩnh Long' THEN 'Vĩnh Long'
-            WHEN 'Bến Tre' THEN 'Vĩnh Long'
-            WHEN 'Trà Vinh' THEN 'Vĩnh Long'
-            WHEN 'Đồng Tháp' THEN 'Đồng Tháp'
-            WHEN 'Tiền Giang' THEN 'Đồng Tháp'
-            WHEN 'Cà Mau' THEN 'Cà Mau'
-            WHEN 'Bạc Liêu' THEN 'Cà Mau'
-            WHEN 'An Giang' THEN 'An Giang'
-            WHEN 'Kiên Giang' THEN 'An Giang'
-            ELSE TRIM(province)
-        END,
-        CAST(REPLACE(TRIM(price), ',', '') AS DECIMAL(10,2)),
-        
-        -- 1.2 FIX LỖI NGÀY THÁNG (Logic COALESCE "Bất tử")
-        COALESCE(
-            IF(`date` REGEXP '^[0-9]{4}-[0-9]{2}-[0-9]{2}', CAST(`date` AS DATE), NULL),
-            STR_TO_DATE(TRIM(`date`), '%m/%d/%Y %h:%i:%s %p'), -- Mỹ (10/31)
-            STR_TO_DATE(TRIM(`date`), '%d/%m/%Y %h:%i:%s %p'), -- VN có giờ
-            STR_TO_DATE(TRIM(`date`), '%d/%m/%Y')              -- VN ngắn
-        ) AS date,
+        TRIM(s.name),
+        -- 1.1 Gộp tỉnh theo bảng province_alias (hiệu lực theo ngày dữ liệu)
+        COALESCE(s.province_std, pa.province_name, TRIM(s.province)),
+        -- 1.2 price/date đã được chuẩn hóa lúc load (dòng lỗi nằm ở stg_products_rejected)
+        s.price_num,
+        s.date_value AS date,
         
-        load_date
-    FROM stg_products
-    WHERE DATE(load_date) = v_current_load_date;
+        s.load_date,
+        -- 1.3 Key đã resolve lúc direct-load (dim_keys), file-load để NULL
+        s.product_id,
+        s.province_id
+    FROM stg_products s
+    LEFT JOIN province_alias pa
+        ON pa.alias = TRIM(s.province)
+       AND (pa.valid_from IS NULL OR pa.valid_from <= s.date_value)
+       AND (pa.valid_to IS NULL OR pa.valid_to > s.date_value)
+       AND s.province_std IS NULL
+    WHERE s.load_date = v_current_load_date
+    -- Giữ thứ tự nạp: cùng ngày dữ liệu thì dòng nạp sau (id lớn hơn) là mới nhất
+    ORDER BY s.id;
+    SET v_transformed = ROW_COUNT();
 
     -- ================================================
     -- 2. CẬP NHẬT DIMENSIONS
     -- ================================================
-    INSERT IGNORE INTO dim_product (product_name)
-    SELECT DISTINCT name FROM stg_products_transformed;
+    -- Chỉ thêm thành viên thật sự mới (anti-join): INSERT IGNORE đốt 1 giá trị
+    -- AUTO_INCREMENT cho mỗi tên đã tồn tại ở mỗi lần chạy
+    INSERT INTO dim_product (product_name)
+    SELECT DISTINCT t.name
+    FROM stg_products_transformed t
+    LEFT JOIN dim_product dp ON dp.product_name = t.name
+    WHERE t.product_id IS NULL
+      AND t.name IS NOT NULL
+      AND dp.product_id IS NULL;
+    SET v_dim_product = ROW_COUNT();
+
+    INSERT INTO dim_province (province_name)
+    SELECT DISTINCT t.province
+    FROM stg_products_transformed t
+    LEFT JOIN dim_province dv ON dv.province_name = t.province
+    WHERE t.province_id IS NULL
+      AND t.province IS NOT NULL
+      AND dv.province_id IS NULL;
+    SET v_dim_province = ROW_COUNT();
+
+    -- 2.1 Resolve surrogate key 1 lần cho transformed (dòng chưa có key),
+    --     các bước sau chỉ join theo product_id/province_id
+    UPDATE stg_products_transformed t
+    JOIN dim_product dp ON dp.product_name = t.name
+    SET t.product_id = dp.product_id
+    WHERE t.product_id IS NULL;
+
+    UPDATE stg_products_transformed t
+    JOIN dim_province dv ON dv.province_name = t.province
+    SET t.province_id = dv.province_id
+    WHERE t.province_id IS NULL;
+
+    -- Hash thuộc tính theo dõi (price)
+    UPDATE stg_products_transformed t
+    SET t.row_hash = UNHEX(MD5(CONCAT_WS('|', t.price)));
+
+    -- 2.2 Dòng active cũ (trước khi có cột key/hash): bổ sung 1 lần, lần sau không còn dòng nào
+    UPDATE stg_products_standardized s
+    JOIN dim_product dp ON dp.product_name = s.name
+    JOIN dim_province dv ON dv.province_name = s.province
+    SET s.product_id = dp.product_id,
+        s.province_id = dv.province_id,
+        s.row_hash = UNHEX(MD5(CONCAT_WS('|', s.price)))
+    WHERE s.product_id IS NULL
+      AND s.is_active = 1;
+
+    -- 2.3 Mỗi (product_id, province_id) chỉ lấy dòng mới nhất theo ngày dữ liệu trong cửa sổ crawl:
+    --     giá đã bị thay ngay trong cửa sổ không được thành phiên bản active.
+    --     Dòng có ngày không nằm trong dim_date bị bỏ qua (engine pandas bỏ qua giống hệt)
+    SELECT COUNT(*) INTO v_no_date
+    FROM stg_products_transformed t
+    LEFT JOIN dim_date d ON d.full_date = DATE(t.date)
+    WHERE t.product_id IS NOT NULL
+      AND t.province_id IS NOT NULL
+      AND d.date_id IS NULL;
+    IF v_no_date > 0 THEN
+        SELECT CONCAT('Bỏ qua ', v_no_date, ' dòng có ngày không nằm trong dim_date') AS Status;
+    END IF;
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_latest_price;
+    CREATE TEMPORARY TABLE tmp_latest_price (
+        product_id INT NOT NULL,
+        province_id INT NOT NULL,
+        name VARCHAR(255),
+        province VARCHAR(255),
+        price DECIMAL(10,2),
+        row_hash BINARY(16),
+        date_id INT NOT NULL,
+        PRIMARY KEY (product_id, province_id)
+    );
 
-    INSERT IGNORE INTO dim_province (province_name)
-    SELECT DISTINCT province FROM stg_products_transformed;
+    INSERT INTO tmp_latest_price (product_id, province_id, name, province, price, row_hash, date_id)
+    SELECT x.product_id, x.province_id, x.name, x.province, x.price, x.row_hash, x.date_id
+    FROM (
+        SELECT
+            t.product_id, t.province_id, t.name, t.province, t.price, t.row_hash, d.date_id,
+            ROW_NUMBER() OVER (
+                PARTITION BY t.product_id, t.province_id
+                ORDER BY t.date DESC, t.id DESC
+            ) AS rn
+        FROM stg_products_transformed t
+        JOIN dim_date d ON d.full_date = DATE(t.date)
+        WHERE t.product_id IS NOT NULL
+          AND t.province_id IS NOT NULL
+    ) x
+    WHERE x.rn = 1;
 
     -- ================================================
     -- 3. SCD TYPE 2: ĐÓNG BẢN GHI CŨ TRONG STANDARDIZED
     -- ================================================
+    -- So hash với dòng mới nhất qua index (product_id, province_id, is_active, row_hash)
     UPDATE stg_products_standardized s
-    INNER JOIN stg_products_transformed t
-        ON s.name = t.name
-       AND s.province = t.province
-       AND s.expire_date = '9999-12-31'
+    INNER JOIN tmp_latest_price t
+        ON s.product_id = t.product_id
+       AND s.province_id = t.province_id
+       AND s.is_active = 1
     SET s.expire_date = DATE_SUB(v_current_load_date, INTERVAL 1 DAY),
         s.is_delete = 1
-    WHERE (t.price != s.price OR s.price IS NULL);
+    WHERE s.row_hash <> t.row_hash
+       OR s.row_hash IS NULL;
+    SET v_std_closed = ROW_COUNT();
 
     -- ================================================
     -- 4. INSERT BẢN GHI MỚI VÀO STANDARDIZED
     -- ================================================
+    -- 1 phiên bản mỗi key (dòng mới nhất), chỉ khi hash khác phiên bản active:
+    -- key không đổi giá bị bỏ qua hoàn toàn
     INSERT INTO stg_products_standardized (
-        name, province, price, date_id, is_delete, date_create, expire_date
+        name, province, product_id, province_id, price, row_hash,
+        date_id, is_delete, date_create, expire_date
     )
     SELECT
         t.name,
         t.province,
+        t.product_id,
+        t.province_id,
         t.price,
-        d.date_id,
+        t.row_hash,
+        t.date_id,
         0,
         v_current_load_date,
         '9999-12-31'
-    FROM stg_products_transformed t
-    LEFT JOIN dim_date d ON d.full_date = DATE(t.date)
+    FROM tmp_latest_price t
     WHERE NOT EXISTS (
         SELECT 1 FROM stg_products_standardized s
-        WHERE s.name = t.name
-          AND s.province = t.province
-          AND s.expire_date = '9999-12-31'
-          AND s.date_create = v_current_load_date
+        WHERE s.product_id = t.product_id
+          AND s.province_id = t.province_id
+          AND s.is_active = 1
+          AND s.row_hash = t.row_hash
     );
+    SET v_std_inserted = ROW_COUNT();
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_latest_price;
 
     -- ================================================
     -- 5. LOAD VÀO FACT TABLE (SCD)
     -- ================================================
-    -- 5.1 Đóng dòng cũ
+    -- 5.0 Resolve surrogate key 1 lần cho các dòng standardized của lần chạy này
+    --     (dòng mới hôm nay + dòng vừa bị đóng ở bước 3), không dùng subquery theo từng dòng
+    DROP TEMPORARY TABLE IF EXISTS tmp_scd_keys;
+    CREATE TEMPORARY TABLE tmp_scd_keys (
+        std_id INT NOT NULL PRIMARY KEY,
+        product_id INT NOT NULL,
+        province_id INT NOT NULL,
+        KEY idx_keys (product_id, province_id)
+    );
+
+    INSERT INTO tmp_scd_keys (std_id, product_id, province_id)
+    SELECT s.id, s.product_id, s.province_id
+    FROM stg_products_standardized s
+    WHERE s.date_create = v_current_load_date
+       OR (s.is_delete = 1 AND s.expire_date = DATE_SUB(v_current_load_date, INTERVAL 1 DAY));
+
+    -- 5.1 Đóng dòng cũ (join theo index (product_id, province_id, date_create))
     UPDATE fact_product_price f
-    JOIN stg_products_standardized s 
-        ON f.product_id = (SELECT product_id FROM dim_product WHERE product_name = s.name)
-       AND f.province_id = (SELECT province_id FROM dim_province WHERE province_name = s.province)
-       AND f.date_create = s.date_create
+    JOIN tmp_scd_keys k
+        ON f.product_id = k.product_id
+       AND f.province_id = k.province_id
+    JOIN stg_products_standardized s
+        ON s.id = k.std_id
+       AND f.date_create = DATE(s.date_create)
     SET f.expire_date = s.expire_date,
         f.is_delete = s.is_delete
     WHERE s.is_delete = 1;
+    SET v_fact_closed = ROW_COUNT();
 
-    -- 5.2 Insert dòng mới
+    -- 5.2 Insert dòng mới (load_date = ngày dữ liệu để backfill lọc đúng ngày)
     INSERT INTO fact_product_price (
-        product_id, province_id, date_id, price, date_create, expire_date, is_delete
+        product_id, province_id, date_id, price, date_create, expire_date, is_delete, load_date
     )
     SELECT 
-        dp.product_id,
-        dv.province_id,
+        k.product_id,
+        k.province_id,
         s.date_id,
         s.price,
         s.date_create,
         s.expire_date,
-        s.is_delete
+        s.is_delete,
+        v_current_load_date
     FROM stg_products_standardized s
-    JOIN dim_product dp ON s.name = dp.product_name
-    JOIN dim_province dv ON s.province = dv.province_name
+    JOIN tmp_scd_keys k ON k.std_id = s.id
     WHERE s.date_create = v_current_load_date
       AND NOT EXISTS (
           SELECT 1 FROM fact_product_price f
-          WHERE f.product_id = dp.product_id
-            AND f.province_id = dv.province_id
-            AND f.date_create = s.date_create
+          WHERE f.product_id = k.product_id
+            AND f.province_id = k.province_id
+            AND f.date_create = v_current_load_date
       );
+    SET v_fact_inserted = ROW_COUNT();
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_scd_keys;
 
     -- ================================================
-    -- 6. KẾT QUẢ (ĐÚNG FORMAT BẠN YÊU CẦU)
+    -- 6. KẾT QUẢ: số dòng (tbl, op, cnt) của chính các câu lệnh, không COUNT(*) lại
     -- ================================================
-    SELECT 
-        'transformed' AS tbl, COUNT(*) AS cnt FROM stg_products_transformed
-    UNION ALL
-    SELECT 'standardized', COUNT(*) FROM stg_products_standardized WHERE date_create = v_current_load_date
-    UNION ALL
-    SELECT 'dim_product', COUNT(*) FROM dim_product
-    UNION ALL
-    SELECT 'dim_province', COUNT(*) FROM dim_province
-    UNION ALL
-    SELECT 'fact', COUNT(*) FROM fact_product_price;
+    SELECT 'stg_products_transformed' AS tbl, 'inserted' AS op, v_transformed AS cnt
+    UNION ALL SELECT 'dim_product', 'inserted', v_dim_product
+    UNION ALL SELECT 'dim_province', 'inserted', v_dim_province
+    UNION ALL SELECT 'stg_products_standardized', 'updated', v_std_closed
+    UNION ALL SELECT 'stg_products_standardized', 'inserted', v_std_inserted
+    UNION ALL SELECT 'fact_product_price', 'updated', v_fact_closed
+    UNION ALL SELECT 'fact_product_price', 'inserted', v_fact_inserted;
 
 END$$
 
@@ -811,15 +959,21 @@ CREATE DEFINER=`root`@`%` PROCEDURE `tranform_agri_product_price` ()   BEGIN
     -- ================================================
     -- 4. Dim Product & Province
     -- ================================================
-    INSERT IGNORE INTO dim_product (product_name)
-    SELECT DISTINCT name 
-    FROM stg_products_standardized 
-    WHERE date_create = v_current_load_date;
+    INSERT INTO dim_product (product_name)
+    SELECT DISTINCT s.name 
+    FROM stg_products_standardized s
+    LEFT JOIN dim_product dp ON dp.product_name = s.name
+    WHERE s.date_create = v_current_load_date
+      AND s.name IS NOT NULL
+      AND dp.product_id IS NULL;
 
-    INSERT IGNORE INTO dim_province (province_name)
-    SELECT DISTINCT province 
-    FROM stg_products_standardized 
-    WHERE date_create = v_current_load_date;
+    INSERT INTO dim_province (province_name)
+    SELECT DISTINCT s.province 
+    FROM stg_products_standardized s
+    LEFT JOIN dim_province dv ON dv.province_name = s.province
+    WHERE s.date_create = v_current_load_date
+      AND s.province IS NOT NULL
+      AND dv.province_id IS NULL;
 
     -- ================================================
     -- 5. Load Fact
@@ -945,7 +1099,7 @@ CREATE TABLE `fact_product_price` (
   `date_create` date DEFAULT NULL,
   `expire_date` date DEFAULT NULL,
   `is_delete` tinyint(1) DEFAULT '0',
-  `load_date` timestamp NULL DEFAULT CURRENT_TIMESTAMP
+  `load_date` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- --------------------------------------------------------
@@ -972,6 +1126,78 @@ CREATE TABLE `mart_weekly_price_trend` (
 
 -- --------------------------------------------------------
 
+--
+-- Table structure for table `province_alias`
+--
+
+CREATE TABLE `province_alias` (
+  `id` int NOT NULL,
+  `alias` varchar(100) NOT NULL COMMENT 'Tên tỉnh trong dữ liệu nguồn',
+  `province_name` varchar(100) NOT NULL COMMENT 'Tên tỉnh sau gộp',
+  `valid_from` date DEFAULT NULL COMMENT 'NULL: không giới hạn',
+  `valid_to` date DEFAULT NULL COMMENT 'Ngày hết hiệu lực (không bao gồm), NULL: không giới hạn'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+--
+-- Dumping data for table `province_alias`
+--
+
+INSERT INTO `province_alias` (`id`, `alias`, `province_name`, `valid_from`, `valid_to`) VALUES
+(1, 'Hà Giang', 'Tuyên Quang', NULL, NULL),
+(2, 'Tuyên Quang', 'Tuyên Quang', NULL, NULL),
+(3, 'Lào Cai', 'Lào Cai', NULL, NULL),
+(4, 'Yên Bái', 'Lào Cai', NULL, NULL),
+(5, 'Bắc Kạn', 'Thái Nguyên', NULL, NULL),
+(6, 'Thái Nguyên', 'Thái Nguyên', NULL, NULL),
+(7, 'Vĩnh Phúc', 'Phú Thọ', NULL, NULL),
+(8, 'Hòa Bình', 'Phú Thọ', NULL, NULL),
+(9, 'Phú Thọ', 'Phú Thọ', NULL, NULL),
+(10, 'Bắc Ninh', 'Bắc Ninh', NULL, NULL),
+(11, 'Bắc Giang', 'Bắc Ninh', NULL, NULL),
+(12, 'Hưng Yên', 'Hưng Yên', NULL, NULL),
+(13, 'Thái Bình', 'Hưng Yên', NULL, NULL),
+(14, 'Hải Dương', 'Hải Phòng', NULL, NULL),
+(15, 'Hải Phòng', 'Hải Phòng', NULL, NULL),
+(16, 'Hà Nam', 'Ninh Bình', NULL, NULL),
+(17, 'Nam Định', 'Ninh Bình', NULL, NULL),
+(18, 'Ninh Bình', 'Ninh Bình', NULL, NULL),
+(19, 'Quảng Bình', 'Quảng Trị', NULL, NULL),
+(20, 'Quảng Trị', 'Quảng Trị', NULL, NULL),
+(21, 'Quảng Nam', 'Đà Nẵng', NULL, NULL),
+(22, 'Đà Nẵng', 'Đà Nẵng', NULL, NULL),
+(23, 'Kon Tum', 'Quảng Ngãi', NULL, NULL),
+(24, 'Quảng Ngãi', 'Quảng Ngãi', NULL, NULL),
+(25, 'Gia Lai', 'Gia Lai', NULL, NULL),
+(26, 'Bình Định', 'Gia Lai', NULL, NULL),
+(27, 'Khánh Hòa', 'Khánh Hòa', NULL, NULL),
+(28, 'Ninh Thuận', 'Khánh Hòa', NULL, NULL),
+(29, 'Lâm Đồng', 'Lâm Đồng', NULL, NULL),
+(30, 'Đắk Nông', 'Lâm Đồng', NULL, NULL),
+(31, 'Bình Thuận', 'Lâm Đồng', NULL, NULL),
+(32, 'Đắk Lắk', 'Đắk Lắk', NULL, NULL),
+(33, 'Phú Yên', 'Đắk Lắk', NULL, NULL),
+(34, 'Hồ Chí Minh City', 'Hồ Chí Minh City', NULL, NULL),
+(35, 'Bình Dương', 'Hồ Chí Minh City', NULL, NULL),
+(36, 'Bà Rịa – Vũng Tàu', 'Hồ Chí Minh City', NULL, NULL),
+(37, 'Đồng Nai', 'Đồng Nai', NULL, NULL),
+(38, 'Bình Phước', 'Đồng Nai', NULL, NULL),
+(39, 'Tây Ninh', 'Tây Ninh', NULL, NULL),
+(40, 'Long An', 'Tây Ninh', NULL, NULL),
+(41, 'Cần Thơ', 'Cần Thơ', NULL, NULL),
+(42, 'Sóc Trăng', 'Cần Thơ', NULL, NULL),
+(43, 'Hậu Giang', 'Cần Thơ', NULL, NULL),
+(44, 'Vĩnh Long', 'Vĩnh Long', NULL, NULL),
+(45, 'Bến Tre', 'Vĩnh Long', NULL, NULL),
+(46, 'Trà Vinh', 'Vĩnh Long', NULL, NULL),
+(47, 'Đồng Tháp', 'Đồng Tháp', NULL, NULL),
+(48, 'Tiền Giang', 'Đồng Tháp', NULL, NULL),
+(49, 'Cà Mau', 'Cà Mau', NULL, NULL),
+(50, 'Bạc Liêu', 'Cà Mau', NULL, NULL),
+(51, 'An Giang', 'An Giang', NULL, NULL),
+(52, 'Kiên Giang', 'An Giang', NULL, NULL);
+
+-- --------------------------------------------------------
+
 --
 -- Table structure for table `stg_products`
 --
@@ -982,7 +1208,31 @@ CREATE TABLE `stg_products` (
   `province` varchar(100) DEFAULT NULL,
   `price` varchar(100) DEFAULT NULL,
   `date` varchar(100) NOT NULL,
-  `load_date` timestamp NULL DEFAULT CURRENT_TIMESTAMP
+  `load_date` date NOT NULL DEFAULT (curdate()) COMMENT 'Ngày dữ liệu = partition (p<YYYYMMDD>)',
+  `price_num` decimal(10,2) DEFAULT NULL COMMENT 'price đã chuẩn hóa lúc load',
+  `date_value` date DEFAULT NULL COMMENT 'date đã chuẩn hóa lúc load',
+  `province_std` varchar(100) DEFAULT NULL COMMENT 'Tỉnh đã gộp (direct-load), NULL -> join province_alias',
+  `product_id` int DEFAULT NULL COMMENT 'Key dim_product đã resolve (direct-load), NULL -> transform tự resolve',
+  `province_id` int DEFAULT NULL COMMENT 'Key dim_province đã resolve (direct-load), NULL -> transform tự resolve'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci
+/*!50500 PARTITION BY LIST  COLUMNS(load_date)
+(PARTITION p_init VALUES IN ('1970-01-01') ENGINE = InnoDB) */;
+
+-- --------------------------------------------------------
+
+--
+-- Table structure for table `stg_products_rejected`
+--
+
+CREATE TABLE `stg_products_rejected` (
+  `id` bigint NOT NULL,
+  `name` varchar(100) DEFAULT NULL,
+  `province` varchar(100) DEFAULT NULL,
+  `price` varchar(100) DEFAULT NULL,
+  `date` varchar(100) DEFAULT NULL,
+  `load_date` date NOT NULL,
+  `reason` varchar(50) NOT NULL COMMENT 'Cột không chuẩn hóa được: price, date',
+  `rejected_at` datetime DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- --------------------------------------------------------
@@ -1000,7 +1250,11 @@ CREATE TABLE `stg_products_standardized` (
   `load_date` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
   `date_create` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
   `expire_date` date DEFAULT '9999-12-31',
-  `is_delete` tinyint(1) DEFAULT '0'
+  `is_delete` tinyint(1) DEFAULT '0',
+  `product_id` int DEFAULT NULL,
+  `province_id` int DEFAULT NULL,
+  `row_hash` binary(16) DEFAULT NULL COMMENT 'MD5 các thuộc tính theo dõi SCD2 (price)',
+  `is_active` tinyint(1) GENERATED ALWAYS AS ((`expire_date` = _utf8mb4'9999-12-31')) STORED
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- --------------------------------------------------------
@@ -1015,7 +1269,10 @@ CREATE TABLE `stg_products_transformed` (
   `province` varchar(255) DEFAULT NULL,
   `price` decimal(10,2) DEFAULT NULL,
   `date` datetime DEFAULT NULL,
-  `load_date` date DEFAULT NULL
+  `load_date` date DEFAULT NULL,
+  `product_id` int DEFAULT NULL,
+  `province_id` int DEFAULT NULL,
+  `row_hash` binary(16) DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 --
@@ -1027,6 +1284,8 @@ CREATE TABLE `stg_products_transformed` (
 --
 ALTER TABLE `agg_product_price_weekly`
   ADD PRIMARY KEY (`agg_id`),
+  ADD UNIQUE KEY `uq_agg_group` (`year`,`week_of_year`,`product_id`,`province_id`),
+  ADD KEY `idx_agg_load_date` (`load_date`),
   ADD KEY `agg_weekly_fk_product` (`product_id`),
   ADD KEY `agg_weekly_fk_province` (`province_id`);
 
@@ -1054,23 +1313,42 @@ ALTER TABLE `dim_province`
 -- Indexes for table `fact_product_price`
 --
 ALTER TABLE `fact_product_price`
-  ADD PRIMARY KEY (`fact_id`),
+  ADD PRIMARY KEY (`fact_id`,`load_date`),
   ADD KEY `product_id` (`product_id`),
   ADD KEY `province_id` (`province_id`),
-  ADD KEY `date_id` (`date_id`);
+  ADD KEY `date_id` (`date_id`),
+  ADD KEY `idx_fact_scd_create` (`product_id`,`province_id`,`date_create`),
+  ADD KEY `idx_fact_scd_expire` (`product_id`,`province_id`,`expire_date`),
+  ADD KEY `idx_fact_load_date` (`load_date`);
+
+--
+-- Indexes for table `province_alias`
+--
+ALTER TABLE `province_alias`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `idx_alias` (`alias`,`valid_from`,`valid_to`);
 
 --
 -- Indexes for table `stg_products`
 --
 ALTER TABLE `stg_products`
-  ADD PRIMARY KEY (`id`,`date`);
+  ADD PRIMARY KEY (`id`,`load_date`),
+  ADD KEY `idx_load_date` (`load_date`);
+
+--
+-- Indexes for table `stg_products_rejected`
+--
+ALTER TABLE `stg_products_rejected`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `idx_load_date` (`load_date`);
 
 --
 -- Indexes for table `stg_products_standardized`
 --
 ALTER TABLE `stg_products_standardized`
   ADD PRIMARY KEY (`id`),
-  ADD KEY `fk_date` (`date_id`);
+  ADD KEY `fk_date` (`date_id`),
+  ADD KEY `idx_std_active` (`product_id`,`province_id`,`is_active`,`row_hash`);
 
 --
 -- Indexes for table `stg_products_transformed`
@@ -1106,12 +1384,36 @@ ALTER TABLE `dim_province`
 ALTER TABLE `fact_product_price`
   MODIFY `fact_id` int NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=58;
 
+--
+-- Partitioning for table `fact_product_price`
+--
+-- RANGE theo ngày load_date (TIMESTAMP -> UNIX_TIMESTAMP). Partition từng ngày (pYYYYMMDD)
+-- được tách từ p_future khi cần (scripts/fact_partitions.py), reload = EXCHANGE PARTITION.
+--
+ALTER TABLE `fact_product_price`
+  PARTITION BY RANGE (UNIX_TIMESTAMP(`load_date`)) (
+    PARTITION p_history VALUES LESS THAN (UNIX_TIMESTAMP('2025-11-01 00:00:00')),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+  );
+
+--
+-- AUTO_INCREMENT for table `province_alias`
+--
+ALTER TABLE `province_alias`
+  MODIFY `id` int NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=53;
+
 --
 -- AUTO_INCREMENT for table `stg_products`
 --
 ALTER TABLE `stg_products`
   MODIFY `id` int NOT NULL AUTO_INCREMENT;
 
+--
+-- AUTO_INCREMENT for table `stg_products_rejected`
+--
+ALTER TABLE `stg_products_rejected`
+  MODIFY `id` bigint NOT NULL AUTO_INCREMENT;
+
 --
 -- AUTO_INCREMENT for table `stg_products_standardized`
 --
@@ -1138,10 +1440,8 @@ ALTER TABLE `agg_product_price_weekly`
 --
 -- Constraints for table `fact_product_price`
 --
-ALTER TABLE `fact_product_price`
-  ADD CONSTRAINT `fact_product_price_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `dim_product` (`product_id`),
-  ADD CONSTRAINT `fact_product_price_ibfk_2` FOREIGN KEY (`province_id`) REFERENCES `dim_province` (`province_id`),
-  ADD CONSTRAINT `fact_product_price_ibfk_3` FOREIGN KEY (`date_id`) REFERENCES `dim_date` (`date_id`);
+-- Không có FOREIGN KEY: bảng partition (InnoDB) không hỗ trợ khóa ngoại.
+-- product_id / province_id / date_id do transform / load_to_dw đảm bảo tồn tại trong dim.
 
 --
 -- Constraints for table `stg_products_standardized`
@@ -1164,6 +1464,7 @@ DELIMITER $$
 --
 CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_reports_by_date` (IN `p_date` DATE)   BEGIN
 
+    -- Số dòng ghi ra file: ROW_COUNT() ngay sau SELECT ... INTO OUTFILE
     DECLARE cnt_product INT DEFAULT 0;
     DECLARE cnt_province INT DEFAULT 0;
     DECLARE cnt_weekly INT DEFAULT 0;
@@ -1171,11 +1472,10 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_reports_by_date` (IN `p_date` DAT
     -- ============================================================
     -- Check bảng rpt_product_price_summary
     -- ============================================================
-    SELECT COUNT(*) INTO cnt_product
-    FROM rpt_product_price_summary
-    WHERE DATE(load_date) = p_date;
-
-    IF cnt_product = 0 THEN
+    IF NOT EXISTS (
+        SELECT 1 FROM rpt_product_price_summary
+        WHERE load_date >= p_date AND load_date < p_date + INTERVAL 1 DAY
+    ) THEN
         SIGNAL SQLSTATE '45000'
             SET MESSAGE_TEXT = 'No data in rpt_product_price_summary for export date';
     ELSE
@@ -1185,11 +1485,12 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_reports_by_date` (IN `p_date` DAT
             "FIELDS TERMINATED BY ',' ",
             "ENCLOSED BY '\"' ",
             "LINES TERMINATED BY '\\n' ",
-            "FROM rpt_product_price_summary WHERE DATE(load_date) = '", p_date, "'"
+            "FROM rpt_product_price_summary WHERE load_date >= '", p_date, "' AND load_date < '", p_date + INTERVAL 1 DAY, "'"
         );
 
         PREPARE stmt FROM @sql_product;
         EXECUTE stmt;
+        SET cnt_product = ROW_COUNT();
         DEALLOCATE PREPARE stmt;
     END IF;
 
@@ -1197,11 +1498,10 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_reports_by_date` (IN `p_date` DAT
     -- ============================================================
     -- Check bảng rpt_province_price_summary
     -- ============================================================
-    SELECT COUNT(*) INTO cnt_province
-    FROM rpt_province_price_summary
-    WHERE DATE(load_date) = p_date;
-
-    IF cnt_province = 0 THEN
+    IF NOT EXISTS (
+        SELECT 1 FROM rpt_province_price_summary
+        WHERE load_date >= p_date AND load_date < p_date + INTERVAL 1 DAY
+    ) THEN
         SIGNAL SQLSTATE '45000'
             SET MESSAGE_TEXT = 'No data in rpt_province_price_summary for export date';
     ELSE
@@ -1211,11 +1511,12 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_reports_by_date` (IN `p_date` DAT
             "FIELDS TERMINATED BY ',' ",
             "ENCLOSED BY '\"' ",
             "LINES TERMINATED BY '\\n' ",
-            "FROM rpt_province_price_summary WHERE DATE(load_date) = '", p_date, "'"
+            "FROM rpt_province_price_summary WHERE load_date >= '", p_date, "' AND load_date < '", p_date + INTERVAL 1 DAY, "'"
         );
 
         PREPARE stmt FROM @sql_province;
         EXECUTE stmt;
+        SET cnt_province = ROW_COUNT();
         DEALLOCATE PREPARE stmt;
     END IF;
 
@@ -1223,15 +1524,10 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_reports_by_date` (IN `p_date` DAT
     -- ============================================================
     -- Check bảng rpt_weekly_price_trend
     -- ============================================================
-    SELECT COUNT(*) INTO cnt_weekly
-    FROM rpt_weekly_price_trend
-    WHERE DATE(load_date) = p_date;
-
-    SELECT COUNT(*) INTO cnt_weekly
- FROM rpt_weekly_price_trend
- WHERE DATE(load_date) = p_date;
-
- IF cnt_weekly = 0 THEN
+    IF NOT EXISTS (
+        SELECT 1 FROM rpt_weekly_price_trend
+        WHERE load_date >= p_date AND load_date < p_date + INTERVAL 1 DAY
+    ) THEN
      SIGNAL SQLSTATE '45000'
          SET MESSAGE_TEXT = 'No data in rpt_weekly_price_trend for export date';
  ELSE
@@ -1242,71 +1538,310 @@ CREATE DEFINER=`root`@`%` PROCEDURE `sp_export_reports_by_date` (IN `p_date` DAT
          'ENCLOSED BY ''"'' ',
          'ESCAPED BY ''"'' ',
          'LINES TERMINATED BY ''\\n'' ',
-         'FROM rpt_weekly_price_trend WHERE DATE(load_date) = ''', p_date, ''''
+         'FROM rpt_weekly_price_trend WHERE load_date >= ''', p_date, ''' AND load_date < ''', p_date + INTERVAL 1 DAY, ''''
      );
 
      PREPARE stmt FROM @sql_weekly;
      EXECUTE stmt;
+     SET cnt_weekly = ROW_COUNT();
      DEALLOCATE PREPARE stmt;
  END IF;
 
+    -- Số dòng (tbl, op, cnt) cho script Python, không COUNT(*) lại
+    SELECT 'rpt_product_price_summary' AS tbl, 'exported' AS op, cnt_product AS cnt
+    UNION ALL SELECT 'rpt_province_price_summary', 'exported', cnt_province
+    UNION ALL SELECT 'rpt_weekly_price_trend', 'exported', cnt_weekly;
+
 END$$
 
 CREATE DEFINER=`root`@`%` PROCEDURE `sp_load_weekly_product_price` (IN `p_load_date` DATE, IN `p_is_cleanup` TINYINT)   BEGIN
-    -- 1. Xóa dữ liệu nếu p_is_cleanup = 1
-    IF p_is_cleanup = 1 THEN
-        DELETE FROM agg_product_price_weekly
-		WHERE DATE(load_date) = p_load_date; 
-
+    -- Cập nhật tăng dần: chỉ tính lại các nhóm (year, week_of_year_monday, product_id, province_id)
+    -- của tuần chứa p_load_date từ mọi ngày đã có dữ liệu trong tuần, upsert vào agg theo nhóm tuần
+    -- (load_date = lần tính lại gần nhất) và vào rpt theo load_date, không rebuild toàn bộ lịch sử.
+    DECLARE v_year INT;
+    DECLARE v_week INT;
+    DECLARE v_week_start DATE;
+    DECLARE v_last_day DATE;
+    DECLARE v_deleted INT DEFAULT 0;
+    DECLARE v_inserted INT DEFAULT 0;
+    DECLARE v_updated INT DEFAULT 0;
+    DECLARE v_trend_deleted INT DEFAULT 0;
+    DECLARE v_trend_inserted INT DEFAULT 0;
+    DECLARE v_trend_updated INT DEFAULT 0;
+    DECLARE v_product_deleted INT DEFAULT 0;
+    DECLARE v_product_inserted INT DEFAULT 0;
+    DECLARE v_product_updated INT DEFAULT 0;
+    DECLARE v_province_deleted INT DEFAULT 0;
+    DECLARE v_province_inserted INT DEFAULT 0;
+    DECLARE v_province_updated INT DEFAULT 0;
+
+    SELECT d.year, d.week_of_year_monday, d.week_monday_start
+    INTO v_year, v_week, v_week_start
+    FROM dim_date d
+    WHERE d.full_date = p_load_date;
+    IF v_week_start IS NULL THEN
+        SIGNAL SQLSTATE '45000' SET MESSAGE_TEXT = 'LỖI: dim_date không có ngày cần tổng hợp!';
     END IF;
 
-    -- 2. Insert dữ liệu aggregation
-    INSERT INTO agg_product_price_weekly (
-        year,
-        week_of_year,
-        product_id,
-        province_id,
-        avg_price,
-        min_price,
-        max_price,
-        record_count,
-        created_at,
-        load_date
-    )
+    -- Ngày dữ liệu mới nhất: backfill ngày cũ vẫn tính đủ các ngày sau đã load trong tuần,
+    -- nhưng không tính trước các ngày chưa có dữ liệu
+    SELECT GREATEST(p_load_date, COALESCE(DATE(MAX(f.load_date)), p_load_date))
+    INTO v_last_day
+    FROM fact_product_price f;
+
+    -- 1. Phiên bản fact đang hiệu lực của từng key ở mỗi ngày của tuần (tới v_last_day):
+    --    date_create lớn nhất <= ngày đó, tức dòng is_delete = 0 tại ngày đó.
+    --    Fact chỉ có dòng khi giá đổi -> key không đổi giá vẫn được tính mỗi ngày qua phiên bản cũ.
+    --    Không dựa vào cờ is_delete: partition fact cũ ở DW không được cập nhật lại khi đóng phiên bản.
+    DROP TEMPORARY TABLE IF EXISTS tmp_week_versions;
+    CREATE TEMPORARY TABLE tmp_week_versions AS
+    SELECT wd.full_date AS day, f.product_id, f.province_id, MAX(f.date_create) AS date_create
+    FROM dim_date wd
+    JOIN fact_product_price f ON f.date_create <= wd.full_date
+    WHERE wd.full_date >= v_week_start AND wd.full_date <= LEAST(v_week_start + INTERVAL 6 DAY, v_last_day)
+      AND wd.year = v_year AND wd.week_of_year_monday = v_week
+    GROUP BY wd.full_date, f.product_id, f.province_id;
+
+    -- Nhóm của tuần: giá theo ngày của phiên bản hiệu lực, record_count = số ngày
+    DROP TEMPORARY TABLE IF EXISTS tmp_agg_day;
+    CREATE TEMPORARY TABLE tmp_agg_day AS
     SELECT
-        d.year,
-        d.week_of_year_monday AS week_of_year,
-        f.product_id,
-        f.province_id,
-        AVG(f.price) AS avg_price,
+        v_year AS year,
+        v_week AS week_of_year,
+        v.product_id,
+        v.province_id,
+        CAST(AVG(f.price) AS DECIMAL(10,2)) AS avg_price,
         MIN(f.price) AS min_price,
         MAX(f.price) AS max_price,
         COUNT(*) AS record_count,
-        NOW() AS created_at,
-        MIN(DATE(f.load_date)) AS load_date
-
-    FROM fact_product_price f
-    JOIN dim_date d ON f.date_id = d.date_id
-    WHERE f.is_delete = 0
-      AND DATE(f.load_date) = p_load_date
+        p_load_date AS load_date
+    FROM tmp_week_versions v
+    JOIN fact_product_price f
+        ON f.product_id = v.product_id
+       AND f.province_id = v.province_id
+       AND f.date_create = v.date_create
     GROUP BY
-        d.year,
-        d.week_of_year_monday,
-        f.product_id,
-        f.province_id;
+        v.product_id,
+        v.province_id;
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_week_versions;
 
-    -- 3. Refresh report tables
-    DROP TABLE IF EXISTS rpt_weekly_price_trend;
-    CREATE TABLE rpt_weekly_price_trend AS
-    SELECT * FROM vw_weekly_price_chart;
+    -- 2. Upsert agg_product_price_weekly (uq_agg_group theo nhóm tuần), chỉ dòng mới / đổi giá trị;
+    --    load_date ghi lại ngày tính lại gần nhất để view / rpt của p_load_date lấy đủ nhóm của tuần
+    SELECT
+        COALESCE(SUM(a.agg_id IS NULL), 0),
+        COALESCE(SUM(a.agg_id IS NOT NULL AND NOT (
+            a.avg_price <=> t.avg_price AND a.min_price <=> t.min_price
+            AND a.max_price <=> t.max_price AND a.record_count <=> t.record_count
+            AND a.load_date <=> t.load_date
+        )), 0)
+    INTO v_inserted, v_updated
+    FROM tmp_agg_day t
+    LEFT JOIN agg_product_price_weekly a
+        ON a.year = t.year AND a.week_of_year = t.week_of_year
+       AND a.product_id = t.product_id AND a.province_id = t.province_id;
 
-    DROP TABLE IF EXISTS rpt_product_price_summary;
-    CREATE TABLE rpt_product_price_summary AS
-    SELECT * FROM vw_product_price_summary;
+    INSERT INTO agg_product_price_weekly (
+        year, week_of_year, product_id, province_id,
+        avg_price, min_price, max_price, record_count, created_at, load_date
+    )
+    SELECT
+        t.year, t.week_of_year, t.product_id, t.province_id,
+        t.avg_price, t.min_price, t.max_price, t.record_count, NOW(), t.load_date
+    FROM tmp_agg_day t
+    LEFT JOIN agg_product_price_weekly a
+        ON a.year = t.year AND a.week_of_year = t.week_of_year
+       AND a.product_id = t.product_id AND a.province_id = t.province_id
+    WHERE a.agg_id IS NULL
+       OR NOT (
+            a.avg_price <=> t.avg_price AND a.min_price <=> t.min_price
+            AND a.max_price <=> t.max_price AND a.record_count <=> t.record_count
+            AND a.load_date <=> t.load_date
+       )
+    ON DUPLICATE KEY UPDATE
+        avg_price = t.avg_price,
+        min_price = t.min_price,
+        max_price = t.max_price,
+        record_count = t.record_count,
+        load_date = t.load_date;
+
+    -- Nhóm của tuần không còn trong fact -> xóa nếu p_is_cleanup = 1
+    IF p_is_cleanup = 1 THEN
+        DELETE a FROM agg_product_price_weekly a
+        LEFT JOIN tmp_agg_day t
+            ON a.year = t.year AND a.week_of_year = t.week_of_year
+           AND a.product_id = t.product_id AND a.province_id = t.province_id
+        WHERE a.year = v_year AND a.week_of_year = v_week
+          AND t.year IS NULL;
+        SET v_deleted = ROW_COUNT();
+    END IF;
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_agg_day;
+
+    -- 3. Upsert rpt_* cho đúng load_date (rpt chỉ phụ thuộc agg cùng load_date)
+    --    Tên so bằng utf8mb4_bin: ai_ci coi tên chỉ khác dấu / hoa thường là bằng nhau
+    -- 3.1 rpt_weekly_price_trend (uq_rpt_trend)
+    DROP TEMPORARY TABLE IF EXISTS tmp_rpt_trend;
+    CREATE TEMPORARY TABLE tmp_rpt_trend AS
+    SELECT * FROM vw_weekly_price_chart WHERE load_date = p_load_date;
+
+    SELECT
+        COALESCE(SUM(r.year IS NULL), 0),
+        COALESCE(SUM(r.year IS NOT NULL AND NOT (
+            r.product_name <=> t.product_name COLLATE utf8mb4_bin AND r.province_name <=> t.province_name COLLATE utf8mb4_bin
+            AND r.avg_price <=> t.avg_price AND r.min_price <=> t.min_price
+            AND r.max_price <=> t.max_price AND r.record_count <=> t.record_count
+        )), 0)
+    INTO v_trend_inserted, v_trend_updated
+    FROM tmp_rpt_trend t
+    LEFT JOIN rpt_weekly_price_trend r
+        ON r.year = t.year AND r.week_of_year = t.week_of_year
+       AND r.product_id = t.product_id AND r.province_id = t.province_id
+       AND r.load_date = t.load_date;
+
+    INSERT INTO rpt_weekly_price_trend (
+        year, week_of_year, year_week_label, product_id, product_name, province_id, province_name,
+        avg_price, min_price, max_price, record_count, load_date, created_at
+    )
+    SELECT
+        t.year, t.week_of_year, t.year_week_label, t.product_id, t.product_name, t.province_id, t.province_name,
+        t.avg_price, t.min_price, t.max_price, t.record_count, t.load_date, t.created_at
+    FROM tmp_rpt_trend t
+    LEFT JOIN rpt_weekly_price_trend r
+        ON r.year = t.year AND r.week_of_year = t.week_of_year
+       AND r.product_id = t.product_id AND r.province_id = t.province_id
+       AND r.load_date = t.load_date
+    WHERE r.year IS NULL
+       OR NOT (
+            r.product_name <=> t.product_name COLLATE utf8mb4_bin AND r.province_name <=> t.province_name COLLATE utf8mb4_bin
+            AND r.avg_price <=> t.avg_price AND r.min_price <=> t.min_price
+            AND r.max_price <=> t.max_price AND r.record_count <=> t.record_count
+       )
+    ON DUPLICATE KEY UPDATE
+        product_name = t.product_name,
+        province_name = t.province_name,
+        avg_price = t.avg_price,
+        min_price = t.min_price,
+        max_price = t.max_price,
+        record_count = t.record_count;
+
+    DELETE r FROM rpt_weekly_price_trend r
+    LEFT JOIN tmp_rpt_trend t
+        ON r.year = t.year AND r.week_of_year = t.week_of_year
+       AND r.product_id = t.product_id AND r.province_id = t.province_id
+    WHERE r.load_date = p_load_date
+      AND t.year IS NULL;
+    SET v_trend_deleted = ROW_COUNT();
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_rpt_trend;
+
+    -- 3.2 rpt_product_price_summary (uq_rpt_product)
+    DROP TEMPORARY TABLE IF EXISTS tmp_rpt_product;
+    CREATE TEMPORARY TABLE tmp_rpt_product AS
+    SELECT * FROM vw_product_price_summary WHERE load_date = p_load_date;
+
+    SELECT
+        COALESCE(SUM(r.load_date IS NULL), 0),
+        COALESCE(SUM(r.load_date IS NOT NULL AND NOT (
+            r.product_name <=> t.product_name COLLATE utf8mb4_bin AND r.overall_avg_price <=> t.overall_avg_price
+            AND r.min_observed_price <=> t.min_observed_price AND r.max_observed_price <=> t.max_observed_price
+            AND r.total_records <=> t.total_records
+        )), 0)
+    INTO v_product_inserted, v_product_updated
+    FROM tmp_rpt_product t
+    LEFT JOIN rpt_product_price_summary r
+        ON r.product_id = t.product_id AND r.load_date = t.load_date;
+
+    INSERT INTO rpt_product_price_summary (
+        product_id, product_name, load_date, overall_avg_price,
+        min_observed_price, max_observed_price, total_records
+    )
+    SELECT
+        t.product_id, t.product_name, t.load_date, t.overall_avg_price,
+        t.min_observed_price, t.max_observed_price, t.total_records
+    FROM tmp_rpt_product t
+    LEFT JOIN rpt_product_price_summary r
+        ON r.product_id = t.product_id AND r.load_date = t.load_date
+    WHERE r.load_date IS NULL
+       OR NOT (
+            r.product_name <=> t.product_name COLLATE utf8mb4_bin AND r.overall_avg_price <=> t.overall_avg_price
+            AND r.min_observed_price <=> t.min_observed_price AND r.max_observed_price <=> t.max_observed_price
+            AND r.total_records <=> t.total_records
+       )
+    ON DUPLICATE KEY UPDATE
+        product_name = t.product_name,
+        overall_avg_price = t.overall_avg_price,
+        min_observed_price = t.min_observed_price,
+        max_observed_price = t.max_observed_price,
+        total_records = t.total_records;
+
+    DELETE r FROM rpt_product_price_summary r
+    LEFT JOIN tmp_rpt_product t ON r.product_id = t.product_id
+    WHERE r.load_date = p_load_date
+      AND t.load_date IS NULL;
+    SET v_product_deleted = ROW_COUNT();
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_rpt_product;
+
+    -- 3.3 rpt_province_price_summary (uq_rpt_province)
+    DROP TEMPORARY TABLE IF EXISTS tmp_rpt_province;
+    CREATE TEMPORARY TABLE tmp_rpt_province AS
+    SELECT * FROM vw_province_price_summary WHERE load_date = p_load_date;
 
-    DROP TABLE IF EXISTS rpt_province_price_summary;
-    CREATE TABLE rpt_province_price_summary AS
-    SELECT * FROM vw_province_price_summary;
+    SELECT
+        COALESCE(SUM(r.load_date IS NULL), 0),
+        COALESCE(SUM(r.load_date IS NOT NULL AND NOT (
+            r.province_name <=> t.province_name COLLATE utf8mb4_bin AND r.avg_price <=> t.avg_price
+            AND r.min_price <=> t.min_price AND r.max_price <=> t.max_price
+            AND r.total_records <=> t.total_records
+        )), 0)
+    INTO v_province_inserted, v_province_updated
+    FROM tmp_rpt_province t
+    LEFT JOIN rpt_province_price_summary r
+        ON r.province_id = t.province_id AND r.load_date = t.load_date;
+
+    INSERT INTO rpt_province_price_summary (
+        province_id, province_name, load_date, avg_price, min_price, max_price, total_records
+    )
+    SELECT
+        t.province_id, t.province_name, t.load_date, t.avg_price, t.min_price, t.max_price, t.total_records
+    FROM tmp_rpt_province t
+    LEFT JOIN rpt_province_price_summary r
+        ON r.province_id = t.province_id AND r.load_date = t.load_date
+    WHERE r.load_date IS NULL
+       OR NOT (
+            r.province_name <=> t.province_name COLLATE utf8mb4_bin AND r.avg_price <=> t.avg_price
+            AND r.min_price <=> t.min_price AND r.max_price <=> t.max_price
+            AND r.total_records <=> t.total_records
+       )
+    ON DUPLICATE KEY UPDATE
+        province_name = t.province_name,
+        avg_price = t.avg_price,
+        min_price = t.min_price,
+        max_price = t.max_price,
+        total_records = t.total_records;
+
+    DELETE r FROM rpt_province_price_summary r
+    LEFT JOIN tmp_rpt_province t ON r.province_id = t.province_id
+    WHERE r.load_date = p_load_date
+      AND t.load_date IS NULL;
+    SET v_province_deleted = ROW_COUNT();
+
+    DROP TEMPORARY TABLE IF EXISTS tmp_rpt_province;
+
+    -- 4. Số dòng (tbl, op, cnt) cho script Python, không COUNT(*) lại
+    SELECT 'agg_product_price_weekly' AS tbl, 'deleted' AS op, v_deleted AS cnt
+    UNION ALL SELECT 'agg_product_price_weekly', 'inserted', v_inserted
+    UNION ALL SELECT 'agg_product_price_weekly', 'updated', v_updated
+    UNION ALL SELECT 'rpt_weekly_price_trend', 'deleted', v_trend_deleted
+    UNION ALL SELECT 'rpt_weekly_price_trend', 'inserted', v_trend_inserted
+    UNION ALL SELECT 'rpt_weekly_price_trend', 'updated', v_trend_updated
+    UNION ALL SELECT 'rpt_product_price_summary', 'deleted', v_product_deleted
+    UNION ALL SELECT 'rpt_product_price_summary', 'inserted', v_product_inserted
+    UNION ALL SELECT 'rpt_product_price_summary', 'updated', v_product_updated
+    UNION ALL SELECT 'rpt_province_price_summary', 'deleted', v_province_deleted
+    UNION ALL SELECT 'rpt_province_price_summary', 'inserted', v_province_inserted
+    UNION ALL SELECT 'rpt_province_price_summary', 'updated', v_province_updated;
 
 END$$
 
@@ -1398,7 +1933,7 @@ CREATE TABLE `fact_product_price` (
   `date_create` date DEFAULT NULL,
   `expire_date` date DEFAULT NULL,
   `is_delete` tinyint(1) DEFAULT '0',
-  `load_date` timestamp NULL DEFAULT CURRENT_TIMESTAMP
+  `load_date` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 
 -- --------------------------------------------------------
@@ -1545,6 +2080,8 @@ CREATE ALGORITHM=UNDEFINED DEFINER=`root`@`%` SQL SECURITY DEFINER VIEW `vw_week
 --
 ALTER TABLE `agg_product_price_weekly`
   ADD PRIMARY KEY (`agg_id`),
+  ADD UNIQUE KEY `uq_agg_group` (`year`,`week_of_year`,`product_id`,`province_id`),
+  ADD KEY `idx_agg_load_date` (`load_date`),
   ADD KEY `agg_weekly_fk_product` (`product_id`),
   ADD KEY `agg_weekly_fk_province` (`province_id`);
 
@@ -1572,10 +2109,30 @@ ALTER TABLE `dim_province`
 -- Indexes for table `fact_product_price`
 --
 ALTER TABLE `fact_product_price`
-  ADD PRIMARY KEY (`fact_id`),
+  ADD PRIMARY KEY (`fact_id`,`load_date`),
   ADD KEY `product_id` (`product_id`),
   ADD KEY `province_id` (`province_id`),
-  ADD KEY `date_id` (`date_id`);
+  ADD KEY `date_id` (`date_id`),
+  ADD KEY `idx_fact_scd_create` (`product_id`,`province_id`,`date_create`),
+  ADD KEY `idx_fact_load_date` (`load_date`);
+
+--
+-- Indexes for table `rpt_product_price_summary`
+--
+ALTER TABLE `rpt_product_price_summary`
+  ADD UNIQUE KEY `uq_rpt_product` (`load_date`,`product_id`);
+
+--
+-- Indexes for table `rpt_province_price_summary`
+--
+ALTER TABLE `rpt_province_price_summary`
+  ADD UNIQUE KEY `uq_rpt_province` (`load_date`,`province_id`);
+
+--
+-- Indexes for table `rpt_weekly_price_trend`
+--
+ALTER TABLE `rpt_weekly_price_trend`
+  ADD UNIQUE KEY `uq_rpt_trend` (`load_date`,`year`,`week_of_year`,`product_id`,`province_id`);
 
 --
 -- AUTO_INCREMENT for dumped tables
@@ -1605,6 +2162,18 @@ ALTER TABLE `dim_province`
 ALTER TABLE `fact_product_price`
   MODIFY `fact_id` int NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=58;
 
+--
+-- Partitioning for table `fact_product_price`
+--
+-- RANGE theo ngày load_date (TIMESTAMP -> UNIX_TIMESTAMP). Partition từng ngày (pYYYYMMDD)
+-- được tách từ p_future khi cần (scripts/fact_partitions.py), reload = EXCHANGE PARTITION.
+--
+ALTER TABLE `fact_product_price`
+  PARTITION BY RANGE (UNIX_TIMESTAMP(`load_date`)) (
+    PARTITION p_history VALUES LESS THAN (UNIX_TIMESTAMP('2025-11-01 00:00:00')),
+    PARTITION p_future VALUES LESS THAN MAXVALUE
+  );
+
 --
 -- Constraints for dumped tables
 --
@@ -1619,10 +2188,8 @@ ALTER TABLE `agg_product_price_weekly`
 --
 -- Constraints for table `fact_product_price`
 --
-ALTER TABLE `fact_product_price`
-  ADD CONSTRAINT `fact_product_price_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `dim_product` (`product_id`),
-  ADD CONSTRAINT `fact_product_price_ibfk_2` FOREIGN KEY (`province_id`) REFERENCES `dim_province` (`province_id`),
-  ADD CONSTRAINT `fact_product_price_ibfk_3` FOREIGN KEY (`date_id`) REFERENCES `dim_date` (`date_id`);
+-- Không có FOREIGN KEY: bảng partition (InnoDB) không hỗ trợ khóa ngoại.
+-- product_id / province_id / date_id do transform / load_to_dw đảm bảo tồn tại trong dim.
 COMMIT;
 
 -- 4. Data Mart Database
@@ -1675,4 +2242,24 @@ CREATE TABLE `rpt_weekly_price_trend` (
   `load_date` date DEFAULT NULL,
   `created_at` timestamp NULL DEFAULT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+--
+-- Indexes for table `rpt_product_price_summary`
+--
+-- load_to_dm publish bằng CREATE TABLE ... LIKE + RENAME TABLE nên index được giữ qua mỗi lần nạp
+--
+ALTER TABLE `rpt_product_price_summary`
+  ADD UNIQUE KEY `uq_rpt_product` (`load_date`,`product_id`);
+
+--
+-- Indexes for table `rpt_province_price_summary`
+--
+ALTER TABLE `rpt_province_price_summary`
+  ADD UNIQUE KEY `uq_rpt_province` (`load_date`,`province_id`);
+
+--
+-- Indexes for table `rpt_weekly_price_trend`
+--
+ALTER TABLE `rpt_weekly_price_trend`
+  ADD UNIQUE KEY `uq_rpt_trend` (`load_date`,`year`,`week_of_year`,`product_id`,`province_id`);
 COMMIT;
\ No newline at end of file
@@ -0,0 +1,232 @@
+import time
+import argparse
+from db_pool import get_connection
+
+# Benchmark bước 5 (SCD2 trên fact) của sp_transform_products:
+#   legacy   : subquery tương quan theo từng dòng + NOT EXISTS không có index ghép
+#   set-based: resolve key 1 lần vào bảng tạm + index (product_id, province_id, date_create/expire_date)
+# Chạy trên các bảng bench_* riêng trong schema STAGING, không đụng dữ liệu thật.
+
+N_PRODUCTS = 500
+N_PROVINCES = 34
+LOAD_DATE = "2025-11-25"
+
+LEGACY_CLOSE = """
+    UPDATE bench_fact f
+    JOIN bench_std s
+        ON f.product_id = (SELECT product_id FROM bench_dim_product WHERE product_name = s.name)
+       AND f.province_id = (SELECT province_id FROM bench_dim_province WHERE province_name = s.province)
+       AND f.date_create = s.date_create
+    SET f.expire_date = s.expire_date,
+        f.is_delete = s.is_delete
+    WHERE s.is_delete = 1
+"""
+
+LEGACY_INSERT = """
+    INSERT INTO bench_fact (product_id, province_id, date_id, price, date_create, expire_date, is_delete)
+    SELECT dp.product_id, dv.province_id, s.date_id, s.price, s.date_create, s.expire_date, s.is_delete
+    FROM bench_std s
+    JOIN bench_dim_product dp ON s.name = dp.product_name
+    JOIN bench_dim_province dv ON s.province = dv.province_name
+    WHERE s.date_create = %(load_date)s
+      AND NOT EXISTS (
+          SELECT 1 FROM bench_fact f
+          WHERE f.product_id = dp.product_id
+            AND f.province_id = dv.province_id
+            AND f.date_create = s.date_create
+      )
+"""
+
+SET_BASED = [
+    "DROP TEMPORARY TABLE IF EXISTS tmp_scd_keys",
+    """
+    CREATE TEMPORARY TABLE tmp_scd_keys (
+        std_id INT NOT NULL PRIMARY KEY,
+        product_id INT NOT NULL,
+        province_id INT NOT NULL,
+        KEY idx_keys (product_id, province_id)
+    )
+    """,
+    """
+    INSERT INTO tmp_scd_keys (std_id, product_id, province_id)
+    SELECT s.id, dp.product_id, dv.province_id
+    FROM bench_std s
+    JOIN bench_dim_product dp ON dp.product_name = s.name
+    JOIN bench_dim_province dv ON dv.province_name = s.province
+    WHERE s.date_create = %(load_date)s
+       OR (s.is_delete = 1 AND s.expire_date = DATE_SUB(%(load_date)s, INTERVAL 1 DAY))
+    """,
+    """
+    UPDATE bench_fact f
+    JOIN tmp_scd_keys k
+        ON f.product_id = k.product_id
+       AND f.province_id = k.province_id
+    JOIN bench_std s
+        ON s.id = k.std_id
+       AND f.date_create = s.date_create
+    SET f.expire_date = s.expire_date,
+        f.is_delete = s.is_delete
+    WHERE s.is_delete = 1
+    """,
+    """
+    INSERT INTO bench_fact (product_id, province_id, date_id, price, date_create, expire_date, is_delete)
+    SELECT k.product_id, k.province_id, s.date_id, s.price, s.date_create, s.expire_date, s.is_delete
+    FROM bench_std s
+    JOIN tmp_scd_keys k ON k.std_id = s.id
+    WHERE s.date_create = %(load_date)s
+      AND NOT EXISTS (
+          SELECT 1 FROM bench_fact f
+          WHERE f.product_id = k.product_id
+            AND f.province_id = k.province_id
+            AND f.date_create = %(load_date)s
+      )
+    """,
+    "DROP TEMPORARY TABLE IF EXISTS tmp_scd_keys",
+]
+
+
+def _seq_cte(n):
+    return f"WITH RECURSIVE seq(n) AS (SELECT 0 UNION ALL SELECT n + 1 FROM seq WHERE n < {n - 1}) "
+
+
+def setup(cursor, fact_rows, changes, composite_index):
+    """
+    Tạo bench_* với fact_rows dòng lịch sử và `changes` cặp (sản phẩm, tỉnh) đổi giá hôm nay.
+    """
+    for table in ("bench_fact", "bench_std", "bench_dim_product", "bench_dim_province"):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    cursor.execute(f"SET SESSION cte_max_recursion_depth = {max(fact_rows, changes, N_PRODUCTS) + 1}")
+
+    cursor.execute("""
+        CREATE TABLE bench_dim_product (
+            product_id INT AUTO_INCREMENT PRIMARY KEY,
+            product_name VARCHAR(100) NOT NULL UNIQUE
+        )""")
+    cursor.execute("""
+        CREATE TABLE bench_dim_province (
+            province_id INT AUTO_INCREMENT PRIMARY KEY,
+            province_name VARCHAR(100) NOT NULL UNIQUE
+        )""")
+    cursor.execute(
+        "INSERT INTO bench_dim_product (product_name) "
+        + _seq_cte(N_PRODUCTS) + "SELECT CONCAT('product_', n) FROM seq"
+    )
+    cursor.execute(
+        "INSERT INTO bench_dim_province (province_name) "
+        + _seq_cte(N_PROVINCES) + "SELECT CONCAT('province_', n) FROM seq"
+    )
+
+    extra_keys = (
+        ", KEY idx_fact_scd_create (product_id, province_id, date_create)"
+        ", KEY idx_fact_scd_expire (product_id, province_id, expire_date)"
+    ) if composite_index else ""
+    cursor.execute(f"""
+        CREATE TABLE bench_fact (
+            fact_id INT AUTO_INCREMENT PRIMARY KEY,
+            product_id INT NOT NULL,
+            province_id INT NOT NULL,
+            date_id INT NOT NULL,
+            price DECIMAL(10,2),
+            date_create DATE,
+            expire_date DATE,
+            is_delete TINYINT(1) DEFAULT 0,
+            KEY product_id (product_id),
+            KEY province_id (province_id)
+            {extra_keys}
+        )""")
+
+    # Lịch sử: mỗi cặp (sản phẩm, tỉnh) có nhiều phiên bản, mỗi phiên bản 1 ngày date_create
+    combos = N_PRODUCTS * N_PROVINCES
+    cursor.execute(
+        "INSERT INTO bench_fact (product_id, province_id, date_id, price, date_create, expire_date, is_delete) "
+        + _seq_cte(fact_rows)
+        + f"""SELECT MOD(n, {N_PRODUCTS}) + 1, MOD(FLOOR(n / {N_PRODUCTS}), {N_PROVINCES}) + 1, 1,
+                  10000 + MOD(n, 997),
+                  DATE_SUB(%(load_date)s, INTERVAL FLOOR(n / {combos}) + 1 DAY),
+                  IF(n < {combos}, '9999-12-31', DATE_SUB(%(load_date)s, INTERVAL FLOOR(n / {combos}) + 1 DAY)),
+                  IF(n < {combos}, 0, 1)
+           FROM seq""",
+        {"load_date": LOAD_DATE}
+    )
+
+    # Standardized của hôm nay: `changes` dòng bị đóng + `changes` dòng mới
+    cursor.execute("""
+        CREATE TABLE bench_std (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(50),
+            province VARCHAR(50),
+            price DECIMAL(10,2),
+            date_id INT NOT NULL,
+            date_create DATE,
+            expire_date DATE DEFAULT '9999-12-31',
+            is_delete TINYINT(1) DEFAULT 0
+        )""")
+    cursor.execute(
+        "INSERT INTO bench_std (name, province, price, date_id, date_create, expire_date, is_delete) "
+        + _seq_cte(changes)
+        + f"""SELECT CONCAT('product_', MOD(n, {N_PRODUCTS})), CONCAT('province_', MOD(FLOOR(n / {N_PRODUCTS}), {N_PROVINCES})),
+                  10000 + MOD(n, 997), 1, DATE_SUB(%(load_date)s, INTERVAL 1 DAY),
+                  DATE_SUB(%(load_date)s, INTERVAL 1 DAY), 1
+           FROM seq
+           UNION ALL
+           SELECT CONCAT('product_', MOD(n, {N_PRODUCTS})), CONCAT('province_', MOD(FLOOR(n / {N_PRODUCTS}), {N_PROVINCES})),
+                  20000 + MOD(n, 997), 1, %(load_date)s, '9999-12-31', 0
+           FROM seq""",
+        {"load_date": LOAD_DATE}
+    )
+
+
+def run_variant(cursor, statements):
+    started = time.perf_counter()
+    for statement in statements:
+        cursor.execute(statement, {"load_date": LOAD_DATE} if "%(load_date)s" in statement else None)
+    return time.perf_counter() - started
+
+
+def benchmark(sizes, changes, keep=False):
+    conn = None
+    results = []
+    try:
+        conn = get_connection('STAGING')
+        cursor = conn.cursor()
+
+        for fact_rows in sizes:
+            print(f"⏱️  Fact = {fact_rows:,} dòng, thay đổi = {changes:,} cặp")
+            row = {"fact_rows": fact_rows}
+
+            setup(cursor, fact_rows, changes, composite_index=False)
+            conn.commit()
+            row["legacy"] = run_variant(cursor, [LEGACY_CLOSE, LEGACY_INSERT])
+            conn.rollback()
+
+            setup(cursor, fact_rows, changes, composite_index=True)
+            conn.commit()
+            row["set_based"] = run_variant(cursor, SET_BASED)
+            conn.rollback()
+
+            print(f"   -> legacy: {row['legacy']:.3f}s | set-based: {row['set_based']:.3f}s")
+            results.append(row)
+
+        if not keep:
+            for table in ("bench_fact", "bench_std", "bench_dim_product", "bench_dim_province"):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    finally:
+        if conn:
+            conn.close()
+
+    print("\n fact_rows |   legacy (s) | set-based (s) | speedup")
+    for row in results:
+        speedup = row["legacy"] / row["set_based"] if row["set_based"] else float("inf")
+        print(f" {row['fact_rows']:>9,} | {row['legacy']:>12.3f} | {row['set_based']:>13.3f} | {speedup:>6.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark legacy vs set-based SCD2 fact merge.")
+    parser.add_argument("--sizes", type=str, default="10000,100000,1000000", help="Fact sizes, comma separated")
+    parser.add_argument("--changes", type=int, default=2000, help="Changed (product, province) pairs per run")
+    parser.add_argument("--keep", action="store_true", help="Keep bench_* tables for inspection")
+    args = parser.parse_args()
+
+    benchmark([int(s) for s in args.sizes.split(",")], args.changes, args.keep)
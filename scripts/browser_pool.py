@@ -0,0 +1,191 @@
+import os
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+
+def build_chrome_options(download_dir="./staging"):
+    """
+    Cấu hình Chrome headless (Bắt buộc cho Docker)
+    """
+    chrome_options = webdriver.ChromeOptions()
+    chrome_options.binary_location = "/usr/bin/chromium"  # Quan trọng cho Docker
+
+    prefs = {
+        "download.default_directory": os.path.abspath(download_dir),
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True
+    }
+    chrome_options.add_experimental_option("prefs", prefs)
+
+    # Các cờ bắt buộc khi chạy trong container
+    chrome_options.add_argument("--headless=new")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    chrome_options.add_argument("--disable-gpu")
+    chrome_options.add_argument("--window-size=1920,1080")
+    return chrome_options
+
+
+class PooledDriver:
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+
+class BrowserPool:
+    """
+    Giữ sẵn tối đa `size` Chromium đã mở trang reset_url.
+    - Sau mỗi lần dùng: xóa cookie + tải lại reset_url để form về trạng thái ban đầu.
+    - Driver bị tái tạo khi đã dùng `max_uses` lần hoặc khi bị crash (WebDriverException).
+    """
+
+    def __init__(self, reset_url, size=2, max_uses=20, download_dir="./staging", page_load_timeout=60):
+        self.reset_url = reset_url
+        self.size = max(1, int(size))
+        self.max_uses = max(1, int(max_uses))
+        self.download_dir = download_dir
+        self.page_load_timeout = page_load_timeout
+
+        self._idle = []  # LIFO: dùng lại driver vừa trả để các driver còn lại được recycle dần
+        self._lock = threading.Lock()
+        # Báo cho luồng đang chờ khi có driver được trả về hoặc có slot trống (driver bị hủy)
+        self._available = threading.Condition(self._lock)
+        self._created = 0
+        self._closed = False
+        self.stats = {"launched": 0, "recycled": 0, "crashed": 0, "checkouts": 0}
+
+    # --- Vòng đời driver ---
+    def _launch(self):
+        driver = webdriver.Chrome(options=build_chrome_options(self.download_dir))
+        driver.set_page_load_timeout(self.page_load_timeout)
+        try:
+            driver.get(self.reset_url)
+        except Exception:
+            driver.quit()
+            raise
+        self._count("launched")
+        return PooledDriver(driver)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _free_slot(self):
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    def _discard(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+        self._free_slot()
+
+    def _reset(self, pooled):
+        driver = pooled.driver
+        driver.delete_all_cookies()
+        driver.get(self.reset_url)
+
+    # --- API ---
+    def acquire(self, timeout=300):
+        """
+        Lấy 1 driver đang ở trạng thái sạch (đã mở reset_url).
+        Pool đầy thì chờ tới khi có driver được trả về hoặc có slot trống để mở driver mới.
+        """
+        deadline = time.monotonic() + timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("BrowserPool đã đóng.")
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Không lấy được driver trong {timeout}s (pool size={self.size}).")
+                self._available.wait(remaining)
+
+        if pooled is None:
+            try:
+                pooled = self._launch()
+            except Exception:
+                self._free_slot()
+                raise
+
+        pooled.uses += 1
+        self._count("checkouts")
+        return pooled
+
+    def release(self, pooled, broken=False):
+        """
+        Trả driver về pool: reset form để lần sau dùng ngay, hoặc tái tạo nếu hỏng/hết lượt.
+        """
+        if broken:
+            self._count("crashed")
+            self._discard(pooled)
+            return
+
+        if self._closed or pooled.uses >= self.max_uses:
+            self._count("recycled")
+            self._discard(pooled)
+            return
+
+        try:
+            self._reset(pooled)
+        except WebDriverException:
+            self._count("crashed")
+            self._discard(pooled)
+            return
+
+        with self._available:
+            if not self._closed:
+                self._idle.append(pooled)
+                self._available.notify()
+                return
+        self._discard(pooled)
+
+    @contextmanager
+    def driver(self, timeout=300):
+        pooled = self.acquire(timeout)
+        broken = False
+        try:
+            yield pooled.driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self.release(pooled, broken)
+
+    def shutdown(self):
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._available.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool(reset_url, size=2, max_uses=20, download_dir="./staging"):
+    """
+    Pool dùng chung trong process (tạo lần đầu khi cần).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(reset_url, size=size, max_uses=max_uses, download_dir=download_dir)
+            atexit.register(_pool.shutdown)
+        return _pool
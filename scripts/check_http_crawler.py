@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import shutil
+import difflib
+import argparse
+import tempfile
+import threading
+
+from crawler_fixture_server import serve
+from extract_http import download_nong_san_http
+from html_export import convert_export_to_csv
+
+# So sánh crawler HTTP với bộ chuyển đổi export trên cùng dữ liệu đã ghi (không cần mạng):
+#   1. replay fixture bằng crawler_fixture_server, chạy download_nong_san_http qua server đó
+#   2. chạy convert_export_to_csv trực tiếp trên file export đã ghi trong fixture
+#   3. so khớp 2 file CSV (cùng nội dung, cùng số dòng)
+# Ghi fixture mới: python crawler_fixture_server.py --record https://thitruongnongsan.gov.vn
+# rồi chạy crawler HTTP với source_url trỏ vào server, sau đó chạy lại script này với --start/--end tương ứng.
+
+DEFAULT_FIXTURE_DIR = "./fixtures/crawler"
+DEFAULT_PATH = "/vn/nguonwmy.aspx"
+DIFF_LINES = 20
+
+
+def find_export(fixture_dir, start_date, end_date):
+    """
+    Tìm response file export (Content-Disposition: attachment) của request tải Excel cho khoảng ngày.
+    Returns: đường dẫn .body, None nếu không có.
+    """
+    for name in sorted(os.listdir(fixture_dir)):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(fixture_dir, name), encoding="utf-8") as f:
+            meta = json.load(f)
+        disposition = meta.get("headers", {}).get("Content-Disposition", "")
+        values = {value for _, value in meta.get("request", {}).get("fields", [])}
+        if "attachment" in disposition.lower() and start_date in values and end_date in values:
+            return os.path.join(fixture_dir, name[:-len(".json")] + ".body")
+    return None
+
+
+def compare_csv(crawler_path, export_path):
+    with open(crawler_path, encoding="utf-8-sig") as f:
+        crawler_lines = f.read().splitlines()
+    with open(export_path, encoding="utf-8-sig") as f:
+        export_lines = f.read().splitlines()
+
+    if crawler_lines == export_lines:
+        print(f"✅ CSV khớp ({len(crawler_lines) - 1} dòng dữ liệu)")
+        return True
+
+    print(f"❌ CSV lệch: crawler {len(crawler_lines)} dòng, export {len(export_lines)} dòng")
+    diff = difflib.unified_diff(export_lines, crawler_lines, "export", "crawler", lineterm="")
+    for line in list(diff)[:DIFF_LINES]:
+        print(f"   {line}")
+    return False
+
+
+def check_http_crawler(fixture_dir, path, start_date, end_date):
+    export_body = find_export(fixture_dir, start_date, end_date)
+    if export_body is None:
+        print(f"❌ Không có fixture file export cho {start_date} - {end_date} trong {fixture_dir}")
+        return False
+
+    # port=0: hệ điều hành chọn cổng trống
+    server = serve(fixture_dir, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    work_dir = tempfile.mkdtemp(prefix="check_http_")
+    try:
+        host, port = server.server_address[:2]
+        crawler_path, crawler_count = download_nong_san_http(
+            f"http://{host}:{port}{path}", start_date, end_date, os.path.join(work_dir, "http")
+        )
+        if crawler_path is None:
+            print("❌ Crawler HTTP không tải được file export từ fixture")
+            return False
+
+        export_dir = os.path.join(work_dir, "export")
+        os.makedirs(export_dir)
+        export_path, export_count = convert_export_to_csv(export_body, start_date, end_date, export_dir)
+
+        matched = compare_csv(crawler_path, export_path)
+        if crawler_count != export_count:
+            print(f"❌ Số dòng lệch: crawler {crawler_count}, export {export_count}")
+            matched = False
+        return matched
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded fixtures through the HTTP crawler and diff its CSV.")
+    parser.add_argument("--dir", default=DEFAULT_FIXTURE_DIR, help="Fixture directory")
+    parser.add_argument("--path", default=DEFAULT_PATH, help="Page path recorded in the fixtures")
+    parser.add_argument("--start", default="01/10/2025", help="Start date dd/mm/YYYY recorded in the fixtures")
+    parser.add_argument("--end", default="07/10/2025", help="End date dd/mm/YYYY recorded in the fixtures")
+    args = parser.parse_args()
+
+    sys.exit(0 if check_http_crawler(args.dir, args.path, args.start, args.end) else 1)
@@ -0,0 +1,205 @@
+import sys
+import argparse
+from datetime import datetime
+from db_pool import get_connection
+
+# Kiểm tra EXPLAIN của các truy vấn theo load_date trong pipeline:
+# fail nếu bảng nào bị quét toàn bộ (type ALL / index) mà không nằm trong danh sách cho phép.
+# Truy vấn bên trong procedure được chép lại ở đây (EXPLAIN không chạy được CALL);
+# PROCEDURE_SOURCES đối chiếu với ROUTINE_DEFINITION để bản chép không lệch khỏi procedure.
+
+FULL_SCAN_TYPES = {"ALL", "index"}
+
+# (tên, DB, câu SQL với %(d)s = ngày, bảng được phép quét toàn bộ)
+PIPELINE_QUERIES = [
+    (
+        "transform: kiểm tra partition stg_products",
+        "STAGING",
+        "SELECT 1 FROM stg_products WHERE load_date = %(d)s LIMIT 1",
+        (),
+    ),
+    (
+        "transform: đọc partition stg_products",
+        "STAGING",
+        """
+        SELECT s.name, s.province, s.price_num, s.date_value
+        FROM stg_products s
+        WHERE s.load_date = %(d)s
+        """,
+        # 1 partition = đúng dữ liệu của ngày, quét hết partition là mong muốn
+        ("s",),
+    ),
+    (
+        "load_to_dw: đếm fact theo load_date",
+        "STAGING",
+        "SELECT COUNT(*) FROM fact_product_price WHERE load_date >= %(d)s AND load_date < %(d)s + INTERVAL 1 DAY",
+        (),
+    ),
+    (
+        "sp_export_from_stg_by_date: dim_product theo fact",
+        "STAGING",
+        """
+        SELECT DISTINCT d.product_id, d.product_name
+        FROM dim_product d
+        JOIN fact_product_price f ON d.product_id = f.product_id
+        WHERE f.load_date >= %(d)s AND f.load_date < %(d)s + INTERVAL 1 DAY
+        """,
+        # Dim nhỏ có thể được chọn làm bảng dẫn, fact thì không được quét toàn bộ
+        ("d",),
+    ),
+    (
+        "sp_export_from_stg_by_date: dim_province theo fact",
+        "STAGING",
+        """
+        SELECT DISTINCT p.province_id, p.province_name
+        FROM dim_province p
+        JOIN fact_product_price f ON p.province_id = f.province_id
+        WHERE f.load_date >= %(d)s AND f.load_date < %(d)s + INTERVAL 1 DAY
+        """,
+        ("p",),
+    ),
+    (
+        "load_to_dw: xóa fact DW theo load_date",
+        "DW",
+        "SELECT fact_id FROM fact_product_price WHERE load_date >= %(d)s AND load_date < %(d)s + INTERVAL 1 DAY",
+        (),
+    ),
+    (
+        "sp_load_weekly_product_price (DW): phiên bản fact hiệu lực trong tuần",
+        "DW",
+        """
+        SELECT wd.full_date AS day, f.product_id, f.province_id, MAX(f.date_create) AS date_create
+        FROM dim_date wd
+        JOIN fact_product_price f ON f.date_create <= wd.full_date
+        WHERE wd.full_date >= %(d)s - INTERVAL 6 DAY AND wd.full_date <= %(d)s
+          AND wd.year = YEAR(%(d)s)
+        GROUP BY wd.full_date, f.product_id, f.province_id
+        """,
+        # Fact chỉ có dòng khi giá đổi: đọc mọi phiên bản qua covering index idx_fact_scd_create
+        ("f",),
+    ),
+    (
+        "sp_load_weekly_product_price (DW): view trend theo load_date",
+        "DW",
+        "SELECT * FROM vw_weekly_price_chart WHERE load_date = %(d)s",
+        # Dim nhỏ join theo khóa chính sau khi lọc agg
+        ("dp", "dr"),
+    ),
+    (
+        "sp_load_weekly_product_price (DW): rpt theo load_date",
+        "DW",
+        "SELECT r.product_id FROM rpt_weekly_price_trend r WHERE r.load_date = %(d)s",
+        (),
+    ),
+    (
+        "insert_aggre_data / load_to_dm: đếm agg theo load_date",
+        "DW",
+        "SELECT COUNT(*) FROM agg_product_price_weekly WHERE load_date >= %(d)s AND load_date < %(d)s + INTERVAL 1 DAY",
+        (),
+    ),
+]
+
+
+# Tên truy vấn chép từ procedure -> (procedure, đoạn SQL phải còn nguyên trong procedure)
+PROCEDURE_SOURCES = {
+    "sp_export_from_stg_by_date: dim_product theo fact":
+        ("sp_export_from_stg_by_date", '"JOIN fact_product_price f ON d.product_id = f.product_id "'),
+    "sp_export_from_stg_by_date: dim_province theo fact":
+        ("sp_export_from_stg_by_date", '"JOIN fact_product_price f ON p.province_id = f.province_id "'),
+    "sp_load_weekly_product_price (DW): phiên bản fact hiệu lực trong tuần":
+        ("sp_load_weekly_product_price",
+         "JOIN fact_product_price f ON f.date_create <= wd.full_date "
+         "WHERE wd.full_date >= v_week_start AND wd.full_date <= LEAST(v_week_start + INTERVAL 6 DAY, v_last_day) "
+         "AND wd.year = v_year AND wd.week_of_year_monday = v_week "
+         "GROUP BY wd.full_date, f.product_id, f.province_id"),
+    "sp_load_weekly_product_price (DW): view trend theo load_date":
+        ("sp_load_weekly_product_price", "SELECT * FROM vw_weekly_price_chart WHERE load_date = p_load_date"),
+    "sp_load_weekly_product_price (DW): rpt theo load_date":
+        ("sp_load_weekly_product_price", "WHERE r.load_date = p_load_date"),
+}
+
+
+def _normalize_sql(sql):
+    return " ".join(sql.split())
+
+
+def procedure_drift(cursor, name):
+    """
+    Returns: thông báo lỗi nếu procedure không còn chứa đoạn SQL mà truy vấn chép lại, None nếu khớp.
+    """
+    procedure, fragment = PROCEDURE_SOURCES[name]
+    cursor.execute(
+        """
+        SELECT ROUTINE_DEFINITION FROM information_schema.ROUTINES
+        WHERE ROUTINE_SCHEMA = DATABASE() AND ROUTINE_NAME = %(p)s
+        """,
+        {"p": procedure}
+    )
+    row = cursor.fetchone()
+    if not row or not row.get("ROUTINE_DEFINITION"):
+        return f"không đọc được định nghĩa {procedure}"
+    if _normalize_sql(fragment) not in _normalize_sql(row["ROUTINE_DEFINITION"]):
+        return f"{procedure} đã đổi, cập nhật lại truy vấn trong PIPELINE_QUERIES"
+    return None
+
+
+def _single_partition(row):
+    # fact_product_price partition theo ngày: quét hết 1 partition đã prune = đúng dữ liệu của ngày
+    partitions = row.get("partitions")
+    return bool(partitions) and "," not in partitions and partitions != "p_future"
+
+
+def explain(cursor, sql, load_date):
+    cursor.execute("EXPLAIN " + sql, {"d": load_date})
+    return cursor.fetchall()
+
+
+def check_query_plans(load_date):
+    failures = []
+    connections = {}
+    try:
+        for name, db_name, sql, allowed in PIPELINE_QUERIES:
+            if db_name not in connections:
+                connections[db_name] = get_connection(db_name)
+            cursor = connections[db_name].cursor(dictionary=True)
+
+            if name in PROCEDURE_SOURCES:
+                drift = procedure_drift(cursor, name)
+                if drift:
+                    failures.append(name)
+                    print(f"❌ {name}: {drift}")
+                    continue
+
+            plan = explain(cursor, sql, load_date)
+            full_scans = [
+                row for row in plan
+                if row.get("type") in FULL_SCAN_TYPES
+                and row.get("table") not in allowed
+                and not _single_partition(row)
+            ]
+            if full_scans:
+                failures.append(name)
+                print(f"❌ {name}")
+                for row in full_scans:
+                    print(f"   -> {row.get('table')}: type={row.get('type')}, "
+                          f"key={row.get('key')}, rows={row.get('rows')}")
+            else:
+                keys = ", ".join(f"{row.get('table')}:{row.get('key') or row.get('type')}" for row in plan)
+                print(f"✅ {name} ({keys})")
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+    if failures:
+        print(f"\n❌ {len(failures)}/{len(PIPELINE_QUERIES)} truy vấn quét toàn bộ bảng.")
+    else:
+        print(f"\n✅ {len(PIPELINE_QUERIES)} truy vấn đều dùng index/partition.")
+    return not failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail when a pipeline load_date query falls back to a full scan.")
+    parser.add_argument("--date", type=str, default=datetime.now().strftime('%Y-%m-%d'), help="YYYY-MM-DD")
+    args = parser.parse_args()
+
+    sys.exit(0 if check_query_plans(args.date) else 1)
@@ -0,0 +1,134 @@
+import sys
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+import pandas as pd
+from db_pool import get_connection
+from transform_engine import plan_transform
+
+# So sánh engine pandas với stored procedure trên cùng partition stg_products:
+#   1. engine tính delta (không ghi standardized/fact)
+#   2. chạy procedure thật, đọc lại phần nó đã ghi
+#   3. so khớp transformed / dòng bị đóng / dòng standardized mới / dòng fact mới
+# LƯU Ý: bước 2 ghi vào staging -> chạy trên DB dev/bản sao, không chạy trên production.
+
+SAMPLE_SIZE = 5
+
+
+def _rows(cursor, query, params=None):
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+def _key(values):
+    # Chuẩn hóa kiểu (bytearray/Decimal/int64 từ pandas) để so sánh được
+    normalized = []
+    for value in values:
+        if isinstance(value, (bytes, bytearray)):
+            normalized.append(bytes(value).hex())
+        elif value is None or pd.isna(value):
+            normalized.append(None)
+        elif hasattr(value, "item"):
+            normalized.append(value.item())
+        else:
+            normalized.append(value)
+    return tuple(normalized)
+
+
+def compare(label, engine_rows, proc_rows):
+    engine_counts = Counter(_key(r) for r in engine_rows)
+    proc_counts = Counter(_key(r) for r in proc_rows)
+    only_engine = engine_counts - proc_counts
+    only_proc = proc_counts - engine_counts
+
+    if not only_engine and not only_proc:
+        print(f"✅ {label}: khớp ({sum(engine_counts.values())} dòng)")
+        return True
+
+    print(f"❌ {label}: engine {sum(engine_counts.values())} dòng, procedure {sum(proc_counts.values())} dòng")
+    for name, diff in (("chỉ có ở engine", only_engine), ("chỉ có ở procedure", only_proc)):
+        if diff:
+            print(f"   {name}: {sum(diff.values())} dòng, ví dụ:")
+            for row in list(diff.elements())[:SAMPLE_SIZE]:
+                print(f"     {row}")
+    return False
+
+
+def check_parity(load_date, procedure_name):
+    load_date = datetime.strptime(load_date, '%Y-%m-%d').date()
+    expire_date = load_date - timedelta(days=1)
+    conn = None
+    try:
+        conn = get_connection('STAGING')
+        cursor = conn.cursor()
+
+        print(f"🧮 Engine pandas: tính delta ngày {load_date}...")
+        plan = plan_transform(cursor, load_date)
+        conn.commit()
+
+        active_before = {r[0] for r in _rows(cursor, "SELECT id FROM stg_products_standardized WHERE is_active = 1")}
+        max_std_id = _rows(cursor, "SELECT COALESCE(MAX(id), 0) FROM stg_products_standardized")[0][0]
+        max_fact_id = _rows(cursor, "SELECT COALESCE(MAX(fact_id), 0) FROM fact_product_price")[0][0]
+
+        print(f"⚡ Procedure: {procedure_name}('{load_date}')...")
+        cursor.callproc(procedure_name, [load_date])
+        for result in cursor.stored_results():
+            result.fetchall()
+        conn.commit()
+
+        proc_transformed = _rows(
+            cursor,
+            "SELECT name, province, price, DATE(`date`), product_id, province_id, row_hash "
+            "FROM stg_products_transformed"
+        )
+        proc_closed = [
+            r for r in _rows(
+                cursor,
+                "SELECT id FROM stg_products_standardized WHERE is_active = 0 AND expire_date = %s AND id <= %s",
+                (expire_date, max_std_id)
+            ) if r[0] in active_before
+        ]
+        proc_inserted = _rows(
+            cursor,
+            "SELECT product_id, province_id, price, row_hash, date_id FROM stg_products_standardized WHERE id > %s",
+            (max_std_id,)
+        )
+        proc_fact = _rows(
+            cursor,
+            "SELECT product_id, province_id, date_id, price FROM fact_product_price WHERE fact_id > %s",
+            (max_fact_id,)
+        )
+    finally:
+        if conn:
+            conn.close()
+
+    transformed = plan["transformed"]
+    results = [
+        compare(
+            "transformed",
+            transformed[["name", "province", "price_value", "date_value",
+                         "product_id", "province_id", "row_hash"]].astype(object).itertuples(index=False),
+            proc_transformed
+        ),
+        compare("standardized đóng", plan["close"][["id"]].itertuples(index=False), proc_closed),
+        compare(
+            "standardized mới",
+            plan["insert"][["product_id", "province_id", "price", "row_hash", "date_id"]].itertuples(index=False),
+            proc_inserted
+        ),
+        compare(
+            "fact mới",
+            plan["fact_insert"][["product_id", "province_id", "date_id", "price"]].itertuples(index=False),
+            proc_fact
+        ),
+    ]
+    return all(results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check pandas transform engine against the stored procedure.")
+    parser.add_argument("--date", type=str, required=True, help="Load date YYYY-MM-DD (partition of stg_products)")
+    parser.add_argument("--procedure", type=str, default="sp_transform_products", help="Reference procedure")
+    args = parser.parse_args()
+
+    sys.exit(0 if check_parity(args.date, args.procedure) else 1)
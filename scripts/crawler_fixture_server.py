@@ -0,0 +1,116 @@
+import os
+import json
+import hashlib
+import argparse
+from urllib.parse import parse_qsl, urljoin
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Các field thay đổi theo mỗi lần tải trang -> không đưa vào khóa fixture
+VOLATILE_FIELDS = {"__VIEWSTATE", "__VIEWSTATEGENERATOR", "__EVENTVALIDATION", "__PREVIOUSPAGE", "__LASTFOCUS"}
+# Header trả lại cho client khi replay
+REPLAY_HEADERS = ("Content-Type", "Content-Disposition")
+
+
+def stable_fields(body=b""):
+    """
+    Các field form của request, đã sắp xếp, bỏ field viewstate.
+    """
+    return sorted(
+        (k, v) for k, v in parse_qsl(body.decode("utf-8"), keep_blank_values=True)
+        if k not in VOLATILE_FIELDS
+    )
+
+
+def fixture_key(method, path, body=b""):
+    """
+    Khóa của 1 request: method + path + các field form (bỏ field viewstate).
+    """
+    raw = json.dumps([method, path, stable_fields(body)], ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def make_handler(fixture_dir, upstream=None):
+    """
+    - upstream = None: REPLAY, trả response đã ghi trong fixture_dir.
+    - upstream = URL gốc: RECORD, chuyển tiếp tới website thật và ghi response lại.
+    """
+    session = requests.Session() if upstream else None
+
+    class FixtureHandler(BaseHTTPRequestHandler):
+        def _handle(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length) if length else b""
+            key = fixture_key(method, self.path, body)
+            body_path = os.path.join(fixture_dir, f"{key}.body")
+            meta_path = os.path.join(fixture_dir, f"{key}.json")
+
+            if upstream:
+                response = session.request(
+                    method, urljoin(upstream, self.path), data=body or None,
+                    headers={"Content-Type": self.headers.get("Content-Type", "")} if body else None,
+                    timeout=120
+                )
+                meta = {
+                    "status": response.status_code,
+                    "headers": {h: response.headers[h] for h in REPLAY_HEADERS if h in response.headers},
+                    "request": {"method": method, "path": self.path, "fields": stable_fields(body)},
+                }
+                with open(body_path, "wb") as f:
+                    f.write(response.content)
+                with open(meta_path, "w", encoding="utf-8") as f:
+                    json.dump(meta, f, ensure_ascii=False, indent=2)
+                content = response.content
+            else:
+                if not os.path.exists(meta_path):
+                    self.send_error(404, f"No fixture for {method} {self.path} ({key})")
+                    return
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                with open(body_path, "rb") as f:
+                    content = f.read()
+
+            self.send_response(meta["status"])
+            for name, value in meta["headers"].items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_POST(self):
+            self._handle("POST")
+
+        def log_message(self, fmt, *args):
+            print(f"[fixture] {self.command} {self.path} -> {fmt % args}")
+
+    return FixtureHandler
+
+
+def serve(fixture_dir, host="127.0.0.1", port=8765, upstream=None):
+    os.makedirs(fixture_dir, exist_ok=True)
+    server = ThreadingHTTPServer((host, port), make_handler(fixture_dir, upstream))
+    mode = f"RECORD từ {upstream}" if upstream else "REPLAY"
+    print(f"🧪 Fixture server ({mode}) tại http://{host}:{server.server_port} - thư mục {fixture_dir}")
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record/replay fixture server for the HTTP crawler.")
+    parser.add_argument("--dir", default="./fixtures/crawler", help="Fixture directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--record", metavar="UPSTREAM", default=None,
+                        help="Record mode: forward to this origin (e.g. https://thitruongnongsan.gov.vn)")
+    args = parser.parse_args()
+
+    # Cách dùng: chạy --record một lần, sau đó đặt source_url = http://host:port/vn/nguonwmy.aspx
+    # và CRAWLER_MODE = http để chạy extract_http trên dữ liệu đã ghi.
+    server = serve(args.dir, args.host, args.port, args.record)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,126 @@
+import threading
+import time
+from mysql.connector import pooling, errors
+from load_config import load_config
+
+# 1. load config
+config = load_config()
+
+DB_CONFIGS = config["DB_CONFIGS"]
+
+# Cấu hình pool (config.yaml -> DB_POOL), có thể ghi đè kích thước theo từng DB
+POOL_CONFIG = config.get('DB_POOL') or {}
+DEFAULT_POOL_SIZE = int(POOL_CONFIG.get('pool_size', 4))
+MAX_POOL_SIZE = 32  # Giới hạn cứng của mysql.connector.pooling
+CHECKOUT_TIMEOUT = float(POOL_CONFIG.get('checkout_timeout', 30))
+POOL_SIZES = POOL_CONFIG.get('sizes') or {}
+
+# Các DB cần LOAD DATA LOCAL INFILE từ phía client
+LOCAL_INFILE_DBS = {'STAGING', 'DW', 'M1D'}
+
+_pools = {}
+_metrics = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_size(db_name):
+    size = int(POOL_SIZES.get(db_name, DEFAULT_POOL_SIZE))
+    return max(1, min(size, MAX_POOL_SIZE))
+
+
+def _get_pool(db_name):
+    """
+    Lấy (hoặc tạo lần đầu) pool cho 1 DB theo tên trong DB_CONFIGS.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_name)
+        if pool is not None:
+            return pool
+
+        if db_name not in DB_CONFIGS:
+            raise ValueError(f"Tên DB '{db_name}' không hợp lệ. Chọn một trong: {list(DB_CONFIGS.keys())}")
+
+        db_config = dict(DB_CONFIGS[db_name])
+        if db_name in LOCAL_INFILE_DBS:
+            db_config['allow_local_infile'] = True
+
+        pool = pooling.MySQLConnectionPool(
+            pool_name=f"etl_{db_name.lower()}",
+            pool_size=_pool_size(db_name),
+            pool_reset_session=True,
+            **db_config
+        )
+        _pools[db_name] = pool
+        _metrics[db_name] = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'health_check_failures': 0,
+            'exhausted': 0,
+        }
+        return pool
+
+
+def get_connection(db_name):
+    """
+    Mượn 1 connection từ pool của db_name (CONTROL/STAGING/DW/M1D).
+    Gọi conn.close() như bình thường để trả connection về pool.
+    """
+    pool = _get_pool(db_name)
+    metrics = _metrics[db_name]
+    started = time.monotonic()
+    waited = False
+
+    while True:
+        try:
+            conn = pool.get_connection()
+            break
+        except errors.PoolError:
+            # Pool đang hết connection rảnh -> chờ thay vì mở thêm connection mới
+            waited = True
+            if time.monotonic() - started > CHECKOUT_TIMEOUT:
+                with _pools_lock:
+                    metrics['exhausted'] += 1
+                raise
+            time.sleep(0.05)
+
+    # Health-check khi checkout: ping, nếu hỏng thì reconnect
+    try:
+        conn.ping(reconnect=False)
+    except errors.Error:
+        with _pools_lock:
+            metrics['health_check_failures'] += 1
+        try:
+            conn.reconnect(attempts=3, delay=1)
+        except errors.Error:
+            conn.close()
+            raise
+
+    with _pools_lock:
+        metrics['checkouts'] += 1
+        if waited:
+            metrics['waits'] += 1
+            metrics['wait_seconds'] += time.monotonic() - started
+
+    return conn
+
+
+def pool_metrics():
+    """
+    Trả về số liệu của từng pool: kích thước, số connection rảnh, số lần mượn/chờ/lỗi.
+    """
+    result = {}
+    with _pools_lock:
+        for db_name, pool in _pools.items():
+            stats = dict(_metrics[db_name])
+            stats['pool_size'] = pool.pool_size
+            stats['idle'] = pool._cnx_queue.qsize()
+            stats['in_use'] = pool.pool_size - stats['idle']
+            stats['wait_seconds'] = round(stats['wait_seconds'], 3)
+            result[db_name] = stats
+    return result
+
+
+def print_pool_metrics():
+    for db_name, stats in pool_metrics().items():
+        print(f"[POOL {db_name}] " + ", ".join(f"{k}={v}" for k, v in stats.items()))
@@ -0,0 +1,95 @@
+import threading
+from db_pool import get_connection
+from normalize import name_key
+
+# Dimension: (bảng, cột khóa, cột tên)
+DIMENSIONS = {
+    "product": ("dim_product", "product_id", "product_name"),
+    "province": ("dim_province", "province_id", "province_name"),
+}
+
+
+class DimKeyCache:
+    """
+    Map name -> id của 1 dimension, nạp 1 lần mỗi lần chạy.
+    - resolve(): trả id cho các tên, chỉ INSERT thành viên thật sự mới
+      (anti-join, không đốt AUTO_INCREMENT như INSERT IGNORE).
+    """
+
+    def __init__(self, dimension, db_name='STAGING'):
+        self.table, self.id_column, self.name_column = DIMENSIONS[dimension]
+        self.db_name = db_name
+        self._keys = None
+        self._lock = threading.Lock()
+        self.stats = {"loaded": 0, "inserted": 0}
+
+    def _load(self, cursor):
+        cursor.execute(f"SELECT {self.name_column}, {self.id_column} FROM {self.table}")
+        self._keys = {name_key(name): key for name, key in cursor.fetchall()}
+        self.stats["loaded"] = len(self._keys)
+
+    def _insert_missing(self, cursor, names):
+        cursor.executemany(
+            f"""
+            INSERT INTO {self.table} ({self.name_column})
+            SELECT %s FROM DUAL
+            WHERE NOT EXISTS (SELECT 1 FROM {self.table} WHERE {self.name_column} = %s)
+            """,
+            [(name, name) for name in names]
+        )
+        self.stats["inserted"] += max(cursor.rowcount, 0)
+
+        placeholders = ", ".join(["%s"] * len(names))
+        cursor.execute(
+            f"SELECT {self.name_column}, {self.id_column} FROM {self.table} "
+            f"WHERE {self.name_column} IN ({placeholders})",
+            list(names)
+        )
+        for name, key in cursor.fetchall():
+            self._keys[name_key(name)] = key
+
+    def resolve(self, names):
+        """
+        Trả về {tên gốc: id} cho các tên (bỏ qua tên rỗng).
+        """
+        wanted = {name.strip() for name in names if name and name.strip()}
+        with self._lock:
+            missing = wanted if self._keys is None else {
+                name for name in wanted if name_key(name) not in self._keys
+            }
+            if missing:
+                conn = None
+                try:
+                    conn = get_connection(self.db_name)
+                    cursor = conn.cursor()
+                    if self._keys is None:
+                        self._load(cursor)
+                        missing = {name for name in wanted if name_key(name) not in self._keys}
+                    if missing:
+                        self._insert_missing(cursor, sorted(missing))
+                        conn.commit()
+                finally:
+                    if conn:
+                        conn.close()
+
+            return {name: self._keys.get(name_key(name)) for name in wanted}
+
+    def get(self, name):
+        if not name or self._keys is None:
+            return None
+        return self._keys.get(name_key(name))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_dim_key_cache(dimension, db_name='STAGING'):
+    """
+    Cache dùng chung trong process (1 run pipeline = 1 lần nạp map).
+    """
+    with _caches_lock:
+        key = (dimension, db_name)
+        if key not in _caches:
+            _caches[key] = DimKeyCache(dimension, db_name)
+        return _caches[key]
@@ -0,0 +1,92 @@
+from dim_keys import DIMENSIONS
+
+# Bảng dim -> tên dimension ("dim_product" -> "product")
+DIM_TABLES = {table: dimension for dimension, (table, _, _) in DIMENSIONS.items()}
+
+
+def create_dim_stage(cursor, dimension):
+    """
+    Tạo bảng tạm (TEMPORARY, riêng cho session) để nạp dim trước khi merge.
+    Không gây implicit commit -> dùng được bên trong transaction của lần load.
+    """
+    table, id_column, name_column = DIMENSIONS[dimension]
+    stage = f"tmp_{table}"
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {stage}")
+    cursor.execute(
+        f"CREATE TEMPORARY TABLE {stage} ("
+        f"{id_column} INT NOT NULL PRIMARY KEY, {name_column} VARCHAR(100)"
+        f")"
+    )
+    return stage
+
+
+def merge_dimension(cursor, dimension, stage):
+    """
+    Merge bảng tạm vào dim bằng INSERT ... ON DUPLICATE KEY UPDATE theo khóa id
+    (id do staging cấp, fact DW tham chiếu qua FK), chỉ đụng tới dòng mới / đổi tên.
+    So tên bằng utf8mb4_bin: collation ai_ci coi "Ha Noi" = "Hà Nội" nên sẽ bỏ sót đổi dấu / hoa thường.
+    Returns: (new, changed) - đếm trước khi merge trong cùng transaction.
+    """
+    table, id_column, name_column = DIMENSIONS[dimension]
+
+    cursor.execute(
+        f"""
+        SELECT COALESCE(SUM(d.{id_column} IS NULL), 0),
+               COALESCE(SUM(d.{id_column} IS NOT NULL AND NOT (d.{name_column} <=> s.{name_column} COLLATE utf8mb4_bin)), 0)
+        FROM {stage} s
+        LEFT JOIN {table} d ON d.{id_column} = s.{id_column}
+        """
+    )
+    new, changed = (int(n) for n in cursor.fetchone())
+
+    if new or changed:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} ({id_column}, {name_column})
+            SELECT src.{id_column}, src.{name_column}
+            FROM (
+                SELECT s.{id_column}, s.{name_column}
+                FROM {stage} s
+                LEFT JOIN {table} d ON d.{id_column} = s.{id_column}
+                WHERE d.{id_column} IS NULL
+                   OR NOT (d.{name_column} <=> s.{name_column} COLLATE utf8mb4_bin)
+            ) src
+            ON DUPLICATE KEY UPDATE {name_column} = src.{name_column}
+            """
+        )
+
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {stage}")
+    return new, changed
+
+
+def upsert_dimension(cursor, dimension, rows=None, select_sql=None, params=None, csv_path=None):
+    """
+    Nạp dim vào bảng tạm rồi merge. Nguồn (chọn 1):
+    - rows: list (id, name) -> executemany
+    - select_sql: SELECT (id, name) chạy trên cùng server (INSERT ... SELECT)
+    - csv_path: file CSV export (LOAD DATA LOCAL INFILE)
+    Returns: (new, changed)
+    """
+    table, id_column, name_column = DIMENSIONS[dimension]
+    stage = create_dim_stage(cursor, dimension)
+
+    if csv_path is not None:
+        csv_path_normalized = csv_path.replace("\\", "/")
+        cursor.execute(
+            f"""
+            LOAD DATA LOCAL INFILE '{csv_path_normalized}'
+            INTO TABLE {stage}
+            FIELDS TERMINATED BY ','
+            ENCLOSED BY '"'
+            LINES TERMINATED BY '\\n'
+            """
+        )
+    elif select_sql is not None:
+        cursor.execute(f"INSERT INTO {stage} ({id_column}, {name_column}) {select_sql}", params)
+    elif rows:
+        cursor.executemany(
+            f"INSERT INTO {stage} ({id_column}, {name_column}) VALUES (%s, %s)",
+            rows
+        )
+
+    return merge_dimension(cursor, dimension, stage)
@@ -0,0 +1,131 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# Hằng số inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+# File tạm của Chromium khi đang tải
+PARTIAL_SUFFIXES = (".crdownload", ".tmp", ".part")
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _load_libc()
+
+
+def _is_final(name, suffixes):
+    lowered = name.lower()
+    if lowered.endswith(PARTIAL_SUFFIXES):
+        return False
+    return lowered.endswith(suffixes)
+
+
+class DownloadWatcher:
+    """
+    Theo dõi 1 thư mục tải riêng của job và báo khi file tải về đã hoàn tất
+    (Chromium đổi tên *.crdownload -> tên thật).
+    - Linux: dùng inotify (IN_MOVED_TO / IN_CLOSE_WRITE), không polling.
+    - Nơi khác: quét thư mục mỗi 0.1s.
+    Tạo watcher TRƯỚC khi click tải để không bỏ lỡ sự kiện.
+    """
+
+    def __init__(self, directory, suffixes=("xls",)):
+        self.directory = os.path.abspath(directory)
+        self.suffixes = tuple(s.lower() for s in suffixes)
+        self._fd = None
+
+        if _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                wd = _libc.inotify_add_watch(fd, self.directory.encode(), IN_CLOSE_WRITE | IN_MOVED_TO)
+                if wd >= 0:
+                    self._fd = fd
+                else:
+                    os.close(fd)
+
+    def _scan(self):
+        pending = False
+        found = None
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.lower().endswith(PARTIAL_SUFFIXES):
+                pending = True
+            elif _is_final(entry.name, self.suffixes):
+                found = entry.path
+        return None if pending else found
+
+    def _read_events(self):
+        names = []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return names
+            raise
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "replace")
+            offset += length
+            if name:
+                names.append(name)
+        return names
+
+    def wait(self, timeout=60):
+        """
+        Chờ tới khi có file hoàn tất. Trả về đường dẫn file, hoặc None nếu hết thời gian.
+        """
+        deadline = time.monotonic() + timeout
+
+        # File có thể đã về trước khi gọi wait()
+        path = self._scan()
+        if path:
+            return path
+
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+
+            if self._fd is not None:
+                ready, _, _ = select.select([self._fd], [], [], remaining)
+                if not ready:
+                    return None
+                if any(_is_final(name, self.suffixes) for name in self._read_events()):
+                    path = self._scan()
+                    if path:
+                        return path
+            else:
+                time.sleep(min(0.1, remaining))
+                path = self._scan()
+                if path:
+                    return path
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,13 +1,13 @@
 import os
-import time
-import glob
-import pandas as pd
+import shutil
+import tempfile
 import argparse
 from datetime import datetime
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import Select, WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException
 from mysql.connector import Error
 from datetime import datetime, timedelta
 
@@ -17,47 +17,80 @@ from log_manager import log_process_action, log_conf_action
 from param_sync import get_parameter_value
 from send_mail import send_email
 from load_config import load_config
+from browser_pool import get_browser_pool
+from html_export import convert_export_to_csv, convert_export_to_batch, ExportBatch
+from download_watcher import DownloadWatcher
+from watermark import get_watermark, advance_watermark
+from file_hash import file_sha256, get_previous_hash, record_file_hash, HASH_NEW, HASH_UNCHANGED
 
 # --- CẤU HÌNH PROCESS ---
 PROCESS_NAME = "crawling"
 PROCESS_ID = 1  # ID trong bảng process_config
 SEND_TO_EMAIL = get_parameter_value('SEND_TO_EMAIL')
 source_url = get_parameter_value('source_url')
-
-def download_nong_san_html_to_csv(start_date: str, end_date: str, download_dir: str = "./staging"):
+BROWSER_POOL_SIZE = int(get_parameter_value('BROWSER_POOL_SIZE') or 2)
+BROWSER_MAX_USES = int(get_parameter_value('BROWSER_MAX_USES') or 20)
+# selenium (mặc định) hoặc http (post thẳng form ASP.NET, không cần trình duyệt)
+CRAWLER_MODE = (get_parameter_value('CRAWLER_MODE') or "selenium").strip().lower()
+DOWNLOAD_TIMEOUT = 60  # Giây chờ tối đa cho file Excel tải về
+# file (mặc định): ghi CSV rồi LOAD DATA | direct: giữ dòng trong bộ nhớ, insert thẳng vào staging
+STAGING_LOAD_MODE = (get_parameter_value('STAGING_LOAD_MODE') or "file").strip().lower()
+# Chế độ direct: vẫn lưu CSV làm bản lưu trữ (1) hay không (0)
+STAGING_ARCHIVE_CSV = str(get_parameter_value('STAGING_ARCHIVE_CSV') or "0").strip() == "1"
+DEFAULT_WINDOW_DAYS = 7  # Cửa sổ crawl khi chưa có watermark
+# Số ngày crawl lại trước watermark để nhận dữ liệu cập nhật trễ
+CRAWL_OVERLAP_DAYS = int(get_parameter_value('CRAWL_OVERLAP_DAYS') or 1)
+
+def download_nong_san_html_to_csv(start_date: str, end_date: str, download_dir: str = "./staging", direct=False):
     """
     Hàm logic chính: Tải và xử lý dữ liệu từ thitruongnongsan.gov.vn
-    Trả về: (csv_path, record_count)
+    Trả về: (csv_path, record_count), hoặc (ExportBatch, record_count) nếu direct=True
     """
     # 1. Tạo thư mục lưu trữ
     os.makedirs(download_dir, exist_ok=True)
 
-    # 2. Cấu hình Chrome (Bắt buộc cho Docker)
-    chrome_options = webdriver.ChromeOptions()
-    chrome_options.binary_location = "/usr/bin/chromium"  # Quan trọng cho Docker
-    
-    prefs = {
-        "download.default_directory": os.path.abspath(download_dir),
-        "download.prompt_for_download": False,
-        "download.directory_upgrade": True,
-        "safebrowsing.enabled": True
-    }
-    chrome_options.add_experimental_option("prefs", prefs)
-    
-    # Các cờ bắt buộc khi chạy trong container
-    chrome_options.add_argument("--headless=new")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    chrome_options.add_argument("--disable-gpu")
-    chrome_options.add_argument("--window-size=1920,1080")
-
-    driver = webdriver.Chrome(options=chrome_options)
+    # 2. Mỗi job tải vào thư mục riêng -> các crawl chạy song song không xóa/nhặt nhầm file của nhau
+    job_dir = tempfile.mkdtemp(prefix="job_", dir=download_dir)
+
+    # 3. Mượn Chromium đã khởi động sẵn từ pool (đang ở trang source_url, form sạch)
+    pool = get_browser_pool(source_url, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES, download_dir=download_dir)
+    try:
+        with pool.driver() as driver:
+            return _download_with_driver(driver, start_date, end_date, download_dir, job_dir, direct)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def _dependent_option_loaded(select_id, option_text):
+    """
+    Điều kiện chờ: dropdown phụ thuộc đã được postback nạp lựa chọn option_text.
+    """
+    def _condition(driver):
+        try:
+            options = Select(driver.find_element(By.ID, select_id)).options
+            return any(o.text.strip() == option_text for o in options)
+        except (NoSuchElementException, StaleElementReferenceException):
+            return False
+    return _condition
+
+
+def _download_with_driver(driver, start_date, end_date, download_dir, job_dir, direct=False):
+    """
+    Thao tác form trên 1 driver đã mở source_url, tải file Excel về job_dir
+    và lưu CSV vào download_dir.
+    """
     wait = WebDriverWait(driver, 30) # Tăng thời gian chờ lên 30s cho mạng chậm
 
+    # Driver dùng chung giữa các lần gọi -> đặt thư mục tải riêng cho job này
+    driver.execute_cdp_cmd("Page.setDownloadBehavior", {
+        "behavior": "allow",
+        "downloadPath": os.path.abspath(job_dir)
+    })
+
     try:
         print(f"🌐 Đang truy cập website... ({start_date} - {end_date})")
         # --- LOGIC CÀO DỮ LIỆU CỦA BẠN ---
-        driver.get(source_url)
+        # (Pool đã mở sẵn source_url và reset form sau mỗi lần dùng)
 
         # Nhập ngày
         date_from = wait.until(EC.presence_of_element_located((By.ID, "ctl00_maincontent_tu_ngay")))
@@ -69,7 +102,8 @@ def download_nong_san_html_to_csv(start_date: str, end_date: str, download_dir:
 
         # Chọn ngành hàng và nhóm sản phẩm
         Select(driver.find_element(By.ID, "ctl00_maincontent_Ngành_hàng")).select_by_visible_text("Rau, quả")
-        time.sleep(2) # Sleep nhẹ để dropdown load dữ liệu phụ thuộc
+        # Chờ postback nạp dropdown phụ thuộc (thay cho sleep cố định)
+        wait.until(_dependent_option_loaded("ctl00_maincontent_Nhóm_sản_phẩm", "Rau củ quả"))
         Select(driver.find_element(By.ID, "ctl00_maincontent_Nhóm_sản_phẩm")).select_by_visible_text("Rau củ quả")
 
         # Nhấn nút "Xem"
@@ -89,54 +123,29 @@ def download_nong_san_html_to_csv(start_date: str, end_date: str, download_dir:
             print(f"⚠️ Không có dữ liệu hoặc nút tải không hiện trong khoảng {start_date} - {end_date}.")
             return None, 0
 
-        # Xóa file cũ (xls) trong thư mục để tránh nhầm lẫn
-        for f in glob.glob(os.path.join(download_dir, "*.xls")):
-            os.remove(f)
-
-        # Click tải Excel
+        # Click tải Excel (watcher tạo trước khi click để không lỡ sự kiện)
         print("⬇️ Đang tải file Excel...")
-        driver.execute_script("arguments[0].click();", excel_btn)
-
-        # Chờ file xuất hiện (Loop check)
-        html_path = None
-        for _ in range(20):
-            files = glob.glob(os.path.join(download_dir, "*xls"))
-            if files:
-                html_path = files[0]
-                break
-            time.sleep(1)
+        with DownloadWatcher(job_dir, suffixes=("xls",)) as watcher:
+            driver.execute_script("arguments[0].click();", excel_btn)
+            # Chờ Chromium hoàn tất file (*.crdownload -> *.xls)
+            html_path = watcher.wait(timeout=DOWNLOAD_TIMEOUT)
 
         if not html_path:
             raise Exception("Đã click tải nhưng không thấy file về thư mục.")
 
-        # --- XỬ LÝ FILE (CONVERT TO CSV) ---
-        print(f"📂 Đã tải: {html_path}. Đang chuyển đổi sang CSV...")
-        
-        # Đọc bảng HTML (File đuôi .xls của web này thực chất là HTML)
-        dfs = pd.read_html(html_path)
-        if not dfs:
-            raise Exception("File tải về không chứa bảng dữ liệu nào.")
-        df = dfs[0]
-
-        # Tạo tên file CSV chuẩn
-        safe_start = start_date.replace("/", "-")
-        safe_end = end_date.replace("/", "-")
-        csv_name = f"nong_san_{safe_start}_{safe_end}.csv"
-        csv_path = os.path.join(download_dir, csv_name)
-
-        # Lưu CSV
-        df.to_csv(csv_path, index=False, encoding="utf-8-sig")
-        print(f"✅ Đã lưu CSV: {csv_path}")
+        # --- XỬ LÝ FILE (CONVERT TO CSV / DIRECT-LOAD) ---
+        if direct:
+            result, record_count = convert_export_to_batch(html_path, start_date, end_date)
+        else:
+            result, record_count = convert_export_to_csv(html_path, start_date, end_date, download_dir)
         
         # Dọn dẹp file rác
         os.remove(html_path)
         
-        return csv_path, len(df)
+        return result, record_count
 
     except Exception as e:
         raise e # Ném lỗi ra ngoài để hàm run_crawling bắt và log
-    finally:
-        driver.quit()
 
 import argparse
 import sys
@@ -146,11 +155,35 @@ from datetime import datetime, timedelta
 
 # ... (Giữ nguyên phần cấu hình và hàm download_nong_san_html_to_csv ở trên) ...
 
-def run_crawling(target_date=None, force_run=False):
+def crawl_window_start(current_date, use_watermark=True):
+    """
+    Ngày bắt đầu cửa sổ crawl:
+    - Có watermark: từ (watermark - CRAWL_OVERLAP_DAYS) tới target_date, chỉ lấy phần chưa có.
+    - Chưa có watermark (hoặc use_watermark=False): 7 ngày gần nhất như trước.
+    """
+    current_date = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    fallback = current_date - timedelta(days=DEFAULT_WINDOW_DAYS)
+
+    watermark = get_watermark(PROCESS_ID) if use_watermark else None
+    if watermark is None:
+        return fallback
+
+    start_date = datetime(watermark.year, watermark.month, watermark.day) - timedelta(days=CRAWL_OVERLAP_DAYS)
+    # Watermark cũ (pipeline ngưng vài ngày) -> cửa sổ tự nới ra, không bỏ sót ngày nào.
+    # Chạy lại ngày <= watermark -> chỉ crawl đúng ngày đó.
+    return min(start_date, current_date)
+
+
+def run_crawling(target_date=None, force_run=False, staging_dir=None, use_watermark=True, load_mode=None):
     """
     Hàm điều phối việc chạy Crawl:
     - target_date: Ngày mốc (YYYY-MM-DD). Nếu None lấy ngày hiện tại.
     - force_run: Nếu True sẽ bỏ qua check log (nếu có logic check log).
+    - staging_dir: Thư mục lưu file (mặc định lấy tham số STAGING_DIR).
+    - use_watermark: Crawl từ watermark thay vì cửa sổ 7 ngày cố định.
+    - load_mode: file | direct (mặc định tham số STAGING_LOAD_MODE).
+    Trả về: (csv_path, record_count); csv_path = None nếu không có dữ liệu.
+    Chế độ direct trả về (ExportBatch, record_count) thay cho csv_path.
     """
     # [QUAN TRỌNG] Khởi tạo start_time ngay đầu hàm
     start_time = datetime.now() 
@@ -162,13 +195,13 @@ def run_crawling(target_date=None, force_run=False):
             current_date = datetime.strptime(target_date, '%Y-%m-%d')
         except ValueError:
             print(f"❌ Lỗi định dạng ngày: {target_date}. Vui lòng dùng định dạng YYYY-MM-DD")
-            return None
+            return None, 0
     else:
         current_date = datetime.now()
 
-    # Giả sử logic cào là lấy dữ liệu 7 ngày gần nhất tính từ target_date
+    # Cửa sổ crawl: từ watermark (ngày cuối đã vào staging, trừ overlap) tới target_date
     end_date_str = current_date.strftime('%d/%m/%Y')
-    start_date = current_date - timedelta(days=7)
+    start_date = crawl_window_start(current_date, use_watermark)
     start_date_str = start_date.strftime('%d/%m/%Y')
 
     print(f"--- BẮT ĐẦU EXTRACT DATA (Force={force_run}) ---")
@@ -187,19 +220,53 @@ def run_crawling(target_date=None, force_run=False):
             message=f"Range: {start_date_str}-{end_date_str}"
         )
 
-        staging_dir = get_parameter_value('STAGING_DIR') or "./staging"
+        staging_dir = staging_dir or get_parameter_value('STAGING_DIR') or "./staging"
         
-        # Gọi hàm crawl (Hàm này bạn đã định nghĩa ở trên)
-        csv_path, record_count = download_nong_san_html_to_csv(start_date_str, end_date_str, staging_dir)
+        # Gọi hàm crawl theo chế độ cấu hình (CRAWLER_MODE, STAGING_LOAD_MODE)
+        direct = (load_mode or STAGING_LOAD_MODE) == "direct"
+        if CRAWLER_MODE == "http":
+            from extract_http import download_nong_san_http
+            result, record_count = download_nong_san_http(source_url, start_date_str, end_date_str, staging_dir, direct)
+        else:
+            result, record_count = download_nong_san_html_to_csv(start_date_str, end_date_str, staging_dir, direct)
 
         end_time = datetime.now()
         
-        if not csv_path:
+        if not result:
             msg = f"No data found for range {start_date_str}-{end_date_str}"
             print(msg)
             # Log SUCCESS nhưng record = 0
             log_process_action(PROCESS_ID, PROCESS_NAME, start_time, end_time, "CND", 0, 0, 0, msg)
-            return None
+            return None, 0
+
+        is_batch = isinstance(result, ExportBatch)
+        file_name = result.name if is_batch else os.path.basename(result)
+
+        # So hash nội dung với lần crawl gần nhất có cửa sổ chồng lấn đã nạp vào staging (LS)
+        # (chỉ ở chế độ chạy hằng ngày; --force hoặc backfill luôn load lại)
+        content_hash = result.sha256() if is_batch else file_sha256(result)
+        window_start, window_end = start_date.strftime('%Y-%m-%d'), current_date.strftime('%Y-%m-%d')
+        unchanged = (
+            use_watermark and not force_run
+            and get_previous_hash(window_start, window_end) == content_hash
+        )
+        record_file_hash(
+            window_start, window_end, content_hash, record_count, file_name,
+            HASH_UNCHANGED if unchanged else HASH_NEW
+        )
+
+        if unchanged:
+            msg = f"Unchanged: {file_name} trùng nội dung lần crawl trước ({content_hash[:12]})"
+            print(f"♻️ {msg}. Bỏ qua các bước sau.")
+            # Không xóa file: tên file chỉ phụ thuộc cửa sổ crawl nên có thể chính là file của lần trước
+            log_process_action(PROCESS_ID, PROCESS_NAME, start_time, end_time, "CU", record_count, 0, 0, msg)
+            # Trùng nội dung đã LS -> cửa sổ này đã có trong staging, đẩy watermark được
+            advance_watermark(PROCESS_ID, window_end)
+            return None, record_count
+
+        # Direct-load: CSV chỉ là bản lưu trữ tùy chọn
+        if is_batch and STAGING_ARCHIVE_CSV:
+            result.archive(staging_dir)
 
         # Log SUCCESS
         log_process_action(
@@ -209,11 +276,16 @@ def run_crawling(target_date=None, force_run=False):
             end_time=end_time,
             status="CS",
             records_extract=record_count,
-            message=f"Saved: {os.path.basename(csv_path)}"
+            message=f"Parsed: {file_name} (direct)" if is_batch else f"Saved: {file_name}"
         )
+
+        # Watermark KHÔNG đẩy ở đây: load_to_staging đẩy sau khi nạp thành công (LS)
         
-        print(f"✅ Hoàn thành! File lưu tại: {csv_path}")
-        return csv_path
+        if is_batch:
+            print(f"✅ Hoàn thành! {record_count} dòng giữ trong bộ nhớ (direct-load).")
+        else:
+            print(f"✅ Hoàn thành! File lưu tại: {result}")
+        return result, record_count
 
     except Exception as e:
         end_time = datetime.now()
@@ -239,9 +311,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run extract process manually.")
     parser.add_argument("--date", type=str, default=None, help="Format YYYY-MM-DD (e.g., 2025-11-23)")
     parser.add_argument("--force", action="store_true", help="Force run ignoring logs")
+    parser.add_argument("--full-window", action="store_true", help="Crawl the fixed 7-day window instead of starting from the watermark")
     
     args = parser.parse_args()
 
     # Chạy thực tế lấy tham số từ dòng lệnh
-    run_crawling(target_date=args.date, force_run=args.force)
+    run_crawling(target_date=args.date, force_run=args.force, use_watermark=not args.full_window)
     
\ No newline at end of file
@@ -0,0 +1,164 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from lxml import html as lxml_html
+
+from html_export import convert_export_to_csv, convert_export_to_batch
+
+# --- ID các control trên trang ASP.NET WebForms ---
+ID_TU_NGAY = "ctl00_maincontent_tu_ngay"
+ID_DEN_NGAY = "ctl00_maincontent_den_ngay"
+ID_NGANH_HANG = "ctl00_maincontent_Ngành_hàng"
+ID_NHOM_SAN_PHAM = "ctl00_maincontent_Nhóm_sản_phẩm"
+ID_XEM = "ctl00_maincontent_Xem"
+ID_GRID = "ctl00_maincontent_GridView1"
+ID_TAI_EXCEL = "ctl00_maincontent_tai_excel"
+
+NGANH_HANG_TEXT = "Rau, quả"
+NHOM_SAN_PHAM_TEXT = "Rau củ quả"
+
+HTTP_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+POSTBACK_RE = re.compile(r"__doPostBack\('([^']*)'")
+
+_local = threading.local()
+
+
+def get_http_session():
+    """
+    Session HTTP dùng lại connection (keep-alive) cho từng luồng crawl.
+    """
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        # Chỉ retry method idempotent (mặc định urllib3): POST postback ASP.NET gắn với
+        # __VIEWSTATE/__EVENTVALIDATION của trang vừa GET, gửi lại mù có thể lặp thao tác
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=(502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["User-Agent"] = "Mozilla/5.0 (X11; Linux x86_64) DW-ETL"
+        _local.session = session
+    return session
+
+
+def _parse(response):
+    response.raise_for_status()
+    return lxml_html.fromstring(response.content, base_url=response.url)
+
+
+def _element(doc, element_id):
+    try:
+        return doc.get_element_by_id(element_id)
+    except KeyError:
+        return None
+
+
+def _form_fields(doc):
+    """
+    Lấy toàn bộ giá trị form hiện tại (__VIEWSTATE, __EVENTVALIDATION, textbox, select...).
+    """
+    form = doc.forms[0]
+    fields = dict(form.form_values())
+    fields.setdefault("__EVENTTARGET", "")
+    fields.setdefault("__EVENTARGUMENT", "")
+    return form, fields
+
+
+def _option_value(doc, element_id, visible_text):
+    select = _element(doc, element_id)
+    if select is None:
+        raise Exception(f"Không tìm thấy dropdown {element_id}.")
+    for option in select.iter("option"):
+        if option.text_content().strip() == visible_text:
+            return select.get("name"), option.get("value", option.text_content().strip())
+    raise Exception(f"Dropdown {element_id} không có lựa chọn '{visible_text}'.")
+
+
+def _trigger_fields(doc, element_id, fields):
+    """
+    Giả lập click 1 control: nút submit gửi name=value, LinkButton dùng __EVENTTARGET.
+    """
+    control = _element(doc, element_id)
+    if control is None:
+        return None
+
+    fields = dict(fields)
+    if control.tag == "input":
+        fields[control.get("name")] = control.get("value", "")
+    else:
+        match = POSTBACK_RE.search(control.get("href", "") + control.get("onclick", ""))
+        fields["__EVENTTARGET"] = match.group(1) if match else control.get("name", "")
+    return fields
+
+
+def _post(session, form, fields, **kwargs):
+    url = form.action or form.base_url
+    return session.post(url, data=fields, timeout=HTTP_TIMEOUT, **kwargs)
+
+
+def download_nong_san_http(source_url, start_date, end_date, download_dir="./staging", direct=False):
+    """
+    Crawler không dùng trình duyệt: post thẳng form ASP.NET và tải file export.
+    Kết quả giống download_nong_san_html_to_csv: (csv_path, record_count),
+    hoặc (ExportBatch, record_count) nếu direct=True
+    """
+    os.makedirs(download_dir, exist_ok=True)
+    session = get_http_session()
+
+    print(f"🌐 [HTTP] Đang truy cập website... ({start_date} - {end_date})")
+
+    # 1. Lấy trang gốc (kèm __VIEWSTATE/__EVENTVALIDATION)
+    doc = _parse(session.get(source_url, timeout=HTTP_TIMEOUT))
+
+    # 2. Chọn ngành hàng -> postback để server nạp dropdown nhóm sản phẩm phụ thuộc
+    form, fields = _form_fields(doc)
+    fields[_element(doc, ID_TU_NGAY).get("name")] = start_date
+    fields[_element(doc, ID_DEN_NGAY).get("name")] = end_date
+    nganh_name, nganh_value = _option_value(doc, ID_NGANH_HANG, NGANH_HANG_TEXT)
+    fields[nganh_name] = nganh_value
+    fields["__EVENTTARGET"] = nganh_name
+    doc = _parse(_post(session, form, fields))
+
+    # 3. Chọn nhóm sản phẩm + nhấn "Xem"
+    form, fields = _form_fields(doc)
+    fields["__EVENTTARGET"] = ""
+    fields[_element(doc, ID_TU_NGAY).get("name")] = start_date
+    fields[_element(doc, ID_DEN_NGAY).get("name")] = end_date
+    fields[nganh_name] = nganh_value
+    nhom_name, nhom_value = _option_value(doc, ID_NHOM_SAN_PHAM, NHOM_SAN_PHAM_TEXT)
+    fields[nhom_name] = nhom_value
+    doc = _parse(_post(session, form, _trigger_fields(doc, ID_XEM, fields)))
+
+    # 4. Kiểm tra bảng dữ liệu + nút "Tải Excel"
+    form, fields = _form_fields(doc)
+    excel_fields = _trigger_fields(doc, ID_TAI_EXCEL, fields)
+    if _element(doc, ID_GRID) is None or excel_fields is None:
+        print(f"⚠️ Không có dữ liệu hoặc nút tải không hiện trong khoảng {start_date} - {end_date}.")
+        return None, 0
+
+    # 5. Tải file export (stream thẳng xuống đĩa, không giữ cả file trong RAM)
+    print("⬇️ [HTTP] Đang tải file Excel...")
+    job_dir = tempfile.mkdtemp(prefix="http_job_", dir=download_dir)
+    html_path = os.path.join(job_dir, "export.xls")
+    try:
+        with _post(session, form, excel_fields, stream=True) as response:
+            response.raise_for_status()
+            disposition = response.headers.get("Content-Disposition", "")
+            if "attachment" not in disposition.lower():
+                raise Exception("Server không trả về file export (thiếu Content-Disposition: attachment).")
+            with open(html_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+
+        # 6. Chuyển sang CSV cùng định dạng với crawler Selenium (hoặc giữ trong bộ nhớ)
+        if direct:
+            return convert_export_to_batch(html_path, start_date, end_date)
+        return convert_export_to_csv(html_path, start_date, end_date, download_dir)
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
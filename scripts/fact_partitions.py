@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta
+from db_pool import get_connection
+
+# fact_product_price (staging + DW) partition RANGE theo UNIX_TIMESTAMP(load_date):
+#   - pYYYYMMDD: dòng có load_date < ngày đó + 1 (và >= cận trên của partition trước)
+#   - p_history / p_future: phần đầu / phần cuối (MAXVALUE)
+# Partition "ngày" chỉ chứa đúng 1 ngày nên reload = nạp bảng shadow rồi EXCHANGE PARTITION.
+
+FACT_TABLE = "fact_product_price"
+# Khóa tên (GET_LOCK) để các lần load song song không REORGANIZE cùng lúc
+PARTITION_LOCK = "fact_product_price_partitions"
+PARTITION_LOCK_TIMEOUT = 60
+
+
+def _as_date(load_date):
+    if isinstance(load_date, str):
+        return datetime.strptime(load_date, '%Y-%m-%d').date()
+    return load_date
+
+
+def partition_name(day):
+    return f"p{day:%Y%m%d}"
+
+
+def list_partitions(cursor, table=FACT_TABLE):
+    """
+    Returns: [(tên, cận trên UNIX_TIMESTAMP hoặc None nếu MAXVALUE)], theo thứ tự.
+    Bảng không partition -> [].
+    """
+    cursor.execute(
+        """
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        ORDER BY PARTITION_ORDINAL_POSITION
+        """,
+        (table,)
+    )
+    return [
+        (name, None if description == "MAXVALUE" else int(description))
+        for name, description in cursor.fetchall()
+    ]
+
+
+def _day_bounds(cursor, day):
+    # Để MySQL tính cận (cùng time_zone của session với giá trị TIMESTAMP được lưu)
+    cursor.execute("SELECT UNIX_TIMESTAMP(%s), UNIX_TIMESTAMP(%s + INTERVAL 1 DAY)", (day, day))
+    start, end = cursor.fetchone()
+    return int(start), int(end)
+
+
+def _less_than(bound):
+    return "MAXVALUE" if bound is None else str(bound)
+
+
+def ensure_day_partition(cursor, load_date, table=FACT_TABLE):
+    """
+    Đảm bảo có partition chứa đúng ngày load_date, tách partition đang chứa ngày đó
+    (REORGANIZE, chỉ chép dữ liệu của partition này) thành [trước ngày | ngày | sau ngày].
+    Returns: tên partition của ngày, None nếu bảng chưa partition.
+    """
+    day = _as_date(load_date)
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (PARTITION_LOCK, PARTITION_LOCK_TIMEOUT))
+    cursor.fetchall()
+    try:
+        partitions = list_partitions(cursor, table)
+        if not partitions:
+            return None
+
+        start, end = _day_bounds(cursor, day)
+        lower = None
+        for name, upper in partitions:
+            if upper is None or upper > start:
+                break
+            lower = upper
+        else:
+            # Không có p_future và ngày nằm sau partition cuối -> ADD PARTITION
+            pieces = [(partition_name(day), end)]
+            if lower < start:
+                pieces.insert(0, (partition_name(day - timedelta(days=1)), start))
+            definitions = ", ".join(f"PARTITION {piece} VALUES LESS THAN ({bound})" for piece, bound in pieces)
+            cursor.execute(f"ALTER TABLE {table} ADD PARTITION ({definitions})")
+            return partition_name(day)
+
+        if lower == start and upper == end:
+            return name
+
+        pieces = []
+        if lower is None or lower < start:
+            pieces.append((partition_name(day - timedelta(days=1)), start))
+        pieces.append((partition_name(day), end))
+        if upper is None or upper > end:
+            pieces.append((name, upper))
+
+        definitions = ", ".join(
+            f"PARTITION {piece} VALUES LESS THAN ({_less_than(bound)})" for piece, bound in pieces
+        )
+        cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION {name} INTO ({definitions})")
+        print(f"    Partition {table}: {name} -> {', '.join(piece for piece, _ in pieces)}")
+        return partition_name(day)
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (PARTITION_LOCK,))
+        cursor.fetchall()
+
+
+def create_shadow(cursor, load_date, table=FACT_TABLE):
+    """
+    Bảng shadow không partition, cùng cấu trúc với bảng fact (điều kiện của EXCHANGE PARTITION).
+    Tên theo ngày -> các ngày load song song không đụng nhau.
+    """
+    shadow = f"{table}_x{_as_date(load_date):%Y%m%d}"
+    cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+    cursor.execute(f"CREATE TABLE {shadow} LIKE {table}")
+    cursor.execute(f"ALTER TABLE {shadow} REMOVE PARTITIONING")
+    return shadow
+
+
+def swap_in_shadow(cursor, partition, shadow, table=FACT_TABLE):
+    """
+    Đổi partition của ngày với bảng shadow (WITH VALIDATION: mọi dòng phải thuộc đúng ngày),
+    người đọc thấy dữ liệu cũ hoặc mới, không thấy trạng thái dở dang.
+    Returns: số dòng cũ của ngày vừa bị thay.
+    """
+    cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {partition} WITH TABLE {shadow}")
+    cursor.execute(f"SELECT COUNT(*) FROM {shadow}")
+    replaced = cursor.fetchone()[0]
+    cursor.execute(f"DROP TABLE {shadow}")
+    return replaced
+
+
+def drop_shadow(cursor, shadow):
+    """
+    Dọn bảng shadow khi lần nạp lỗi trước bước EXCHANGE (partition của ngày vẫn là dữ liệu cũ).
+    """
+    cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+
+
+def drop_old_partitions(cursor, retention_days, table=FACT_TABLE):
+    """
+    Retention: DROP PARTITION các partition có cận trên <= hôm nay - retention_days.
+    retention_days <= 0 -> giữ toàn bộ. Returns: danh sách partition đã drop.
+    """
+    if not retention_days or int(retention_days) <= 0:
+        return []
+
+    cursor.execute("SELECT UNIX_TIMESTAMP(CURDATE() - INTERVAL %s DAY)", (int(retention_days),))
+    cutoff = int(cursor.fetchone()[0])
+
+    expired = [
+        name for name, upper in list_partitions(cursor, table)
+        if upper is not None and upper <= cutoff
+    ]
+    if expired:
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}")
+        print(f"    Retention {table}: dropped {len(expired)} partition(s) ({', '.join(expired)})")
+    return expired
+
+
+def ensure_partition(db_name, load_date, table=FACT_TABLE):
+    """
+    ensure_day_partition trên 1 DB (connection riêng), dùng trước khi process ghi fact của ngày.
+    """
+    conn = None
+    try:
+        conn = get_connection(db_name)
+        return ensure_day_partition(conn.cursor(), load_date, table)
+    finally:
+        if conn:
+            conn.close()
+
+
+def apply_retention(db_name, retention_days, table=FACT_TABLE):
+    """
+    Chạy retention trên 1 DB (STAGING/DW) sau khi process thành công.
+    Lỗi retention chỉ cảnh báo, không làm fail process.
+    """
+    if not retention_days or int(retention_days) <= 0:
+        return []
+    conn = None
+    try:
+        conn = get_connection(db_name)
+        return drop_old_partitions(conn.cursor(), retention_days, table)
+    except Exception as e:
+        print(f"⚠️ Retention {db_name}.{table} failed: {e}")
+        return []
+    finally:
+        if conn:
+            conn.close()
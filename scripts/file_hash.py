@@ -0,0 +1,96 @@
+import hashlib
+from db_pool import get_connection
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Trạng thái lưu trong crawl_file_hash
+HASH_NEW = "CS"        # Nội dung mới
+HASH_UNCHANGED = "CU"  # Trùng với file của cửa sổ crawl chồng lấn gần nhất
+HASH_LOADED = "LS"     # load_status: nội dung đã được load_to_staging nạp
+
+
+def file_sha256(file_path):
+    """
+    SHA-256 của file (đọc từng khối, không nạp cả file vào RAM).
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_previous_hash(window_start, window_end):
+    """
+    Hash của lần crawl gần nhất có cửa sổ chồng lấn [window_start, window_end]
+    mà nội dung đã được load_to_staging nạp thành công (load_status = LS).
+    Lần crawl trước lỗi ở bước load -> không tính, lần chạy lại phải load lại.
+    Trả về: content_hash hoặc None.
+    """
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT content_hash FROM crawl_file_hash
+            WHERE window_end >= %s AND window_start <= %s
+              AND load_status = %s
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (window_start, window_end, HASH_LOADED)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        if conn:
+            conn.close()
+
+
+def record_file_hash(window_start, window_end, content_hash, record_count, file_name, status):
+    """
+    Ghi hash của file vừa crawl (kể cả khi trùng) để lần sau so sánh với cửa sổ mới nhất.
+    Dòng CU trùng nội dung đã nạp -> load_status = LS ngay.
+    """
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            INSERT INTO crawl_file_hash
+                (window_start, window_end, content_hash, record_count, file_name, status, load_status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            """,
+            (window_start, window_end, content_hash, record_count, file_name, status,
+             HASH_LOADED if status == HASH_UNCHANGED else None)
+        )
+        conn.commit()
+    finally:
+        if conn:
+            conn.close()
+
+
+def mark_hash_loaded(file_name):
+    """
+    Đánh dấu lần crawl gần nhất của file_name đã nạp vào staging (gọi sau khi load_to_staging LS).
+    """
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE crawl_file_hash SET load_status = %s
+            WHERE file_name = %s
+            ORDER BY id DESC
+            LIMIT 1
+            """,
+            (HASH_LOADED, file_name)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        if conn:
+            conn.close()
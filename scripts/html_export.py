@@ -0,0 +1,190 @@
+import io
+import os
+import csv
+import hashlib
+from lxml import etree
+
+# In tiến độ sau mỗi N dòng khi chuyển đổi
+PROGRESS_EVERY = 5000
+
+
+def staging_csv_path(start_date, end_date, output_dir):
+    """
+    Tên file CSV chuẩn mà các bước sau dựa vào: nong_san_<dd-mm-YYYY>_<dd-mm-YYYY>.csv
+    """
+    safe_start = start_date.replace("/", "-")
+    safe_end = end_date.replace("/", "-")
+    csv_name = f"nong_san_{safe_start}_{safe_end}.csv"
+    return os.path.join(output_dir, csv_name)
+
+
+def _cell_text(cell):
+    return " ".join("".join(cell.itertext()).split())
+
+
+def iter_export_rows(html_path, encoding=None):
+    """
+    Đọc dần (streaming) bảng HTML đầu tiên trong file export bằng lxml iterparse.
+    Mỗi <tr> được yield ngay rồi giải phóng khỏi cây -> bộ nhớ không tăng theo số dòng.
+    Yield: (cells, is_header) - cells giữ đúng thứ tự cột trong file
+    (name, province, date, price) như execute_load_data cần.
+    """
+    context = etree.iterparse(
+        html_path, events=("start", "end"), tag=("table", "tr"), html=True, encoding=encoding
+    )
+    depth = 0
+    try:
+        for event, elem in context:
+            if elem.tag == "table":
+                depth += 1 if event == "start" else -1
+                if event == "end" and depth == 0:
+                    break  # Chỉ đọc bảng đầu tiên (giống pd.read_html(...)[0])
+                continue
+
+            # Bỏ qua <tr> của bảng lồng bên trong ô
+            if event != "end" or depth != 1:
+                continue
+
+            cells = [c for c in elem if c.tag in ("td", "th")]
+            if cells:
+                yield [_cell_text(c) for c in cells], all(c.tag == "th" for c in cells)
+
+            # Giải phóng dòng đã xử lý và các dòng trước đó
+            elem.clear()
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
+    finally:
+        del context
+
+
+def write_rows_to_csv(rows, csv_path, progress_every=PROGRESS_EVERY):
+    """
+    Ghi lần lượt các dòng (cells, is_header) ra CSV staging (utf-8-sig, 1 dòng tiêu đề).
+    Trả về: số dòng dữ liệu đã ghi.
+    """
+    with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
+        return _write_csv(rows, f, progress_every)
+
+
+def _write_csv(rows, f, progress_every=PROGRESS_EVERY):
+    """
+    Ghi (cells, is_header) vào file text f theo đúng định dạng CSV staging.
+    """
+    record_count = 0
+    header_written = False
+
+    writer = csv.writer(f, lineterminator="\n")
+    for cells, is_header in rows:
+        if is_header:
+            # Chỉ giữ dòng tiêu đề đầu tiên (LOAD DATA bỏ qua 1 dòng: IGNORE 1 ROWS)
+            if not header_written and record_count == 0:
+                writer.writerow(cells)
+                header_written = True
+            continue
+
+        if not header_written:
+            # Bảng không có <th>: ghi tiêu đề số cột như pandas
+            writer.writerow(range(len(cells)))
+            header_written = True
+
+        writer.writerow(cells)
+        record_count += 1
+        if progress_every and record_count % progress_every == 0:
+            print(f"   -> Đã chuyển {record_count} dòng...")
+
+    return record_count
+
+
+def convert_export_to_csv(html_path, start_date, end_date, output_dir):
+    """
+    Chuyển file export (.xls thực chất là bảng HTML) sang CSV staging, đọc-ghi dạng stream.
+    Trả về: (csv_path, record_count)
+    """
+    print(f"📂 Đã tải: {html_path}. Đang chuyển đổi sang CSV...")
+
+    csv_path = staging_csv_path(start_date, end_date, output_dir)
+    table_rows = 0
+
+    def _counted_rows():
+        nonlocal table_rows
+        for row in iter_export_rows(html_path):
+            table_rows += 1
+            yield row
+
+    record_count = write_rows_to_csv(_counted_rows(), csv_path)
+
+    if table_rows == 0:
+        os.remove(csv_path)
+        raise Exception("File tải về không chứa bảng dữ liệu nào.")
+
+    print(f"✅ Đã lưu CSV: {csv_path} ({record_count} dòng)")
+    return csv_path, record_count
+
+
+class ExportBatch:
+    """
+    Kết quả crawl ở chế độ direct-load: các dòng đã parse giữ trong bộ nhớ,
+    load_to_staging insert thẳng vào stg_products, không cần ghi/đọc lại CSV.
+    - name: tên file CSV tương ứng (dùng cho log và file lưu trữ)
+    - rows: list (name, province, date, price)
+    - archive_path: đường dẫn CSV lưu trữ (nếu đã gọi archive)
+    """
+
+    def __init__(self, name, header, rows):
+        self.name = name
+        self.header = header
+        self.rows = rows
+        self.archive_path = None
+
+    def _export_rows(self):
+        if self.header:
+            yield self.header, True
+        for row in self.rows:
+            yield list(row), False
+
+    def to_csv_bytes(self):
+        """
+        Nội dung y hệt file CSV staging (kể cả BOM) -> hash trùng với chế độ file.
+        """
+        buffer = io.StringIO()
+        _write_csv(self._export_rows(), buffer, progress_every=0)
+        return ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+    def sha256(self):
+        return hashlib.sha256(self.to_csv_bytes()).hexdigest()
+
+    def archive(self, output_dir):
+        """
+        Lưu CSV làm bản lưu trữ (tùy chọn, không nằm trên đường load).
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        self.archive_path = os.path.join(output_dir, self.name)
+        with open(self.archive_path, "wb") as f:
+            f.write(self.to_csv_bytes())
+        return self.archive_path
+
+
+def convert_export_to_batch(html_path, start_date, end_date, columns=4):
+    """
+    Đọc file export thành ExportBatch (không ghi CSV).
+    Mỗi dòng được chuẩn về đúng `columns` cột như LOAD DATA (thiếu -> None, thừa -> bỏ).
+    Trả về: (batch, record_count)
+    """
+    print(f"📂 Đã tải: {html_path}. Đang đọc dữ liệu (direct-load)...")
+
+    header = None
+    rows = []
+    for cells, is_header in iter_export_rows(html_path):
+        if is_header:
+            if header is None and not rows:
+                header = cells
+            continue
+        rows.append(tuple((cells + [None] * columns)[:columns]))
+
+    if header is None and not rows:
+        raise Exception("File tải về không chứa bảng dữ liệu nào.")
+
+    name = os.path.basename(staging_csv_path(start_date, end_date, "."))
+    print(f"✅ Đã đọc {len(rows)} dòng vào bộ nhớ ({name})")
+    return ExportBatch(name, header, rows), len(rows)
@@ -8,7 +8,9 @@ from param_sync import get_parameter_value
 import argparse
 from send_mail import send_email
 from load_config import load_config
+from db_pool import get_connection
 from datetime import datetime 
+from row_counts import read_proc_counts, record_row_counts, format_counts, total
 
 PROCESS_NAME = "insert_aggre_data"
 PREV_PROCESS = "load_to_dw"
@@ -66,7 +68,7 @@ def insert_with_proc(load_date=None, clean=1, force_run=False):
             print(f"🚀 Process '{PROCESS_NAME}' will run (status={current_status})...")
 
         # --- 3. EXECUTE PROCEDURE ---
-        conn = mysql.connector.connect(**DW_CONFIG)
+        conn = get_connection('DW')
         cursor = conn.cursor()
 
         print(f"🔄 Đang chạy stored procedure {procedure_name} với load_date={load_date}, clean={clean}...")
@@ -74,17 +76,13 @@ def insert_with_proc(load_date=None, clean=1, force_run=False):
         # Gọi Procedure: Truyền tham số [ngày load, cờ dọn dẹp]
         cursor.callproc(procedure_name, [load_date, clean])
 
-        # Kiểm tra nhanh kết quả (Đếm số dòng vừa tạo)
-        # Lưu ý: Vì Procedure dùng INSERT ... SELECT, nên rowcount của callproc đôi khi không chuẩn
-        # Ta query trực tiếp bảng đích để verify
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM agg_product_price_weekly 
-            WHERE DATE(load_date) = %s
-        """, (load_date,))
-        
-        result_row = cursor.fetchone()
-        records_insert = result_row[0] if result_row else 0
+        # Procedure trả về số dòng (tbl, op, cnt): nhóm agg/rpt mới (inserted) và đổi giá trị (updated)
+        # (rowcount của callproc không phản ánh các câu lệnh bên trong)
+        counts = read_proc_counts(cursor)
+        records_insert = (
+            total(counts, "inserted", "agg_product_price_weekly")
+            + total(counts, "updated", "agg_product_price_weekly")
+        )
         
         conn.commit()
         end_time = datetime.now()
@@ -99,8 +97,9 @@ def insert_with_proc(load_date=None, clean=1, force_run=False):
             records_extract=None,
             records_loaded=records_insert,
             records_transform=None,
-            message="Insert completed successfully."
+            message=f"Insert completed successfully. {format_counts(counts)}"
         )
+        record_row_counts(5, PROCESS_NAME, start_time, counts)
 
         subject = f"[ETL] Insert Success - {load_date}"
         body = f"""
@@ -115,6 +114,7 @@ def insert_with_proc(load_date=None, clean=1, force_run=False):
         if SEND_TO_EMAIL:
             send_email(subject, body, [SEND_TO_EMAIL])
         print(f"✅ Insert completed successfully. Rows: {records_insert}")
+        return records_insert
 
     except mysql.connector.Error as e:
         # --- LOG ERROR (MySQL) ---
@@ -171,7 +171,7 @@ def insert_with_proc(load_date=None, clean=1, force_run=False):
     finally:
         if cursor:
             cursor.close()
-        if conn and conn.is_connected():
+        if conn:
             conn.close()
             print("Closed MySQL connection.")
 
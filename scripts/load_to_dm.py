@@ -7,7 +7,10 @@ from param_sync import get_parameter_value
 import argparse
 from send_mail import send_email
 from load_config import load_config
+from db_pool import get_connection
 from datetime import datetime
+from row_counts import read_proc_counts, record_row_counts, format_counts, merge_counts, add_count, total
+from table_publish import create_shadow_table, publish_tables
 
 # ================== [6.5.X – SETUP CHUNG] ==================
 PROCESS_NAME = "load_to_dm"
@@ -34,7 +37,7 @@ load_to_mart1_temp_folder = get_parameter_value('LOAD_TO_D1M_TEMP')
 def export_data(load_date, clean=1):
     """
     Export data from DW using stored procedure.
-    Returns: (success: bool, records_inserted: int, error_message: str)
+    Returns: (success: bool, records_exported: int, error_message: str, counts: dict)
     """
     conn = None
     cursor = None
@@ -56,42 +59,37 @@ def export_data(load_date, clean=1):
 
         # [6.5.4] EXTRACT DỮ LIỆU
         #  - Kết nối DW
-        #  - Gọi SP EXPORT_DATA_FORM_DW để tạo 3 file CSV + ghi vào agg_product_price_weekly
-        #  - Đếm số bản ghi theo load_date
-        conn = mysql.connector.connect(**DW_CONFIG)
+        #  - Gọi SP EXPORT_DATA_FORM_DW để tạo 3 file CSV
+        #  - Số bản ghi đã xuất lấy từ result set (tbl, op, cnt) của SP
+        conn = get_connection('DW')
         cursor = conn.cursor()
 
         print(f"Running stored procedure {procedure_name} with load_date={load_date}, clean={clean}")
         cursor.callproc(procedure_name, [load_date])
-
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM agg_product_price_weekly 
-            WHERE DATE(load_date) = %s
-        """, (load_date,))
-        records_insert = cursor.fetchone()[0]
+        counts = read_proc_counts(cursor)
+        records_insert = total(counts, "exported")
 
         conn.commit()
         
         print(f"Export completed: {records_insert} records")
-        return True, records_insert, None
+        return True, records_insert, None, counts
 
     except mysql.connector.Error as e:
         # [6.5.4] Nhánh EXPORT THẤT BẠI (MySQL Error)
         error_msg = f"MySQL Error during export: {e}"
         print(error_msg)
-        return False, 0, error_msg
+        return False, 0, error_msg, {}
 
     except Exception as e:
         # [6.5.4] Nhánh EXPORT THẤT BẠI (lỗi khác)
         error_msg = f"Other Error during export: {e}"
         print(error_msg)
-        return False, 0, error_msg
+        return False, 0, error_msg, {}
 
     finally:
         if cursor:
             cursor.close()
-        if conn and conn.is_connected():
+        if conn:
             conn.close()
             print("Closed DW MySQL connection.")
 
@@ -99,11 +97,12 @@ def export_data(load_date, clean=1):
 def load_to_mart(load_date):
     """
     Load data to MART1 from CSV files.
-    Returns: (success: bool, total_records: int, error_message: str)
+    Returns: (success: bool, total_records: int, error_message: str, counts: dict)
     """
     conn = None
     cursor = None
     total_records = 0
+    counts = {}
 
     # [6.6.6] Danh sách 3 job tương ứng 3 file CSV cần LOAD
     LOAD_JOBS = [
@@ -122,10 +121,8 @@ def load_to_mart(load_date):
     ]
 
     try:
-        # [6.5.5] KẾT NỐI MART1D (allow_local_infile = True)
-        mart_config = MART1_CONFIG.copy()
-        mart_config['allow_local_infile'] = True
-        conn = mysql.connector.connect(**mart_config)
+        # [6.5.5] KẾT NỐI MART1D (pool M1D đã bật allow_local_infile)
+        conn = get_connection('M1D')
         cursor = conn.cursor()
         cursor.execute("SET GLOBAL local_infile = 1")
 
@@ -134,9 +131,11 @@ def load_to_mart(load_date):
         # [6.6.6] LOAD 3 FILE CSV
         #  - Với từng job:
         #    + Kiểm tra file CSV tồn tại
-        #    + TRUNCATE TABLE
-        #    + LOAD DATA LOCAL INFILE
-        #    + Đếm số bản ghi theo load_date
+        #    + Tạo bảng shadow <bảng>_new (LIKE -> giữ index)
+        #    + LOAD DATA LOCAL INFILE vào bảng shadow
+        #    + Số bản ghi = cursor.rowcount của LOAD DATA
+        #  - Đủ 3 bảng: 1 câu RENAME TABLE publish cả nhóm, bản cũ giữ ở <bảng>_old
+        #    (dashboard không thấy bảng rỗng; lỗi giữa chừng thì bảng đang chạy không đổi)
         for job in LOAD_JOBS:
             csv_path = os.path.join(load_to_mart1_temp_folder, job["csv"])
             table = job["table"]
@@ -147,37 +146,34 @@ def load_to_mart(load_date):
                 # Nhánh lỗi: CSV không tồn tại → LOAD THẤT BẠI
                 error_msg = f"CSV file not found: {csv_path}"
                 print(error_msg)
-                return False, 0, error_msg
-
-            try:
-                cursor.execute(f"TRUNCATE TABLE {table}")
-                print(f"    Table {table} truncated OK.")
-            except Exception as te:
-                # Nhánh lỗi: TRUNCATE thất bại → LOAD THẤT BẠI
-                print(f"    Could not truncate {table}: {te}")
-                return False, 0, f"Truncate failed for {table}: {te}"
-            
+                return False, 0, error_msg, counts
+
+            shadow = create_shadow_table(cursor, table)
+            print(f"    Shadow table {shadow} created OK.")
+
             csv_path_normalized = csv_path.replace("\\", "/")
             
             load_sql = f"""
                 LOAD DATA LOCAL INFILE '{csv_path_normalized}'
-                INTO TABLE {table}
+                INTO TABLE {shadow}
                 FIELDS TERMINATED BY ','
                 ENCLOSED BY '"'
                 LINES TERMINATED BY '\\n'
             """
 
             cursor.execute(load_sql)
+            records_loaded = max(cursor.rowcount, 0)
+            add_count(counts, table, "loaded", records_loaded)
             conn.commit()
 
-            cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE load_date = %s", (load_date,))
-            records_loaded = cursor.fetchone()[0]
             total_records += records_loaded
 
             print(f"    Loaded OK ({records_loaded} rows)")
 
+        publish_tables(cursor, [job["table"] for job in LOAD_JOBS])
+
         print(f"[MART LOAD] All tables loaded successfully! Total: {total_records} rows")
-        return True, total_records, None
+        return True, total_records, None, counts
 
     except Exception as e:
         # [6.6.6] Nhánh LOAD THẤT BẠI
@@ -187,12 +183,12 @@ def load_to_mart(load_date):
         print(error_msg)
         if conn:
             conn.rollback()
-        return False, 0, error_msg
+        return False, 0, error_msg, counts
 
     finally:
         if cursor:
             cursor.close()
-        if conn and conn.is_connected():
+        if conn:
             conn.close()
             print("[MART LOAD] MySQL connection closed.")
 
@@ -238,7 +234,7 @@ def run_full_process(load_date=None, clean=1, force_run=False):
 
         # ================== [6.5.4] EXTRACT DỮ LIỆU ==================
         print("\n=== STEP 1: EXPORT DATA ===")
-        export_success, records_exported, export_error = export_data(load_date, clean)
+        export_success, records_exported, export_error, export_counts = export_data(load_date, clean)
         
         if not export_success:
             # Nhánh EXPORT THẤT BẠI
@@ -273,7 +269,8 @@ def run_full_process(load_date=None, clean=1, force_run=False):
 
         # ================== [6.6.6] LOAD 3 FILE CSV ==================
         print("\n=== STEP 2: LOAD TO MART ===")
-        load_success, records_loaded, load_error = load_to_mart(load_date)
+        load_success, records_loaded, load_error, load_counts = load_to_mart(load_date)
+        counts = merge_counts(export_counts, load_counts)
         
         end_time = datetime.now()
 
@@ -322,8 +319,9 @@ def run_full_process(load_date=None, clean=1, force_run=False):
             records_extract=records_exported,
             records_loaded=records_loaded,
             records_transform=None,
-            message="Export and Load completed successfully."
+            message=f"Export and Load completed successfully. {format_counts(counts)}"
         )
+        record_row_counts(6, PROCESS_NAME, start_time, counts)
 
         subject = f"[ETL] Process Success - {load_date}"
         body = f"""
@@ -340,6 +338,7 @@ def run_full_process(load_date=None, clean=1, force_run=False):
         """
         send_email(subject, body, [SEND_TO_EMAIL])
         print("\n=== PROCESS COMPLETED SUCCESSFULLY ===")
+        return records_loaded
 
     except Exception as e:
         # [6.x] Nhánh lỗi bất ngờ (Unexpected Error)
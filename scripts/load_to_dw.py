@@ -7,7 +7,11 @@ from param_sync import get_parameter_value
 import argparse
 from send_mail import send_email
 from load_config import load_config
+from db_pool import get_connection
 from datetime import datetime
+from row_counts import read_proc_counts, record_row_counts, format_counts, merge_counts, add_count, total
+from dim_upsert import DIM_TABLES, upsert_dimension
+from fact_partitions import ensure_day_partition, create_shadow, swap_in_shadow, drop_shadow, apply_retention
 
 PROCESS_NAME = "load_to_dw"
 PREV_PROCESS = "transform"
@@ -25,10 +29,19 @@ PROCESS_LOG_TABLE = config['LOG_TABLES']['PROCESS']
 procedure_name = get_parameter_value('EXPORT_DATA_FROM_STG_PROCEDURE')
 SEND_TO_EMAIL = get_parameter_value('SEND_TO_EMAIL')
 load_to_dw_temp_folder = get_parameter_value('LOAD_TO_DW_TEMP')
+# sql: INSERT ... SELECT chéo schema | stream: cursor -> executemany (khác server)
+# file: OUTFILE + LOAD DATA, giữ lại CSV làm snapshot
+DW_TRANSFER_MODE = (get_parameter_value('DW_TRANSFER_MODE') or "sql").strip().lower()
+DW_TRANSFER_BATCH = 5000
+# Số ngày giữ partition fact ở DW (0 = giữ toàn bộ)
+DW_FACT_RETENTION_DAYS = int(get_parameter_value('DW_FACT_RETENTION_DAYS') or 0)
 
 
 def export_data(load_date, clean=1):
-    
+    """
+    Returns: (success, records_exported, error_message, counts)
+    counts lấy từ result set (tbl, op, cnt) của procedure, không COUNT(*) lại bảng fact.
+    """
     conn = None
     cursor = None
     
@@ -45,47 +58,47 @@ def export_data(load_date, clean=1):
                         print(f"Could not delete {file_path}: {e}")
             print(f"Clean mode enabled - deleted {removed_files} CSV file(s).")
 
-        conn = mysql.connector.connect(**STAGING_CONFIG)
+        conn = get_connection('STAGING')
         cursor = conn.cursor()
 
         print(f"Running stored procedure {procedure_name} with load_date={load_date}, clean={clean}")
         cursor.callproc(procedure_name, [load_date])
-
-        cursor.execute("""
-            SELECT COUNT(*) 
-            FROM fact_product_price 
-            WHERE DATE(load_date) = %s
-        """, (load_date,))
-        records_insert = cursor.fetchone()[0]
+        counts = read_proc_counts(cursor)
+        records_insert = total(counts, "exported", "fact_product_price")
 
         conn.commit()
         
         print(f"Export completed: {records_insert} records")
-        return True, records_insert, None
+        return True, records_insert, None, counts
 
     except mysql.connector.Error as e:
         error_msg = f"MySQL Error during export: {e}"
         print(error_msg)
-        return False, 0, error_msg
+        return False, 0, error_msg, {}
 
     except Exception as e:
         error_msg = f"Other Error during export: {e}"
         print(error_msg)
-        return False, 0, error_msg
+        return False, 0, error_msg, {}
 
     finally:
         if cursor:
             cursor.close()
-        if conn and conn.is_connected():
+        if conn:
             conn.close()
             print("Closed STG MySQL connection.")
 
 
 def load_to_dw(load_date):
- 
+    """
+    Returns: (success, total_records, error_message, counts)
+    Số dòng lấy từ cursor.rowcount của DELETE / LOAD DATA, không COUNT(*) lại bảng.
+    Dim: upsert qua bảng tạm (new/changed), fact: LOAD DATA vào shadow rồi swap partition ngày.
+    """
     conn = None
     cursor = None
     total_records = 0
+    counts = {}
 
     LOAD_JOBS = [
         {
@@ -103,9 +116,7 @@ def load_to_dw(load_date):
     ]
 
     try:
-        dw_config = DW_CONFIG.copy()
-        dw_config['allow_local_infile'] = True
-        conn = mysql.connector.connect(**dw_config)
+        conn = get_connection('DW')
         cursor = conn.cursor()
         cursor.execute("SET GLOBAL local_infile = 1")
 
@@ -121,19 +132,23 @@ def load_to_dw(load_date):
             if not os.path.exists(csv_path):
                 error_msg = f"CSV file not found: {csv_path}"
                 print(error_msg)
-                return False, 0, error_msg
+                return False, 0, error_msg, counts
+
+            if table in DIM_TABLES:
+                # DIM TABLE – nạp vào bảng tạm rồi upsert, chạy lại ngày cũ không lỗi/không trùng
+                new, changed = upsert_dimension(cursor, DIM_TABLES[table], csv_path=csv_path)
+                add_count(counts, table, "inserted", new)
+                add_count(counts, table, "updated", changed)
+                conn.commit()
+                total_records += new + changed
+                print(f"    Upserted OK (new={new}, changed={changed})")
+                continue
 
             # ==============================
             # Incremental append logic here
             # ==============================
-            if "fact" in table.lower():
-                # FACT TABLE – delete đúng ngày load
-                delete_sql = f"DELETE FROM {table} WHERE load_date = %s"
-                cursor.execute(delete_sql, (load_date,))
-                print(f"    Deleted existing records for {load_date} in {table}")
-            else:
-                # DIM TABLE – giữ nguyên dữ liệu
-                print(f"    DIM table {table}: no delete")
+            target, partition = prepare_fact_reload(cursor, load_date)
+            begin_fact_reload(cursor, load_date, partition, counts)
 
             # Normalized path
             csv_path_normalized = csv_path.replace("\\", "/")
@@ -141,51 +156,315 @@ def load_to_dw(load_date):
             # Load CSV
             load_sql = f"""
                 LOAD DATA LOCAL INFILE '{csv_path_normalized}'
-                INTO TABLE {table}
+                INTO TABLE {target}
                 FIELDS TERMINATED BY ','
                 ENCLOSED BY '"'
                 LINES TERMINATED BY '\\n'
             """
             cursor.execute(load_sql)
+            # Số dòng LOAD DATA thực sự ghi vào bảng (LOCAL: dòng trùng khóa bị bỏ qua, không tính)
+            records_loaded = max(cursor.rowcount, 0)
+            add_count(counts, table, "loaded", records_loaded)
             conn.commit()
+            finish_fact_reload(cursor, target, partition, counts)
 
-            # Count rows loaded
-            if "fact" in table.lower():
-                cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE load_date = %s", (load_date,))
-            else:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-
-            records_loaded = cursor.fetchone()[0]
             total_records += records_loaded
 
             print(f"    Loaded OK ({records_loaded} rows)")
 
 
         print(f"[MART LOAD] All tables loaded successfully! Total: {total_records} rows")
-        return True, total_records, None
+        return True, total_records, None, counts
 
     except Exception as e:
         error_msg = f"Load failed: {e}"
         print(error_msg)
         if conn:
             conn.rollback()
-        return False, 0, error_msg
+        return False, 0, error_msg, counts
 
     finally:
         if cursor:
             cursor.close()
-        if conn and conn.is_connected():
+        if conn:
             conn.close()
             print("[MART LOAD] MySQL connection closed.")
 
 
-def run_full_process(load_date=None, clean=1, force_run=False):
+# ==============================
+# Chuyển trực tiếp STG -> DW (không qua file CSV)
+# ==============================
+# (bảng DW, cột, câu SELECT trên staging theo ngày) - cùng thứ tự cột với file export
+TRANSFER_JOBS = [
+    (
+        "dim_product",
+        ("product_id", "product_name"),
+        """
+        SELECT DISTINCT d.product_id, d.product_name
+        FROM {stg}.dim_product d
+        JOIN {stg}.fact_product_price f ON d.product_id = f.product_id
+        WHERE f.load_date >= %s AND f.load_date < %s + INTERVAL 1 DAY
+        """,
+    ),
+    (
+        "dim_province",
+        ("province_id", "province_name"),
+        """
+        SELECT DISTINCT p.province_id, p.province_name
+        FROM {stg}.dim_province p
+        JOIN {stg}.fact_product_price f ON p.province_id = f.province_id
+        WHERE f.load_date >= %s AND f.load_date < %s + INTERVAL 1 DAY
+        """,
+    ),
+    (
+        "fact_product_price",
+        ("fact_id", "product_id", "province_id", "date_id", "price",
+         "date_create", "expire_date", "is_delete", "load_date"),
+        """
+        SELECT f.fact_id, f.product_id, f.province_id, f.date_id, f.price,
+               f.date_create, f.expire_date, f.is_delete, f.load_date
+        FROM {stg}.fact_product_price f
+        WHERE f.load_date >= %s AND f.load_date < %s + INTERVAL 1 DAY
+        """,
+    ),
+]
+
+
+def same_server(config_a, config_b):
+    return (config_a.get('host'), int(config_a.get('port', 3306))) == \
+        (config_b.get('host'), int(config_b.get('port', 3306)))
+
+
+def loaded_rows(counts):
+    # Fact: số dòng nạp; dim: chỉ dòng mới/đổi tên
+    return total(counts, "loaded") + total(counts, "inserted") + total(counts, "updated")
+
+
+def prepare_fact_reload(cursor, load_date):
+    """
+    FACT TABLE – reload đúng ngày load, phần DDL (partition ngày + bảng shadow).
+    DDL tự commit nên phải chạy TRƯỚC start_transaction, không thì dim đã nạp bị commit theo.
+    Returns: (bảng shadow, partition) để nạp rồi EXCHANGE;
+    bảng chưa partition -> ("fact_product_price", None), nạp thẳng vào fact.
+    """
+    partition = ensure_day_partition(cursor, load_date)
+    if partition:
+        shadow = create_shadow(cursor, load_date)
+        print(f"    Loading {load_date} into {shadow} (swap with partition {partition})")
+        return shadow, partition
+    return "fact_product_price", None
+
+
+def begin_fact_reload(cursor, load_date, partition, counts):
+    """
+    Phần DML trong transaction: bảng chưa partition -> DELETE dòng cũ của ngày.
+    """
+    if partition:
+        return
+    cursor.execute(
+        "DELETE FROM fact_product_price WHERE load_date >= %s AND load_date < %s + INTERVAL 1 DAY",
+        (load_date, load_date)
+    )
+    add_count(counts, "fact_product_price", "deleted", cursor.rowcount)
+    print(f"    Deleted {cursor.rowcount} existing records for {load_date} in fact_product_price")
+
+
+def discard_fact_reload(conn, target, partition):
+    # Lỗi giữa chừng: bỏ bảng shadow, partition của ngày vẫn là dữ liệu cũ
+    if not partition:
+        return
+    try:
+        drop_shadow(conn.cursor(), target)
+    except Exception as e:
+        print(f"⚠️ Could not drop shadow table {target}: {e}")
+
+
+def finish_fact_reload(cursor, target, partition, counts):
+    """
+    EXCHANGE PARTITION (DDL) - chạy SAU commit của dim + shadow.
+    """
+    if partition:
+        replaced = swap_in_shadow(cursor, partition, target)
+        add_count(counts, "fact_product_price", "deleted", replaced)
+        print(f"    Swapped partition {partition} ({replaced} old rows replaced)")
+
+
+def transfer_error(mode, error, committed, partition):
+    if committed:
+        # Dim đã commit nhưng chưa swap -> ghi rõ vào log để biết fact của ngày chưa đổi
+        return (f"Transfer ({mode}) failed after commit: dims committed, "
+                f"fact partition {partition} NOT swapped (still old data): {error}")
+    return f"Transfer ({mode}) failed, rolled back: {error}"
+
+
+def transfer_sql(load_date):
+    """
+    Chế độ sql: STG và DW cùng server -> INSERT ... SELECT chéo schema trên connection DW.
+    1. DDL trước: partition ngày + bảng shadow.
+    2. 1 transaction: upsert dim + nạp fact vào shadow -> lỗi thì rollback cả hai.
+    3. Sau commit: EXCHANGE PARTITION. Lỗi ở bước này -> dim đã commit, partition fact
+       của ngày vẫn là dữ liệu cũ (ghi rõ trong log), chạy lại ngày là đủ.
+    Returns: (success, records_read, records_loaded, error_message, counts)
+    """
+    conn = None
+    cursor = None
+    counts = {}
+    stg = f"`{STAGING_CONFIG['database']}`"
+    target, partition = None, None
+    committed = False
+
+    try:
+        conn = get_connection('DW')
+        cursor = conn.cursor()
+        target, partition = prepare_fact_reload(cursor, load_date)
+        conn.start_transaction()
+
+        print(f"[DW TRANSFER] sql: {STAGING_CONFIG['database']} -> {DW_CONFIG['database']} ({load_date})")
+
+        for table, columns, select_sql in TRANSFER_JOBS:
+            if table in DIM_TABLES:
+                # DIM TABLE – INSERT ... SELECT vào bảng tạm rồi upsert
+                new, changed = upsert_dimension(
+                    cursor, DIM_TABLES[table],
+                    select_sql=select_sql.format(stg=stg), params=(load_date, load_date)
+                )
+                add_count(counts, table, "inserted", new)
+                add_count(counts, table, "updated", changed)
+                print(f"    {table}: new={new}, changed={changed}")
+                continue
+
+            begin_fact_reload(cursor, load_date, partition, counts)
+            cursor.execute(
+                f"INSERT INTO {target} ({', '.join(columns)}) {select_sql.format(stg=stg)}",
+                (load_date, load_date)
+            )
+            add_count(counts, table, "loaded", cursor.rowcount)
+            print(f"    {table}: {max(cursor.rowcount, 0)} rows")
+
+        conn.commit()
+        committed = True
+        finish_fact_reload(cursor, target, partition, counts)
+        records_loaded = loaded_rows(counts)
+        print(f"[DW TRANSFER] Committed. Total: {records_loaded} rows")
+        return True, records_loaded, records_loaded, None, counts
+
+    except Exception as e:
+        error_msg = transfer_error("sql", e, committed, partition)
+        print(error_msg)
+        if conn:
+            conn.rollback()
+            discard_fact_reload(conn, target, partition)
+        return False, 0, 0, error_msg, {}
+
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+def transfer_stream(load_date, batch_size=None):
+    """
+    Chế độ stream: STG và DW khác server -> đọc cursor staging theo lô (fetchmany)
+    và executemany vào DW. DDL / transaction / EXCHANGE theo đúng thứ tự của chế độ sql.
+    Returns: (success, records_read, records_loaded, error_message, counts)
+    """
+    batch_size = batch_size or DW_TRANSFER_BATCH
+    stg_conn = None
+    dw_conn = None
+    counts = {}
+    records_read = 0
+    stg = f"`{STAGING_CONFIG['database']}`"
+    target, partition = None, None
+    committed = False
+
+    try:
+        stg_conn = get_connection('STAGING')
+        dw_conn = get_connection('DW')
+        stg_cursor = stg_conn.cursor()
+        dw_cursor = dw_conn.cursor()
+        target, partition = prepare_fact_reload(dw_cursor, load_date)
+        dw_conn.start_transaction()
+
+        print(f"[DW TRANSFER] stream: STAGING -> DW ({load_date}), batch={batch_size}")
+
+        for table, columns, select_sql in TRANSFER_JOBS:
+            stg_cursor.execute(select_sql.format(stg=stg), (load_date, load_date))
+
+            if table in DIM_TABLES:
+                # DIM TABLE – dim nhỏ: đọc hết rồi upsert qua bảng tạm
+                rows = stg_cursor.fetchall()
+                records_read += len(rows)
+                new, changed = upsert_dimension(dw_cursor, DIM_TABLES[table], rows=rows)
+                add_count(counts, table, "exported", len(rows))
+                add_count(counts, table, "inserted", new)
+                add_count(counts, table, "updated", changed)
+                print(f"    {table}: new={new}, changed={changed}")
+                continue
+
+            begin_fact_reload(dw_cursor, load_date, partition, counts)
+            insert_sql = (
+                f"INSERT INTO {target} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))})"
+            )
+            table_read = 0
+            table_loaded = 0
+            while True:
+                rows = stg_cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                table_read += len(rows)
+                dw_cursor.executemany(insert_sql, rows)
+                table_loaded += max(dw_cursor.rowcount, 0)
+
+            records_read += table_read
+            add_count(counts, table, "exported", table_read)
+            add_count(counts, table, "loaded", table_loaded)
+            print(f"    {table}: {table_loaded} rows")
+
+        dw_conn.commit()
+        committed = True
+        finish_fact_reload(dw_cursor, target, partition, counts)
+        records_loaded = loaded_rows(counts)
+        print(f"[DW TRANSFER] Committed. Read {records_read}, loaded {records_loaded} rows")
+        return True, records_read, records_loaded, None, counts
+
+    except Exception as e:
+        error_msg = transfer_error("stream", e, committed, partition)
+        print(error_msg)
+        if dw_conn:
+            dw_conn.rollback()
+            discard_fact_reload(dw_conn, target, partition)
+        return False, records_read, 0, error_msg, {}
+
+    finally:
+        if stg_conn:
+            stg_conn.close()
+        if dw_conn:
+            dw_conn.close()
+
+
+def transfer_to_dw(load_date, mode=None):
+    """
+    mode: sql | stream. sql tự chuyển sang stream nếu STAGING và DW không cùng server.
+    """
+    mode = mode or DW_TRANSFER_MODE
+    if mode == "sql" and not same_server(STAGING_CONFIG, DW_CONFIG):
+        print("STAGING và DW khác server -> dùng chế độ stream")
+        mode = "stream"
+    if mode == "stream":
+        return transfer_stream(load_date)
+    return transfer_sql(load_date)
+
+
+def run_full_process(load_date=None, clean=1, force_run=False, mode=None):
     """
     Main process: Export from DW and Load to MART1.
     Only logs once at the end with combined results.
     """
     start_time = datetime.now()
     end_time = None
+    mode = mode or DW_TRANSFER_MODE
 
     if load_date is None:
         load_date = datetime.now().strftime('%Y-%m-%d')
@@ -211,39 +490,44 @@ def run_full_process(load_date=None, clean=1, force_run=False):
         else:
             print(f"Running process '{PROCESS_NAME}' (current={current_status})...")
 
-        print("\n=== STEP 1: EXPORT DATA ===")
-        export_success, records_exported, export_error = export_data(load_date, clean)
+        if mode == "file":
+            print("\n=== STEP 1: EXPORT DATA ===")
+            export_success, records_exported, export_error, export_counts = export_data(load_date, clean)
         
-        if not export_success:
-            end_time = datetime.now()
+            if not export_success:
+                end_time = datetime.now()
             
-            log_process_action(
-                process_config_id=4,
-                process_name=PROCESS_NAME,
-                start_time=start_time,
-                end_time=end_time,
-                status="LF",
-                records_extract=0,
-                records_loaded=0,
-                records_transform=None,
-                message=f"Export failed: {export_error}"
-            )
-
-            subject = f"[ETL] Process FAILED (Export Error) - {load_date}"
-            body = f"""
-            Process: {PROCESS_NAME}
-            Date: {load_date}
-            Status: LF (Export Failed)
-            Start Time: {start_time}
-            End Time: {end_time}
-            Error: {export_error}
-            """
-            send_email(subject, body, [SEND_TO_EMAIL])
-            print(f"Process failed at export stage.")
-            return
+                log_process_action(
+                    process_config_id=4,
+                    process_name=PROCESS_NAME,
+                    start_time=start_time,
+                    end_time=end_time,
+                    status="LF",
+                    records_extract=0,
+                    records_loaded=0,
+                    records_transform=None,
+                    message=f"Export failed: {export_error}"
+                )
+
+                subject = f"[ETL] Process FAILED (Export Error) - {load_date}"
+                body = f"""
+                Process: {PROCESS_NAME}
+                Date: {load_date}
+                Status: LF (Export Failed)
+                Start Time: {start_time}
+                End Time: {end_time}
+                Error: {export_error}
+                """
+                send_email(subject, body, [SEND_TO_EMAIL])
+                print(f"Process failed at export stage.")
+                return
 
-        print("\n=== STEP 2: LOAD TO MART ===") 
-        load_success, records_loaded, load_error = load_to_dw(load_date)
+            print("\n=== STEP 2: LOAD TO MART ===") 
+            load_success, records_loaded, load_error, load_counts = load_to_dw(load_date)
+            counts = merge_counts(export_counts, load_counts)
+        else:
+            print(f"\n=== TRANSFER STG -> DW ({mode}) ===")
+            load_success, records_exported, records_loaded, load_error, counts = transfer_to_dw(load_date, mode)
         
         end_time = datetime.now()
 
@@ -257,7 +541,7 @@ def run_full_process(load_date=None, clean=1, force_run=False):
                 records_extract=records_exported,
                 records_loaded=0,
                 records_transform=None,
-                message=f"Export OK but Load failed: {load_error}"
+                message=f"Export OK but Load failed: {load_error}" if mode == "file" else f"Transfer failed: {load_error}"
             )
 
             subject = f"[ETL] Process FAILED (Load Error) - {load_date}"
@@ -285,8 +569,10 @@ def run_full_process(load_date=None, clean=1, force_run=False):
             records_extract=records_exported,
             records_loaded=records_loaded,
             records_transform=None,
-            message="Export and Load completed successfully."
+            message=f"Export and Load completed successfully ({mode}). {format_counts(counts)}"
         )
+        record_row_counts(4, PROCESS_NAME, start_time, counts)
+        apply_retention('DW', DW_FACT_RETENTION_DAYS)
 
         subject = f"[ETL] Process Success - {load_date}"
         body = f"""
@@ -303,6 +589,7 @@ def run_full_process(load_date=None, clean=1, force_run=False):
         """
         send_email(subject, body, [SEND_TO_EMAIL])
         print("\n=== PROCESS COMPLETED SUCCESSFULLY ===")
+        return records_loaded
 
     except Exception as e:
         end_time = datetime.now()
@@ -337,9 +624,11 @@ if __name__ == "__main__":
     parser.add_argument("--date", type=str, default=None, help="Load date (YYYY-MM-DD)")
     parser.add_argument("--force", action="store_true", help="Force run even if already completed")
     parser.add_argument("--no-clean", action="store_true", help="Skip cleanup (clean=0)")
+    parser.add_argument("--mode", choices=["sql", "stream", "file"], default=None,
+                        help="Transfer mode (default: parameter DW_TRANSFER_MODE)")
 
     args = parser.parse_args()
     clean_flag = 0 if args.no_clean else 1
 
-    run_full_process(load_date=args.date, clean=clean_flag, force_run=args.force)
+    run_full_process(load_date=args.date, clean=clean_flag, force_run=args.force, mode=args.mode)
     
\ No newline at end of file
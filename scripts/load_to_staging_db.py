@@ -1,6 +1,8 @@
 import mysql.connector
+from db_pool import get_connection
 import os
 import sys
+import glob
 import argparse
 from pathlib import Path
 from mysql.connector import Error
@@ -11,40 +13,134 @@ from load_config import load_config
 from log_manager import log_process_action, log_conf_action, get_process_log_value
 from param_sync import get_parameter_value
 from send_mail import send_email
+from partition_manager import create_load_table, exchange_partition, drop_partitions_older_than
+from normalize import normalize_row
+from province_alias import resolve_province
+from dim_keys import get_dim_key_cache
+from file_hash import mark_hash_loaded
+from watermark import advance_watermark
 
 # --- CẤU HÌNH PROCESS ---
 PROCESS_NAME = "load_to_staging"
 PREV_PROCESS = "crawling" # Tên process trước đó để check log
 PROCESS_ID = 2 
+CRAWL_PROCESS_ID = 1  # Watermark crawl nằm ở process_config của crawling
 SEND_TO_EMAIL = get_parameter_value('SEND_TO_EMAIL')
 
 # Load Config DB
 config = load_config()
 STAGING_CONFIG = config["DB_CONFIGS"]['STAGING']
-# Bắt buộc bật local_infile cho client python
-STAGING_CONFIG['allow_local_infile'] = True
+STAGING_TABLE = "stg_products"
+# Số ngày giữ partition trong stg_products (<= 0: giữ tất cả)
+STAGING_RETENTION_DAYS = int(get_parameter_value('STAGING_RETENTION_DAYS') or 0)
+STAGING_INSERT_BATCH = 5000  # Số dòng mỗi lô executemany ở chế độ direct-load
+REJECTED_TABLE = "stg_products_rejected"
 
-def execute_load_data(csv_file_path):
+# Chuẩn hóa price/date ngay trong LOAD DATA (cùng logic với normalize.py)
+# %% vì câu lệnh được thực thi kèm tham số
+PRICE_NUM_EXPR = (
+    "IF(REPLACE(TRIM(@price), ',', '') REGEXP '^-?[0-9]{1,8}([.][0-9]+)?$', "
+    "CAST(REPLACE(TRIM(@price), ',', '') AS DECIMAL(10,2)), NULL)"
+)
+DATE_VALUE_EXPR = (
+    "COALESCE("
+    "IF(TRIM(@date) REGEXP '^[0-9]{4}-[0-9]{2}-[0-9]{2}', CAST(LEFT(TRIM(@date), 10) AS DATE), NULL), "
+    "STR_TO_DATE(TRIM(@date), '%%m/%%d/%%Y %%h:%%i:%%s %%p'), "
+    "STR_TO_DATE(TRIM(@date), '%%d/%%m/%%Y %%h:%%i:%%s %%p'), "
+    "STR_TO_DATE(SUBSTRING_INDEX(TRIM(@date), ' ', 1), '%%d/%%m/%%Y'))"
+)
+
+def _load_into_partition(load_date, fill):
     """
-    Hàm logic chính: Thực thi kết nối DB và load file
+    Khung chung cho mọi kiểu nạp staging:
+    1. Tạo bảng nạp tạm cho ngày (không khóa stg_products khi đang load)
+    2. fill(cursor, load_table) ghi dữ liệu vào bảng tạm, trả về số dòng
+    3. EXCHANGE PARTITION thay partition của ngày, dọn partition quá hạn
+    stg_products giữ lịch sử theo partition load_date: nạp lại 1 ngày chỉ thay partition
+    của ngày đó, không TRUNCATE cả bảng.
     """
-    csv_path_obj = Path(csv_file_path).resolve()
-    
-    if not csv_path_obj.exists():
-        raise FileNotFoundError(f"Không tìm thấy file CSV: {csv_path_obj}")
+    load_date = load_date or datetime.now().strftime('%Y-%m-%d')
 
     conn = None
     cursor = None
+    load_table = None
     
     try:
-        conn = mysql.connector.connect(**STAGING_CONFIG)
+        conn = get_connection('STAGING')
         cursor = conn.cursor()
         
-        # 1. TRUNCATE bảng staging cũ
-        print("   -> Cleaning old data (TRUNCATE stg_products)...")
-        cursor.execute("TRUNCATE TABLE stg_products;")
+        # 1. Bảng nạp tạm riêng cho ngày này
+        load_table = create_load_table(cursor, STAGING_TABLE, load_date)
+        print(f"   -> Loading into {load_table} (partition {load_date})...")
+
+        # 2. Ghi dữ liệu (price_num/date_value đã chuẩn hóa) + tách dòng lỗi ra quarantine
+        records_loaded = fill(cursor, load_table, load_date)
+        records_rejected = _quarantine_rejected_rows(cursor, load_table, load_date)
+        records_loaded -= records_rejected
+        conn.commit()
+        if records_rejected:
+            print(f"   -> ⚠️ {records_rejected} rows rejected -> {REJECTED_TABLE}")
+
+        # 3. Thay partition của ngày bằng bảng vừa nạp (dữ liệu cũ của ngày bị bỏ cùng bảng tạm)
+        partition = exchange_partition(cursor, STAGING_TABLE, load_date, load_table)
+        load_table = None
+        print(f"   -> Exchanged partition {partition}.")
+
+        # 4. Dọn partition quá hạn (DROP PARTITION, không quét bảng)
+        expired = drop_partitions_older_than(cursor, STAGING_TABLE, STAGING_RETENTION_DAYS)
+        if expired:
+            print(f"   -> Dropped expired partitions: {', '.join(expired)}")
         
-        # 2. LOAD DATA INFILE
+        print(f"   -> Success! Loaded {records_loaded} rows.")
+        return records_loaded
+
+    except Error as e:
+        print(f"   -> MySQL Error: {e}")
+        raise e
+    finally:
+        if cursor and load_table:
+            try:
+                cursor.execute(f"DROP TABLE IF EXISTS `{load_table}`")
+            except Error:
+                pass
+        if cursor: cursor.close()
+        if conn: conn.close()
+
+
+def _quarantine_rejected_rows(cursor, load_table, load_date):
+    """
+    Chuyển các dòng không chuẩn hóa được price/date từ bảng nạp tạm sang stg_products_rejected
+    (thay thế dòng lỗi cũ của cùng ngày). Trả về: số dòng bị loại.
+    """
+    invalid = "price_num IS NULL OR date_value IS NULL"
+    cursor.execute(f"DELETE FROM `{REJECTED_TABLE}` WHERE load_date = %s", (load_date,))
+    cursor.execute(
+        f"""
+        INSERT INTO `{REJECTED_TABLE}` (name, province, price, `date`, load_date, reason)
+        SELECT name, province, price, `date`, load_date,
+               CONCAT_WS(',', IF(price_num IS NULL, 'price', NULL), IF(date_value IS NULL, 'date', NULL))
+        FROM `{load_table}`
+        WHERE {invalid}
+        """
+    )
+    rejected = cursor.rowcount
+    if rejected:
+        cursor.execute(f"DELETE FROM `{load_table}` WHERE {invalid}")
+    return rejected
+
+
+def execute_load_data(csv_file_path, load_date=None):
+    """
+    Hàm logic chính: Thực thi kết nối DB và load file
+    - load_date: Ngày dữ liệu (YYYY-MM-DD) = partition của stg_products. Mặc định hôm nay.
+    """
+    csv_path_obj = Path(csv_file_path).resolve()
+    
+    if not csv_path_obj.exists():
+        raise FileNotFoundError(f"Không tìm thấy file CSV: {csv_path_obj}")
+
+    def _fill(cursor, load_table, load_date):
+        # LOAD DATA INFILE
         # Lưu ý: Đường dẫn file phải là kiểu Unix (/) ngay cả trên Windows
         sql_path = str(csv_path_obj).replace('\\', '/')
         
@@ -52,35 +148,79 @@ def execute_load_data(csv_file_path):
         
         load_query = f"""
         LOAD DATA LOCAL INFILE '{sql_path}'
-        INTO TABLE stg_products
+        INTO TABLE `{load_table}`
         FIELDS TERMINATED BY ',' 
         ENCLOSED BY '"'
         LINES TERMINATED BY '\\n'
         IGNORE 1 ROWS
-        (name, province, date, price) 
-        SET load_date = NOW();
+        (name, province, @date, @price) 
+        SET `date` = @date,
+            price = @price,
+            price_num = {PRICE_NUM_EXPR},
+            date_value = {DATE_VALUE_EXPR},
+            load_date = %s;
         """
         
         # Cần set global local_infile = 1 (nếu server chưa bật)
         cursor.execute("SET GLOBAL local_infile = 1;")
-        cursor.execute(load_query)
-        
-        records_loaded = cursor.rowcount
-        conn.commit()
-        
-        print(f"   -> Success! Loaded {records_loaded} rows.")
+        cursor.execute(load_query, (load_date,))
+        return cursor.rowcount
+
+    return _load_into_partition(load_date, _fill)
+
+
+def execute_load_rows(rows, load_date=None):
+    """
+    Direct-load: insert các dòng (name, province, date, price) đã parse sẵn trong bộ nhớ,
+    theo lô STAGING_INSERT_BATCH dòng (executemany -> INSERT nhiều VALUES).
+    price/date được chuẩn hóa bằng normalize.py (cache theo giá trị) trước khi insert,
+    tỉnh được gộp sẵn bằng cache province_alias (province_std) -> transform không cần join.
+    product_id/province_id lấy từ cache dim_keys (nạp 1 lần mỗi run, chỉ INSERT tên mới)
+    -> transform không phải resolve lại theo tên.
+    Không ghi/đọc file, không cần local_infile.
+    """
+    product_keys = get_dim_key_cache("product")
+    province_keys = get_dim_key_cache("province")
+
+    def _fill(cursor, load_table, load_date):
+        insert_query = (
+            f"INSERT INTO `{load_table}` "
+            f"(name, province, date, price, price_num, date_value, province_std, "
+            f"product_id, province_id, load_date) "
+            f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
+        )
+
+        records_loaded = 0
+        for i in range(0, len(rows), STAGING_INSERT_BATCH):
+            records = []
+            for row in rows[i:i + STAGING_INSERT_BATCH]:
+                record = normalize_row(row)
+                records.append(record + (resolve_province(record[1], record[5]),))
+
+            # Dòng lỗi price/date sẽ vào quarantine -> không tạo thành viên dim cho chúng
+            valid = [r for r in records if r[4] is not None and r[5] is not None]
+            product_ids = product_keys.resolve(r[0] for r in valid)
+            province_ids = province_keys.resolve(r[6] for r in valid)
+
+            chunk = [
+                r + (product_ids.get((r[0] or "").strip()), province_ids.get((r[6] or "").strip()), load_date)
+                for r in records
+            ]
+            cursor.executemany(insert_query, chunk)
+            records_loaded += len(chunk)
+        print(f"   -> Inserted {records_loaded} rows from memory "
+              f"(dim keys: +{product_keys.stats['inserted']} product, "
+              f"+{province_keys.stats['inserted']} province).")
         return records_loaded
 
-    except Error as e:
-        print(f"   -> MySQL Error: {e}")
-        raise e
-    finally:
-        if cursor: cursor.close()
-        if conn and conn.is_connected(): conn.close()
+    return _load_into_partition(load_date, _fill)
 
-def run_load_staging(target_date_str=None, force_run=False):
+def run_load_staging(target_date_str=None, force_run=False, csv_path=None, batch=None):
     """
     Hàm điều phối: Kiểm tra log Crawl -> Tính tên file -> Gọi hàm Load
+    - csv_path: Nếu truyền vào (vd: từ run_pipeline) thì dùng luôn file này,
+      không cần tính lại tên file từ ngày.
+    - batch: ExportBatch từ crawler ở chế độ direct-load -> insert thẳng, không cần file.
     """
     start_time = datetime.now()
     
@@ -125,6 +265,11 @@ def run_load_staging(target_date_str=None, force_run=False):
             log_process_action(PROCESS_ID, PROCESS_NAME, start_time, datetime.now(), "LS_SKIP", 0, 0, 0, "Skipped: No Data form Crawler")
             return None
 
+        if prev_status == "CU":
+            print(f"♻️ Bước {PREV_PROCESS} báo dữ liệu không đổi so với lần trước. Bỏ qua bước Load.")
+            log_process_action(PROCESS_ID, PROCESS_NAME, start_time, datetime.now(), "LS_SKIP", 0, 0, 0, "Skipped: Unchanged crawl content")
+            return None
+
         if prev_status != "CS" and prev_status != "LS": # CS: Completed Success (Crawler)
             msg = f"❌ Không thể chạy Load vì {PREV_PROCESS} chưa thành công (Status: {prev_status}). Dùng --force để bỏ qua."
             print(msg)
@@ -135,20 +280,31 @@ def run_load_staging(target_date_str=None, force_run=False):
         print(f"⚠️ FORCE MODE: Bỏ qua kiểm tra log của {PREV_PROCESS}.")
 
     # 3. TÍNH TOÁN TÊN FILE (Logic: Crawler lưu tên file theo khoảng thời gian)
-    # Giả định crawler chạy cho khoảng 7 ngày kết thúc vào target_date
-    start_date = file_target_date - timedelta(days=7)
-    s_str = start_date.strftime('%d-%m-%Y')
-    e_str = file_target_date.strftime('%d-%m-%Y')
-    
-    # Lấy đường dẫn staging từ DB hoặc mặc định
-    staging_dir = get_parameter_value('STAGING_DIR') or "./staging"
-    file_name = f"nong_san_{s_str}_{e_str}.csv"
-    csv_path = os.path.join(staging_dir, file_name)
+    if batch is not None:
+        # Direct-load: dữ liệu đã có trong bộ nhớ, không cần tìm file
+        file_name = batch.name
+    elif csv_path:
+        file_name = os.path.basename(csv_path)
+    else:
+        # Crawler lưu file theo cửa sổ kết thúc vào target_date, ngày bắt đầu phụ thuộc watermark
+        # -> tìm file nong_san_*_<target_date>.csv mới nhất
+        e_str = file_target_date.strftime('%d-%m-%Y')
+
+        # Lấy đường dẫn staging từ DB hoặc mặc định
+        staging_dir = get_parameter_value('STAGING_DIR') or "./staging"
+        candidates = glob.glob(os.path.join(staging_dir, f"nong_san_*_{e_str}.csv"))
+        if candidates:
+            csv_path = max(candidates, key=os.path.getmtime)
+        else:
+            start_date = file_target_date - timedelta(days=7)
+            csv_path = os.path.join(staging_dir, f"nong_san_{start_date.strftime('%d-%m-%Y')}_{e_str}.csv")
+        file_name = os.path.basename(csv_path)
 
-    print(f"📂 Tìm file mục tiêu: {csv_path}")
+    if batch is None:
+        print(f"📂 Tìm file mục tiêu: {csv_path}")
 
     try:
-        if not os.path.exists(csv_path):
+        if batch is None and not os.path.exists(csv_path):
             msg = f"Không tìm thấy file {file_name} (Dù log trước đó báo OK hoặc Force Run)"
             print(f"❌ {msg}")
             # Log Fail
@@ -166,7 +322,10 @@ def run_load_staging(target_date_str=None, force_run=False):
         )
 
         # 5. THỰC THI LOAD
-        records_loaded = execute_load_data(csv_path)
+        if batch is not None:
+            records_loaded = execute_load_rows(batch.rows, file_target_date.strftime('%Y-%m-%d'))
+        else:
+            records_loaded = execute_load_data(csv_path, file_target_date.strftime('%Y-%m-%d'))
 
         # 6. Log SUCCESS
         end_time = datetime.now()
@@ -179,6 +338,12 @@ def run_load_staging(target_date_str=None, force_run=False):
             records_loaded=records_loaded,
             message=f"Loaded: {file_name}"
         )
+        # Nội dung crawl đã vào staging -> lần crawl sau trùng hash mới được bỏ qua (CU)
+        mark_hash_loaded(file_name)
+        # Watermark crawl chỉ tiến khi dữ liệu của cửa sổ đã vào staging:
+        # load lỗi -> lần crawl sau vẫn bắt đầu từ watermark cũ, không bỏ sót ngày
+        if advance_watermark(CRAWL_PROCESS_ID, file_target_date.strftime('%Y-%m-%d')):
+            print(f"📌 Watermark crawl -> {file_target_date.strftime('%Y-%m-%d')}")
         
         if SEND_TO_EMAIL:
              send_email(f"[ETL] LOAD SUCCESS", f"Loaded {records_loaded} rows from {file_name}", [SEND_TO_EMAIL])
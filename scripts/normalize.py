@@ -0,0 +1,80 @@
+import re
+import unicodedata
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+# Cùng thứ tự thử định dạng với biểu thức SET trong LOAD DATA (load_to_staging_db)
+ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+DATE_FORMATS = (
+    "%m/%d/%Y %I:%M:%S %p",  # Mỹ (10/31)
+    "%d/%m/%Y %I:%M:%S %p",  # VN có giờ
+)
+SHORT_DATE_FORMAT = "%d/%m/%Y"  # VN ngắn
+# Tối đa 8 chữ số phần nguyên: vừa cột DECIMAL(10,2)
+PRICE_RE = re.compile(r"^-?[0-9]{1,8}([.][0-9]+)?$")
+PRICE_QUANT = Decimal("0.01")
+# đ/Đ không tách dấu được bằng NFD nhưng utf8mb4_0900_ai_ci vẫn so bằng với d
+ACCENT_FOLD = str.maketrans({"đ": "d", "Đ": "d"})
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value):
+    """
+    Chuỗi ngày trong file export -> date, None nếu không nhận dạng được.
+    Cache theo giá trị: 1 file chỉ có vài ngày khác nhau lặp lại cho mọi dòng.
+    """
+    text = (value or "").strip()
+    if not text:
+        return None
+
+    if ISO_DATE_RE.match(text):
+        try:
+            return datetime.strptime(text[:10], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+
+    try:
+        return datetime.strptime(text.split()[0], SHORT_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=16384)
+def parse_price(value):
+    """
+    '12,000' -> Decimal('12000.00'), None nếu không phải số.
+    """
+    text = (value or "").strip().replace(",", "")
+    if not PRICE_RE.match(text):
+        return None
+    try:
+        return Decimal(text).quantize(PRICE_QUANT)
+    except InvalidOperation:
+        return None
+
+
+def normalize_row(row):
+    """
+    (name, province, date, price) -> (name, province, date, price, price_num, date_value)
+    Giữ nguyên chuỗi gốc để dòng lỗi vào bảng quarantine vẫn đọc được.
+    """
+    name, province, date, price = row
+    return name, province, date, price, parse_price(price), parse_date(date)
+
+
+@lru_cache(maxsize=4096)
+def name_key(name):
+    """
+    Khóa so khớp tên (dim, alias tỉnh) giống cách collation utf8mb4_0900_ai_ci so sánh:
+    bỏ khoảng trắng 2 đầu, bỏ dấu (NFD rồi bỏ combining mark), không phân biệt hoa/thường.
+    'Hà Nội', 'Ha Noi', 'HÀ NỘI' -> 'ha noi'
+    """
+    decomposed = unicodedata.normalize("NFD", name.strip().translate(ACCENT_FOLD))
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
@@ -1,4 +1,7 @@
-import mysql.connector
+from db_pool import get_connection
+import atexit
+import threading
+import time
 from datetime import datetime
 from config import DB_CONFIGS, LOG_TABLES
 from log_manager import log_conf_action
@@ -12,63 +15,191 @@ CONTROL_CONFIG = config["DB_CONFIGS"]['CONTROL']
 CONF_LOG_TABLE = config['LOG_TABLES']['CONF']
 PROCESS_LOG_TABLE = config['LOG_TABLES']['PROCESS']
 
+# Cấu hình cache tham số (config.yaml -> PARAM_CACHE), mặc định TTL 300s
+PARAM_CACHE_CONFIG = config.get('PARAM_CACHE') or {}
+PARAM_CACHE_TTL = float(PARAM_CACHE_CONFIG.get('ttl_seconds', 300))
+# Số dòng log READ tối đa được gom trước khi ghi xuống config_log
+READ_LOG_BATCH_SIZE = int(PARAM_CACHE_CONFIG.get('read_log_batch_size', 50))
+
+# --- TRẠNG THÁI CACHE (dùng chung trong 1 process) ---
+_param_cache = {}
+_cache_loaded_at = None
+_pending_read_logs = []
+_cache_lock = threading.RLock()
+
+
+def _cache_expired():
+    if _cache_loaded_at is None:
+        return True
+    if PARAM_CACHE_TTL <= 0:
+        return True
+    return (time.monotonic() - _cache_loaded_at) > PARAM_CACHE_TTL
+
+
+def refresh_parameter_cache():
+    """
+    Nạp lại toàn bộ tham số đang active trong bảng config bằng 1 câu SELECT.
+    """
+    global _param_cache, _cache_loaded_at
 
-def get_parameter_value(config_key):
-   
     conn = None
-    value = None
-    
     try:
-        conn = mysql.connector.connect(**CONTROL_CONFIG)
+        conn = get_connection('CONTROL')
         cursor = conn.cursor()
-        
-        query = f"SELECT config_value FROM config WHERE config_key = %s"
-        cursor.execute(query, (config_key,)) 
+        cursor.execute("SELECT config_key, config_value FROM config WHERE is_active = 1")
+        rows = cursor.fetchall()
+
+        with _cache_lock:
+            _param_cache = {key: str(value) for key, value in rows}
+            _cache_loaded_at = time.monotonic()
+        return len(rows)
+    finally:
+        if conn:
+            conn.close()
+
+
+def invalidate_parameter_cache(config_key=None):
+    """
+    Xóa cache: 1 key cụ thể, hoặc toàn bộ (lần đọc sau sẽ nạp lại từ DB).
+    """
+    global _cache_loaded_at
+
+    with _cache_lock:
+        if config_key is None:
+            _param_cache.clear()
+            _cache_loaded_at = None
+        else:
+            _param_cache.pop(config_key, None)
+
+
+def _fetch_single_parameter(config_key):
+    """
+    Đọc trực tiếp 1 tham số (dùng khi key không có trong cache, vd: tham số is_active = 0).
+    """
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        cursor.execute("SELECT config_value FROM config WHERE config_key = %s", (config_key,))
         result = cursor.fetchone()
-        
-        if result:
-            value = str(result[0])
-            log_conf_action("READ", config_key, None, value, "Đọc tham số thành công.")
+        return str(result[0]) if result else None
+    finally:
+        if conn:
+            conn.close()
+
+
+def _queue_read_log(config_key, value):
+    with _cache_lock:
+        _pending_read_logs.append(
+            (datetime.now(), "READ", config_key, None, value, "Đọc tham số thành công.")
+        )
+        should_flush = len(_pending_read_logs) >= READ_LOG_BATCH_SIZE
+
+    if should_flush:
+        flush_read_logs()
+
+
+def flush_read_logs():
+    """
+    Ghi tất cả log READ đang chờ vào config_log bằng 1 câu INSERT nhiều dòng.
+    """
+    with _cache_lock:
+        if not _pending_read_logs:
+            return 0
+        rows = list(_pending_read_logs)
+        _pending_read_logs.clear()
+
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        # executemany với INSERT ... VALUES được connector gộp thành 1 câu multi-row
+        cursor.executemany(
+            f"""
+            INSERT INTO {CONF_LOG_TABLE} (log_time, action, param_key, old_value, new_value, message)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            """,
+            rows
+        )
+        conn.commit()
+        return len(rows)
+    except Exception as e:
+        print(f"Lỗi khi ghi log đọc tham số ({len(rows)} dòng): {e}")
+        return 0
+    finally:
+        if conn:
+            conn.close()
+
+
+atexit.register(flush_read_logs)
+
+
+def get_parameter_value(config_key):
+    """
+    Đọc tham số từ cache trong bộ nhớ (TTL), chỉ truy vấn Control DB khi cache hết hạn
+    hoặc key chưa có trong cache.
+    Truy vấn DB chạy ngoài _cache_lock (chỉ giữ lock khi đọc/gán cache), để các luồng
+    khác không bị chặn theo thời gian chờ connection/query.
+    """
+    value = None
+
+    try:
+        with _cache_lock:
+            expired = _cache_expired()
+        if expired:
+            refresh_parameter_cache()
+
+        with _cache_lock:
+            value = _param_cache.get(config_key)
+
+        if value is None:
+            value = _fetch_single_parameter(config_key)
+            if value is not None:
+                with _cache_lock:
+                    _param_cache[config_key] = value
+
+        if value is not None:
+            _queue_read_log(config_key, value)
             return value
         else:
             print(f"Tham số '{config_key}' không tồn tại trong Control DB.")
-            log_conf_action("READ_NOT_FOUND", config_key, None, None, "Tham số không tồn tại.")    
-    
+            log_conf_action("READ_NOT_FOUND", config_key, None, None, "Tham số không tồn tại.")
+
     except Exception as e:
         print(f"Lỗi khi đọc tham số '{config_key}': {e}")
         log_conf_action("READ_FAIL", config_key, None, None, str(e))
 
         return None
-    finally:
-        if conn and conn.is_connected():
-            conn.close()
 
 
 def update_parameter(param_key, new_value):
     conn = None
-    
+
+    # Luôn đọc giá trị cũ mới nhất từ DB, không dùng cache
+    invalidate_parameter_cache(param_key)
     old_value = get_parameter_value(param_key)
-    
+
     try:
-        conn = mysql.connector.connect(**CONTROL_CONFIG)
+        conn = get_connection('CONTROL')
         cursor = conn.cursor()
-        
+
         update_query = f"""
-            UPDATE control_db_parameters 
-            SET param_value = %s 
-            WHERE param_key = %s
+            UPDATE config
+            SET config_value = %s, last_updated_date = NOW()
+            WHERE config_key = %s
         """
         cursor.execute(update_query, (new_value, param_key))
         conn.commit()
-        
+
+        invalidate_parameter_cache(param_key)
         log_conf_action("UPDATE", param_key, old_value, new_value, "Cập nhật tham số thành công.")
         return True
     except Exception as e:
-        conn.rollback()
+        if conn:
+            conn.rollback()
         log_conf_action("UPDATE_FAIL", param_key, old_value, new_value, str(e))
         return False
     finally:
-        if conn and conn.is_connected():
+        if conn:
             conn.close()
 
-print( get_parameter_value('INSERT_AGGRE_DATA_PROCEDURE'))
\ No newline at end of file
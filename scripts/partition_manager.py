@@ -0,0 +1,93 @@
+import re
+from datetime import datetime, date, timedelta
+from mysql.connector import Error, errorcode
+
+# Tên partition theo ngày: p20251125
+PARTITION_RE = re.compile(r"^p(\d{8})$")
+
+
+def _to_date(load_date):
+    if isinstance(load_date, datetime):
+        return load_date.date()
+    if isinstance(load_date, date):
+        return load_date
+    return datetime.strptime(str(load_date), '%Y-%m-%d').date()
+
+
+def partition_name(load_date):
+    return f"p{_to_date(load_date).strftime('%Y%m%d')}"
+
+
+def list_date_partitions(cursor, table):
+    """
+    Danh sách partition theo ngày của bảng: {partition_name: date}.
+    """
+    cursor.execute(
+        """
+        SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+        """,
+        (table,)
+    )
+    partitions = {}
+    for (name,) in cursor.fetchall():
+        match = PARTITION_RE.match(name)
+        if match:
+            partitions[name] = datetime.strptime(match.group(1), '%Y%m%d').date()
+    return partitions
+
+
+def ensure_partition(cursor, table, load_date):
+    """
+    Tạo partition LIST cho load_date nếu chưa có.
+    Nhiều luồng backfill cùng tạo 1 partition -> bỏ qua lỗi trùng tên.
+    """
+    name = partition_name(load_date)
+    if name in list_date_partitions(cursor, table):
+        return name
+    try:
+        cursor.execute(
+            f"ALTER TABLE `{table}` ADD PARTITION "
+            f"(PARTITION `{name}` VALUES IN ('{_to_date(load_date).isoformat()}'))"
+        )
+    except Error as e:
+        if e.errno != errorcode.ER_SAME_NAME_PARTITION:
+            raise
+    return name
+
+
+def create_load_table(cursor, table, load_date):
+    """
+    Bảng nạp tạm (cùng cấu trúc, không partition) cho 1 ngày.
+    LOAD DATA ghi vào đây nên không khóa bảng chính, các ngày nạp song song được.
+    """
+    load_table = f"{table}_load_{_to_date(load_date).strftime('%Y%m%d')}"
+    cursor.execute(f"DROP TABLE IF EXISTS `{load_table}`")
+    cursor.execute(f"CREATE TABLE `{load_table}` LIKE `{table}`")
+    cursor.execute(f"ALTER TABLE `{load_table}` REMOVE PARTITIONING")
+    return load_table
+
+
+def exchange_partition(cursor, table, load_date, load_table):
+    """
+    Đổi partition của ngày với bảng nạp tạm (chỉ đổi metadata, O(1)),
+    sau đó xóa bảng tạm (lúc này chứa dữ liệu cũ của ngày đó).
+    """
+    name = ensure_partition(cursor, table, load_date)
+    cursor.execute(f"ALTER TABLE `{table}` EXCHANGE PARTITION `{name}` WITH TABLE `{load_table}`")
+    cursor.execute(f"DROP TABLE IF EXISTS `{load_table}`")
+    return name
+
+
+def drop_partitions_older_than(cursor, table, retention_days, today=None):
+    """
+    Xóa (DROP PARTITION) các ngày cũ hơn retention_days. retention_days <= 0: giữ tất cả.
+    Trả về: danh sách partition đã xóa.
+    """
+    if not retention_days or int(retention_days) <= 0:
+        return []
+    cutoff = (today or date.today()) - timedelta(days=int(retention_days))
+    expired = sorted(name for name, d in list_date_partitions(cursor, table).items() if d < cutoff)
+    if expired:
+        cursor.execute(f"ALTER TABLE `{table}` DROP PARTITION {', '.join(f'`{n}`' for n in expired)}")
+    return expired
@@ -0,0 +1,60 @@
+import time
+import threading
+from db_pool import get_connection
+from normalize import name_key
+
+# Nạp lại bảng province_alias sau tối đa N giây (thêm alias = chỉ cần INSERT dữ liệu)
+ALIAS_CACHE_TTL = 300
+
+_alias_cache = None
+_cache_loaded_at = None
+_cache_lock = threading.Lock()
+
+
+def _alias_key(province):
+    # Khớp alias như collation utf8mb4_0900_ai_ci (không phân biệt hoa/thường, dấu)
+    return name_key(province or "")
+
+
+def load_province_aliases():
+    """
+    Đọc toàn bộ province_alias (staging) 1 lần: {alias: [(valid_from, valid_to, province_name)]}.
+    """
+    conn = None
+    try:
+        conn = get_connection('STAGING')
+        cursor = conn.cursor()
+        cursor.execute("SELECT alias, province_name, valid_from, valid_to FROM province_alias")
+        aliases = {}
+        for alias, province_name, valid_from, valid_to in cursor.fetchall():
+            aliases.setdefault(_alias_key(alias), []).append((valid_from, valid_to, province_name))
+        return aliases
+    finally:
+        if conn:
+            conn.close()
+
+
+def _get_aliases():
+    global _alias_cache, _cache_loaded_at
+    with _cache_lock:
+        expired = _cache_loaded_at is None or (time.monotonic() - _cache_loaded_at) > ALIAS_CACHE_TTL
+        if expired:
+            _alias_cache = load_province_aliases()
+            _cache_loaded_at = time.monotonic()
+        return _alias_cache
+
+
+def resolve_province(province, on_date=None):
+    """
+    Tên tỉnh sau gộp, cùng logic với LEFT JOIN province_alias trong sp_transform_products.
+    - on_date: ngày dữ liệu để chọn alias còn hiệu lực (None: chỉ khớp alias không giới hạn ngày)
+    Không có alias -> trả về tên đã TRIM.
+    """
+    name = (province or "").strip()
+    for valid_from, valid_to, province_name in _get_aliases().get(_alias_key(name), ()):
+        if valid_from is not None and (on_date is None or valid_from > on_date):
+            continue
+        if valid_to is not None and (on_date is None or valid_to <= on_date):
+            continue
+        return province_name
+    return name
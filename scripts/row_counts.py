@@ -0,0 +1,96 @@
+from db_pool import get_connection
+
+# Result set chuẩn mà các procedure trả về cuối cùng: mỗi dòng (tbl, op, cnt),
+# cnt lấy từ ROW_COUNT() ngay sau câu lệnh tương ứng.
+COUNT_COLUMNS = ("tbl", "op", "cnt")
+OPERATIONS = ("inserted", "updated", "deleted", "exported", "loaded")
+
+
+def add_count(counts, table, op, cnt):
+    """
+    counts: {table: {op: n}}. Bỏ qua giá trị âm (ROW_COUNT() = -1 khi câu lệnh trả result set).
+    """
+    if cnt is None or int(cnt) < 0:
+        return counts
+    table_counts = counts.setdefault(table, {})
+    table_counts[op] = table_counts.get(op, 0) + int(cnt)
+    return counts
+
+
+def merge_counts(*all_counts):
+    merged = {}
+    for counts in all_counts:
+        for table, ops in (counts or {}).items():
+            for op, cnt in ops.items():
+                add_count(merged, table, op, cnt)
+    return merged
+
+
+def read_proc_counts(cursor, verbose=True):
+    """
+    Đọc các result set sau callproc: result set có cột (tbl, op, cnt) -> counts,
+    các result set khác (thông báo trạng thái) chỉ in ra.
+    """
+    counts = {}
+    for result in cursor.stored_results():
+        rows = result.fetchall()
+        if tuple(result.column_names) == COUNT_COLUMNS:
+            for table, op, cnt in rows:
+                add_count(counts, table, op, cnt)
+        elif verbose:
+            for row in rows:
+                print(f"   -> Result: {row}")
+    return counts
+
+
+def total(counts, op=None, table=None):
+    return sum(
+        n
+        for t, ops in counts.items() if table is None or t == table
+        for o, n in ops.items() if op is None or o == op
+    )
+
+
+def format_counts(counts):
+    """
+    {'fact_product_price': {'inserted': 10, 'updated': 2}} -> 'fact_product_price(inserted=10, updated=2)'
+    """
+    return "; ".join(
+        f"{table}({', '.join(f'{op}={n}' for op, n in ops.items())})"
+        for table, ops in counts.items()
+    ) or "no rows"
+
+
+def record_row_counts(process_config_id, process_name, start_time, counts):
+    """
+    Ghi counts vào control.process_row_counts (1 dòng / bảng / lần chạy),
+    nối với process_log qua (process_name, start_time).
+    """
+    if not counts:
+        return 0
+    rows = [
+        (
+            process_config_id, process_name, start_time, table,
+            ops.get("inserted", 0), ops.get("updated", 0), ops.get("deleted", 0),
+            ops.get("exported", 0), ops.get("loaded", 0),
+        )
+        for table, ops in counts.items()
+    ]
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        cursor.executemany(
+            """
+            INSERT INTO process_row_counts (
+                process_config_id, process_name, start_time, table_name,
+                rows_inserted, rows_updated, rows_deleted, rows_exported, rows_loaded
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """,
+            rows
+        )
+        conn.commit()
+        return len(rows)
+    finally:
+        if conn:
+            conn.close()
@@ -0,0 +1,393 @@
+import os
+import sys
+import json
+import argparse
+import importlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from db_pool import get_connection, print_pool_metrics
+from param_sync import flush_read_logs, get_parameter_value
+from log_manager import log_process_action
+from load_config import load_config
+
+config = load_config()
+PROCESS_LOG_TABLE = config['LOG_TABLES']['PROCESS']
+
+# --- CẤU HÌNH BACKFILL ---
+BACKFILL_PROCESS_NAME = "backfill"
+BACKFILL_PROCESS_ID = 7  # ID trong bảng process_config
+
+# --- THỨ TỰ CÁC BƯỚC TRONG PIPELINE (DAG tuyến tính) ---
+STAGES = [
+    "crawling",
+    "load_to_staging",
+    "transform",
+    "load_to_dw",
+    "insert_aggre_data",
+    "load_to_dm",
+]
+
+# Trạng thái trả về của từng bước
+STAGE_OK = "OK"        # Thành công -> chạy bước tiếp theo
+STAGE_STOP = "STOP"    # Không có dữ liệu mới -> dừng pipeline, không tính là lỗi
+STAGE_FAIL = "FAIL"    # Lỗi -> dừng pipeline
+
+
+def _load_module(name):
+    # Chỉ import module của bước nào thực sự được chạy (selenium, pandas...)
+    return importlib.import_module(name)
+
+
+def _stage_crawling(ctx, force_run):
+    extract_data = _load_module("extract_data")
+    result, record_count = extract_data.run_crawling(target_date=ctx["date"], force_run=force_run)
+    ctx["records"]["crawling"] = record_count
+    if not result:
+        return STAGE_STOP
+    if isinstance(result, str):
+        ctx["csv_path"] = result
+    else:
+        # Direct-load: chuyển thẳng các dòng trong bộ nhớ sang bước load
+        ctx["batch"] = result
+        ctx["csv_path"] = result.archive_path
+    return STAGE_OK
+
+
+def _stage_load_to_staging(ctx, force_run):
+    load_to_staging_db = _load_module("load_to_staging_db")
+    records = load_to_staging_db.run_load_staging(
+        target_date_str=ctx["date"],
+        force_run=force_run,
+        csv_path=ctx.get("csv_path"),
+        batch=ctx.get("batch")
+    )
+    if records is None:
+        return STAGE_FAIL
+    ctx["records"]["load_to_staging"] = records
+    return STAGE_OK
+
+
+def _stage_transform(ctx, force_run):
+    transform = _load_module("transform")
+    records = transform.transform_with_proc(load_date=ctx["date"], force_run=force_run)
+    if records is None:
+        return STAGE_FAIL
+    ctx["records"]["transform"] = records
+    return STAGE_OK
+
+
+def _stage_load_to_dw(ctx, force_run):
+    load_to_dw = _load_module("load_to_dw")
+    records = load_to_dw.run_full_process(load_date=ctx["date"], clean=ctx["clean"], force_run=force_run)
+    if records is None:
+        return STAGE_FAIL
+    ctx["records"]["load_to_dw"] = records
+    return STAGE_OK
+
+
+def _stage_insert_aggre_data(ctx, force_run):
+    insert_aggre_data = _load_module("insert_aggre_data")
+    records = insert_aggre_data.insert_with_proc(load_date=ctx["date"], clean=ctx["clean"], force_run=force_run)
+    if records is None:
+        return STAGE_FAIL
+    ctx["records"]["insert_aggre_data"] = records
+    return STAGE_OK
+
+
+def _stage_load_to_dm(ctx, force_run):
+    load_to_dm = _load_module("load_to_dm")
+    records = load_to_dm.run_full_process(load_date=ctx["date"], clean=ctx["clean"], force_run=force_run)
+    if records is None:
+        return STAGE_FAIL
+    ctx["records"]["load_to_dm"] = records
+    return STAGE_OK
+
+
+STAGE_FUNCTIONS = {
+    "crawling": _stage_crawling,
+    "load_to_staging": _stage_load_to_staging,
+    "transform": _stage_transform,
+    "load_to_dw": _stage_load_to_dw,
+    "insert_aggre_data": _stage_insert_aggre_data,
+    "load_to_dm": _stage_load_to_dm,
+}
+
+
+def select_stages(from_stage=None, to_stage=None):
+    """
+    Trả về danh sách bước trong khoảng [from_stage, to_stage] theo thứ tự DAG.
+    """
+    start = STAGES.index(from_stage) if from_stage else 0
+    end = STAGES.index(to_stage) if to_stage else len(STAGES) - 1
+    if start > end:
+        raise ValueError(f"--from '{from_stage}' đứng sau --to '{to_stage}' trong pipeline.")
+    return STAGES[start:end + 1]
+
+
+def run_pipeline(target_date=None, from_stage=None, to_stage=None, force_run=False, clean=1, ctx=None):
+    """
+    Chạy toàn bộ pipeline trong 1 process (dùng chung pool connection và cache tham số).
+    - Bước đầu tiên được chọn vẫn kiểm tra process_log như khi chạy lẻ (trừ khi --force).
+    - Các bước sau nhận kết quả (file CSV, số bản ghi) trực tiếp từ bước trước qua ctx,
+      nên không cần đọc lại process_log.
+    Trả về: (status, ctx)
+    """
+    if target_date is None:
+        target_date = datetime.now().strftime('%Y-%m-%d')
+
+    if ctx is None:
+        ctx = {"date": target_date, "csv_path": None, "records": {}}
+    ctx["clean"] = clean
+
+    stages = select_stages(from_stage, to_stage)
+    print(f"=== PIPELINE {target_date}: {' → '.join(stages)} ===")
+
+    status = STAGE_OK
+    for i, stage in enumerate(stages):
+        stage_force = force_run or i > 0
+        started = datetime.now()
+        print(f"\n>>> [{stage}] bắt đầu ({started:%H:%M:%S})")
+
+        try:
+            status = STAGE_FUNCTIONS[stage](ctx, stage_force)
+        except SystemExit as e:
+            # Một số script dùng sys.exit() để báo trạng thái cho scheduler
+            status = STAGE_OK if not e.code else STAGE_FAIL
+        except Exception as e:
+            print(f"❌ [{stage}] lỗi: {e}")
+            status = STAGE_FAIL
+
+        elapsed = (datetime.now() - started).total_seconds()
+        print(f"<<< [{stage}] {status} ({elapsed:.1f}s, records={ctx['records'].get(stage)})")
+
+        if status != STAGE_OK:
+            ctx["stopped_at"] = stage
+            break
+
+    return status, ctx
+
+
+def _date_range(start_date, end_date):
+    current = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    if current > end:
+        raise ValueError(f"--start-date {start_date} lớn hơn --end-date {end_date}.")
+    dates = []
+    while current <= end:
+        dates.append(current.strftime('%Y-%m-%d'))
+        current += timedelta(days=1)
+    return dates
+
+
+def _read_checkpoints(to_stage=None):
+    """
+    Đọc các checkpoint backfill đã ghi trong process_log.
+    Trả về: (done_dates, crawled_files)
+      - done_dates: các ngày đã chạy xong tới ít nhất bước to_stage (status BS)
+      - crawled_files: {ngày: csv_path} các ngày đã crawl xong (status BC)
+    """
+    done_dates = set()
+    crawled_files = {}
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT status, error_message
+            FROM {PROCESS_LOG_TABLE}
+            WHERE process_config_id = %s AND status IN ('BC', 'BS')
+            ORDER BY id
+        """, (BACKFILL_PROCESS_ID,))
+        for status, message in cursor.fetchall():
+            fields = _checkpoint_fields(message)
+            if "date" not in fields:
+                continue
+            if status == "BS":
+                reached = fields.get("to", STAGES[-1])
+                if STAGES.index(reached) >= STAGES.index(to_stage or STAGES[-1]):
+                    done_dates.add(fields["date"])
+            elif fields.get("file"):
+                crawled_files[fields["date"]] = fields["file"]
+    finally:
+        if conn:
+            conn.close()
+    return done_dates, crawled_files
+
+
+def _checkpoint_fields(message):
+    """
+    Các trường của checkpoint (JSON object trong message). Message không phải JSON object -> {}.
+    """
+    try:
+        fields = json.loads(message or "")
+    except ValueError:
+        return {}
+    return fields if isinstance(fields, dict) else {}
+
+
+def _checkpoint(status, load_date, started, **fields):
+    """
+    Ghi checkpoint backfill vào process_log, message = JSON {"date": ..., **fields}
+    (file: CSV đã crawl, to: bước cuối đã chạy, no_data: ngày không có dữ liệu).
+    """
+    log_process_action(
+        process_config_id=BACKFILL_PROCESS_ID,
+        process_name=BACKFILL_PROCESS_NAME,
+        start_time=started,
+        end_time=datetime.now(),
+        status=status,
+        message=json.dumps({"date": load_date, **fields}, ensure_ascii=False)
+    )
+
+
+def _crawl_partition(load_date, staging_dir, force_run):
+    """
+    Crawl 1 ngày vào thư mục riêng để các luồng crawl song song không đụng file của nhau.
+    """
+    started = datetime.now()
+    ctx = {"date": load_date, "csv_path": None, "records": {}}
+    partition_dir = os.path.join(staging_dir, f"backfill_{load_date}")
+    extract_data = _load_module("extract_data")
+
+    csv_path, record_count = extract_data.run_crawling(
+        target_date=load_date, force_run=force_run, staging_dir=partition_dir,
+        use_watermark=False,  # Mỗi ngày backfill crawl đủ cửa sổ của ngày đó
+        load_mode="file"  # Checkpoint BC lưu đường dẫn file để chạy tiếp khi bị ngắt
+    )
+    ctx["csv_path"] = csv_path
+    ctx["records"]["crawling"] = record_count
+    if csv_path:
+        _checkpoint("BC", load_date, started, file=csv_path)
+    return ctx
+
+
+def run_backfill(start_date, end_date, workers=3, force_run=False, clean=1, to_stage=None):
+    """
+    Backfill khoảng ngày [start_date, end_date]:
+    1. Crawl song song các ngày bằng pool giới hạn `workers` luồng.
+    2. Chạy staging → transform → DW... tới to_stage lần lượt THEO THỨ TỰ NGÀY
+       (SCD2 trong sp_transform_products phụ thuộc thứ tự). to_stage="crawling" -> chỉ crawl.
+    Backfill luôn bắt đầu từ crawling (không có --from).
+    Mỗi ngày xong được checkpoint vào process_log, chạy lại sẽ tiếp tục từ ngày dang dở.
+    """
+    dates = _date_range(start_date, end_date)
+    done_dates, crawled_files = (set(), {}) if force_run else _read_checkpoints(to_stage)
+    pending = [d for d in dates if d not in done_dates]
+
+    print(f"=== BACKFILL {start_date} → {end_date}: {len(pending)}/{len(dates)} ngày cần chạy ===")
+    if not pending:
+        return STAGE_OK, {}
+
+    # 1. CRAWL SONG SONG
+    staging_dir = get_parameter_value('STAGING_DIR') or "./staging"
+    contexts = {}
+    to_crawl = []
+    for d in pending:
+        if d in crawled_files and os.path.exists(crawled_files[d]):
+            print(f"↩️  {d}: dùng lại file đã crawl {crawled_files[d]}")
+            contexts[d] = {"date": d, "csv_path": crawled_files[d], "records": {}}
+        else:
+            to_crawl.append(d)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(_crawl_partition, d, staging_dir, True): d for d in to_crawl}
+        for future in as_completed(futures):
+            d = futures[future]
+            try:
+                contexts[d] = future.result()
+            except BaseException as e:
+                print(f"❌ Crawl lỗi ngày {d}: {e}")
+                contexts[d] = None
+
+    # 2. CÁC BƯỚC SAU: TUẦN TỰ THEO NGÀY
+    results = {}
+    status = STAGE_OK
+    for d in pending:
+        ctx = contexts.get(d)
+        if ctx is None:
+            status = STAGE_FAIL
+            results[d] = STAGE_FAIL
+            print(f"⛔ Dừng backfill tại {d} vì crawl thất bại (các ngày sau phụ thuộc thứ tự SCD).")
+            break
+
+        started = datetime.now()
+        if not ctx["csv_path"]:
+            results[d] = STAGE_STOP
+            _checkpoint("BS", d, started, to=STAGES[-1], no_data=1)
+            continue
+
+        if to_stage == "crawling":
+            # --to crawling: chỉ crawl, các bước sau để lần chạy khác
+            results[d] = STAGE_OK
+            _checkpoint("BS", d, started, to=to_stage)
+            continue
+
+        # Dependency đã đảm bảo trong process -> force các bước sau crawl
+        status, ctx = run_pipeline(
+            target_date=d, from_stage="load_to_staging", to_stage=to_stage,
+            force_run=True, clean=clean, ctx=ctx
+        )
+        results[d] = status
+        if status == STAGE_FAIL:
+            print(f"⛔ Dừng backfill tại {d}. Chạy lại cùng lệnh để tiếp tục từ ngày này.")
+            break
+        _checkpoint("BS", d, started, to=to_stage or STAGES[-1])
+
+    return status, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the whole ETL pipeline in one process.")
+    parser.add_argument("--date", type=str, default=None, help="Format YYYY-MM-DD (e.g., 2025-11-23)")
+    parser.add_argument("--from", dest="from_stage", choices=STAGES, default=None, help="First stage to run")
+    parser.add_argument("--to", dest="to_stage", choices=STAGES, default=None, help="Last stage to run")
+    parser.add_argument("--force", action="store_true", help="Force run ignoring logs of the first stage")
+    parser.add_argument("--no-clean", action="store_true", help="Skip cleanup (clean=0)")
+    parser.add_argument("--start-date", type=str, default=None, help="Backfill: first date (YYYY-MM-DD)")
+    parser.add_argument("--end-date", type=str, default=None, help="Backfill: last date (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=3, help="Backfill: number of concurrent crawlers")
+
+    args = parser.parse_args()
+    clean_flag = 0 if args.no_clean else 1
+
+    # Kiểm tra tham số trước khi chạy bất kỳ bước nào
+    try:
+        select_stages(args.from_stage, args.to_stage)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.start_date or args.end_date:
+        if not (args.start_date and args.end_date):
+            parser.error("--start-date và --end-date phải đi cùng nhau.")
+        if args.from_stage:
+            parser.error("--from không dùng được với backfill (backfill luôn bắt đầu từ crawling).")
+        if args.date:
+            parser.error("--date không dùng được với --start-date/--end-date.")
+        try:
+            _date_range(args.start_date, args.end_date)
+        except ValueError as e:
+            parser.error(str(e))
+        status, results = run_backfill(
+            start_date=args.start_date,
+            end_date=args.end_date,
+            workers=args.workers,
+            force_run=args.force,
+            clean=clean_flag,
+            to_stage=args.to_stage
+        )
+        print(f"\n=== BACKFILL KẾT THÚC: {status} | {results} ===")
+    else:
+        status, ctx = run_pipeline(
+            target_date=args.date,
+            from_stage=args.from_stage,
+            to_stage=args.to_stage,
+            force_run=args.force,
+            clean=clean_flag
+        )
+        print(f"\n=== PIPELINE KẾT THÚC: {status} | Records: {ctx['records']} ===")
+
+    flush_read_logs()
+    print_pool_metrics()
+
+    sys.exit(1 if status == STAGE_FAIL else 0)
@@ -0,0 +1,109 @@
+import sys
+import argparse
+from db_pool import get_connection
+
+# Publish bảng báo cáo theo kiểu shadow + RENAME:
+#   1. build phiên bản mới vào <bảng>_new (CREATE TABLE ... LIKE -> giữ nguyên index)
+#   2. 1 câu RENAME TABLE cho cả nhóm: <bảng>_old -> <bảng>_drop, <bảng> -> <bảng>_old,
+#      <bảng>_new -> <bảng>; sau đó mới DROP <bảng>_drop
+# Dashboard luôn thấy bảng đầy đủ (bản cũ hoặc bản mới), <bảng>_old giữ lại để rollback tức thì.
+# RENAME lỗi -> không bảng nào đổi tên, bản _old hiện có vẫn còn.
+
+SHADOW_SUFFIX = "_new"
+OLD_SUFFIX = "_old"
+DROP_SUFFIX = "_drop"
+ROLLBACK_SUFFIX = "_rollback"
+
+# Nhóm bảng publish cùng lúc theo DB
+PUBLISH_GROUPS = {
+    "M1D": ("rpt_product_price_summary", "rpt_province_price_summary", "rpt_weekly_price_trend"),
+    "STAGING": ("mart_weekly_price_trend", "mart_product_price_summary", "mart_province_price_summary"),
+}
+
+
+def create_shadow_table(cursor, table):
+    """
+    Tạo <bảng>_new rỗng cùng cấu trúc + index với bảng đang chạy.
+    """
+    shadow = f"{table}{SHADOW_SUFFIX}"
+    cursor.execute(f"DROP TABLE IF EXISTS {shadow}")
+    cursor.execute(f"CREATE TABLE {shadow} LIKE {table}")
+    return shadow
+
+
+def existing_tables(cursor, tables):
+    """
+    Returns: tập tên bảng (trong danh sách) đang tồn tại ở DB hiện tại.
+    """
+    cursor.execute(
+        f"""
+        SELECT TABLE_NAME FROM information_schema.TABLES
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ({', '.join(['%s'] * len(tables))})
+        """,
+        tuple(tables)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def publish_tables(cursor, tables):
+    """
+    Đổi cả nhóm bảng sang bản _new trong 1 câu RENAME TABLE (atomic),
+    bản đang chạy trở thành _old. Bản _old trước đó được dời sang _drop trong cùng câu RENAME
+    và chỉ bị DROP sau khi RENAME thành công.
+    """
+    # _drop còn sót lại từ lần publish bị ngắt giữa RENAME và DROP
+    cursor.execute(f"DROP TABLE IF EXISTS {', '.join(f'{t}{DROP_SUFFIX}' for t in tables)}")
+
+    olds = existing_tables(cursor, [f"{t}{OLD_SUFFIX}" for t in tables])
+    renames = []
+    for t in tables:
+        if f"{t}{OLD_SUFFIX}" in olds:
+            renames.append(f"{t}{OLD_SUFFIX} TO {t}{DROP_SUFFIX}")
+        renames.append(f"{t} TO {t}{OLD_SUFFIX}, {t}{SHADOW_SUFFIX} TO {t}")
+    cursor.execute(f"RENAME TABLE {', '.join(renames)}")
+    print(f"    Published {len(tables)} table(s): {', '.join(tables)}")
+
+    cursor.execute(f"DROP TABLE IF EXISTS {', '.join(f'{t}{DROP_SUFFIX}' for t in tables)}")
+
+
+def rollback_tables(cursor, tables):
+    """
+    Đổi lại bản _old thành bản đang chạy (bản vừa publish trở thành _old), 1 câu RENAME TABLE.
+    Returns: False (không đổi gì) nếu thiếu bản _old của bảng nào trong nhóm.
+    """
+    olds = [f"{t}{OLD_SUFFIX}" for t in tables]
+    found = existing_tables(cursor, olds)
+    missing = [old for old in olds if old not in found]
+    if missing:
+        print(f"⚠️ Không rollback được: thiếu {', '.join(missing)} (chưa publish lần nào hoặc đã bị xóa).")
+        return False
+
+    renames = ", ".join(
+        f"{t} TO {t}{ROLLBACK_SUFFIX}, {t}{OLD_SUFFIX} TO {t}, {t}{ROLLBACK_SUFFIX} TO {t}{OLD_SUFFIX}"
+        for t in tables
+    )
+    cursor.execute(f"RENAME TABLE {renames}")
+    print(f"    Rolled back {len(tables)} table(s): {', '.join(tables)}")
+    return True
+
+
+def rollback_group(db_name):
+    conn = None
+    try:
+        conn = get_connection(db_name)
+        return rollback_tables(conn.cursor(), PUBLISH_GROUPS[db_name])
+    finally:
+        if conn:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Roll back the last table-swap publish of a report group.")
+    parser.add_argument("--db", choices=sorted(PUBLISH_GROUPS), default="M1D", help="DB of the published group")
+    parser.add_argument("--rollback", action="store_true", help="Swap the _old tables back in")
+    args = parser.parse_args()
+
+    if args.rollback:
+        sys.exit(0 if rollback_group(args.db) else 1)
+    else:
+        parser.print_help()
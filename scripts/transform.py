@@ -7,8 +7,11 @@ from param_sync import get_parameter_value
 import argparse
 from send_mail import send_email
 from load_config import load_config
+from db_pool import get_connection
 from datetime import datetime
 from logger_manager import get_group_logger
+from row_counts import read_proc_counts, record_row_counts, format_counts, total
+from fact_partitions import ensure_partition, apply_retention
 
 PROCESS_NAME = "transform"
 PREV_PROCESS = "load_to_staging"
@@ -24,6 +27,8 @@ PROCESS_LOG_TABLE = config['LOG_TABLES']['PROCESS']
 # 2. load config_param
 procedure_name = get_parameter_value('TRANSFORM_PROCEDURE')
 SEND_TO_EMAIL = get_parameter_value('SEND_TO_EMAIL')
+# Số ngày giữ partition fact ở staging (0 = giữ toàn bộ)
+STG_FACT_RETENTION_DAYS = int(get_parameter_value('STG_FACT_RETENTION_DAYS') or 0)
 
 # 3. setup logger
 etl_log = get_group_logger("TRANSFORM")
@@ -70,7 +75,12 @@ def transform_with_proc(load_date=None, force_run=False):
         prev_status = get_process_log_value(PREV_PROCESS, current_execution_date)
         etl_log.info(f"Check log '{PREV_PROCESS}' ngày {current_execution_date}: {prev_status}")
 
-        if prev_status != "LS" and not force_run:
+        if prev_status == "LS_SKIP" and not force_run:
+            msg = f"♻️ Bước trước '{PREV_PROCESS}' đã bỏ qua (không có dữ liệu mới). Skip Transform."
+            print(msg)
+            etl_log.info(msg)
+            return
+        elif prev_status != "LS" and not force_run:
             msg = f"❌ Bước trước '{PREV_PROCESS}' chưa hoàn thành hôm nay (Status: {prev_status}). Dùng --force để bỏ qua."
             print(msg)
             return
@@ -85,34 +95,45 @@ def transform_with_proc(load_date=None, force_run=False):
             print(msg)
             return
         
-        # --- 3. THỰC THI PROCEDURE ---
-        # Kết nối DB
-        conn = mysql.connector.connect(**STAGING_CONFIG)
-        cursor = conn.cursor()
-
-        # Gọi Procedure với NGÀY DỮ LIỆU (target_data_date)
-        print(f"⚡ Đang gọi Procedure: {procedure_name}('{target_data_date}')...")
-        etl_log.info(f"Calling {procedure_name} with {target_data_date}")
-        
-        cursor.callproc(procedure_name, [target_data_date])
-
+        # --- 3. THỰC THI PROCEDURE / ENGINE PYTHON ---
         records_transform = 0
+        counts = {}
+
+        # Partition riêng cho ngày dữ liệu trước khi ghi fact (fact.load_date = ngày dữ liệu)
+        ensure_partition('STAGING', target_data_date)
+
+        if procedure_name.startswith("python:"):
+            # TRANSFORM_PROCEDURE = 'python:pandas' -> engine Python (chỉ import khi dùng)
+            from transform_engine import run_transform_engine
+
+            engine = procedure_name.split(":", 1)[1]
+            print(f"⚡ Đang chạy transform engine: {engine}('{target_data_date}')...")
+            etl_log.info(f"Running transform engine {engine} with {target_data_date}")
+
+            records_transform, counts = run_transform_engine(engine, target_data_date)
+        else:
+            # Kết nối DB
+            conn = get_connection('STAGING')
+            cursor = conn.cursor()
+
+            # Gọi Procedure với NGÀY DỮ LIỆU (target_data_date)
+            print(f"⚡ Đang gọi Procedure: {procedure_name}('{target_data_date}')...")
+            etl_log.info(f"Calling {procedure_name} with {target_data_date}")
+            
+            cursor.callproc(procedure_name, [target_data_date])
+
+            # Procedure trả về số dòng (tbl, op, cnt) lấy từ ROW_COUNT()
+            counts = read_proc_counts(cursor)
+            records_transform = total(counts, "inserted", "stg_products_transformed")
+
+            conn.commit()
 
-        # Lấy kết quả trả về
-        for result in cursor.stored_results():
-            for row in result.fetchall():
-                print(f"   -> Result: {row}")
-                # Logic lấy số dòng (tùy chỉnh theo output thực tế của SP)
-                if len(row) >= 1:
-                     try:
-                        records_transform = int(row[-1])
-                     except:
-                        pass
-
-        conn.commit()
         end_time = datetime.now()
         
         print(f"✅ Transform thành công! Records biến đổi: {records_transform}")
+        print(f"   -> Row counts: {format_counts(counts)}")
+        record_row_counts(3, PROCESS_NAME, start_time, counts)
+        apply_retention('STAGING', STG_FACT_RETENTION_DAYS)
 
         # --- 4. GHI LOG VÀ GỬI MAIL ---
         log_process_action(
@@ -124,7 +145,7 @@ def transform_with_proc(load_date=None, force_run=False):
             records_extract=None,
             records_loaded=None,
             records_transform=records_transform,
-            message="Transform completed successfully."
+            message=f"Transform completed successfully. {format_counts(counts)}"
         )
 
         if SEND_TO_EMAIL:
@@ -139,6 +160,8 @@ def transform_with_proc(load_date=None, force_run=False):
             # Đã sửa lỗi thừa tham số etl_log
             send_email(subject, body, [SEND_TO_EMAIL]) 
 
+        return records_transform
+
     except mysql.connector.Error as e:
         end_time = datetime.now()
         print(f"❌ MySQL Error: {e}")
@@ -175,7 +198,7 @@ def transform_with_proc(load_date=None, force_run=False):
 
     finally:
         if cursor: cursor.close()
-        if conn and conn.is_connected():
+        if conn:
             conn.close()
             etl_log.info("Closed MySQL connection.")
 
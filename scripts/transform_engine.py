@@ -0,0 +1,356 @@
+import hashlib
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from db_pool import get_connection
+from dim_keys import get_dim_key_cache
+from province_alias import resolve_province
+from row_counts import add_count
+
+# TRANSFORM_PROCEDURE = 'python:<engine>' -> transform.py gọi engine Python thay cho procedure
+# Số dòng mỗi lô khi ghi delta (executemany -> INSERT nhiều VALUES)
+TRANSFORM_WRITE_BATCH = 5000
+OPEN_END_DATE = "9999-12-31"
+KEY_COLUMNS = ["product_id", "province_id"]
+
+# Dữ liệu partition cũ (trước khi có price_num/date_value): thử lần lượt như normalize.py
+FALLBACK_DATE_FORMATS = (
+    "%m/%d/%Y %I:%M:%S %p",
+    "%d/%m/%Y %I:%M:%S %p",
+)
+PRICE_PATTERN = r"^-?[0-9]{1,8}(?:[.][0-9]+)?$"
+PRICE_QUANT = Decimal("0.01")
+
+
+def _to_date(load_date):
+    if isinstance(load_date, str):
+        return datetime.strptime(load_date, '%Y-%m-%d').date()
+    return load_date
+
+
+def _fetch_frame(cursor, query, params=None):
+    cursor.execute(query, params)
+    columns = [c[0] for c in cursor.description]
+    return pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+
+
+@lru_cache(maxsize=16384)
+def _row_hash(price):
+    # Giống UNHEX(MD5(CONCAT_WS('|', price))): NULL bị CONCAT_WS bỏ qua -> chuỗi rỗng
+    text = "" if price is None or pd.isna(price) else str(price)
+    return hashlib.md5(text.encode("utf-8")).digest()
+
+
+def _parse_dates(raw):
+    """
+    Parse vectorized chuỗi ngày gốc cho dòng chưa có date_value: ISO trước,
+    sau đó các định dạng có giờ, cuối cùng dd/mm/YYYY trên token đầu.
+    """
+    text = raw.fillna("").str.strip()
+    parsed = pd.to_datetime(text.where(text.str.match(r"^\d{4}-\d{2}-\d{2}")).str[:10],
+                            format="%Y-%m-%d", errors="coerce")
+    for fmt in FALLBACK_DATE_FORMATS:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(text[missing], format=fmt, errors="coerce")
+    missing = parsed.isna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(text[missing].str.split().str[0], format="%d/%m/%Y", errors="coerce")
+    return parsed.dt.date
+
+
+def _parse_prices(raw):
+    text = raw.fillna("").str.strip().str.replace(",", "", regex=False)
+    # Giữ Decimal(10,2) như price_num để row_hash khớp với procedure
+    return text.where(text.str.match(PRICE_PATTERN)).map(
+        lambda v: Decimal(v).quantize(PRICE_QUANT), na_action="ignore"
+    )
+
+
+def _category_ids(series, keys):
+    """
+    Map cột categorical -> id: chỉ resolve từng category 1 lần rồi lấy theo codes.
+    """
+    categories = series.cat.categories
+    mapping = keys.resolve(categories)
+    category_ids = np.array([mapping.get(c.strip()) for c in categories] + [None], dtype=object)
+    return pd.Series(category_ids[series.cat.codes.to_numpy()], index=series.index).astype("Int64")
+
+
+def read_staging_frame(cursor, load_date):
+    """
+    Bước 1 của sp_transform_products: đọc partition stg_products của ngày, TRIM tên,
+    gộp tỉnh (province_std -> province_alias -> TRIM), lấy price/date đã chuẩn hóa.
+    """
+    frame = _fetch_frame(
+        cursor,
+        """
+        SELECT name, province, price, `date`, price_num, date_value, province_std,
+               product_id, province_id
+        FROM stg_products
+        WHERE load_date = %s
+        ORDER BY id
+        """,
+        (load_date,)
+    )
+    if frame.empty:
+        raise ValueError("LỖI: stg_products không có dữ liệu cho ngày cần transform!")
+
+    # Partition nạp trước khi có cột chuẩn hóa: parse lại từ chuỗi gốc
+    missing_date = frame["date_value"].isna()
+    if missing_date.any():
+        frame.loc[missing_date, "date_value"] = _parse_dates(frame.loc[missing_date, "date"])
+    missing_price = frame["price_num"].isna()
+    if missing_price.any():
+        frame.loc[missing_price, "price_num"] = _parse_prices(frame.loc[missing_price, "price"])
+
+    frame["name"] = frame["name"].str.strip(" ").astype("category")
+
+    needs_alias = frame["province_std"].isna()
+    if needs_alias.any():
+        pairs = frame.loc[needs_alias, ["province", "date_value"]].drop_duplicates()
+        pairs["resolved"] = [resolve_province(p, d) for p, d in pairs.itertuples(index=False)]
+        resolved = frame.loc[needs_alias, ["province", "date_value"]].merge(
+            pairs, on=["province", "date_value"], how="left"
+        )["resolved"].to_numpy()
+        frame.loc[needs_alias, "province_std"] = resolved
+    frame["province"] = frame["province_std"].str.strip(" ").astype("category")
+
+    return frame.rename(columns={"price_num": "price_value"})[
+        ["name", "province", "price_value", "date_value", "product_id", "province_id"]
+    ]
+
+
+def plan_transform(cursor, load_date):
+    """
+    Tính delta SCD2 (không ghi standardized/fact):
+    - transformed : các dòng đã chuẩn hóa + key + row_hash (tương đương stg_products_transformed)
+    - close       : dòng standardized active bị đóng (id, product_id, province_id, date_create)
+    - insert      : phiên bản mới cần insert vào standardized/fact
+    - fact_insert : phần của `insert` chưa có trong fact ngày load_date
+    Thành viên dim mới được thêm qua dim_keys (anti-join, giống bước 2 của procedure).
+    """
+    load_date = _to_date(load_date)
+    frame = read_staging_frame(cursor, load_date)
+
+    # 2. Dimensions: resolve theo category, giữ key đã resolve sẵn lúc direct-load
+    product_ids = _category_ids(frame["name"], get_dim_key_cache("product"))
+    province_ids = _category_ids(frame["province"], get_dim_key_cache("province"))
+    frame["product_id"] = frame["product_id"].astype("Int64").fillna(product_ids)
+    frame["province_id"] = frame["province_id"].astype("Int64").fillna(province_ids)
+
+    frame["row_hash"] = frame["price_value"].map(_row_hash)
+
+    data_dates = frame["date_value"].dropna()
+    dates = pd.DataFrame(columns=["date_value", "date_id"])
+    if not data_dates.empty:
+        dates = _fetch_frame(
+            cursor,
+            "SELECT full_date AS date_value, date_id FROM dim_date WHERE full_date >= %s AND full_date < %s",
+            (data_dates.min(), data_dates.max() + timedelta(days=1))
+        )
+    transformed = frame.merge(dates, on="date_value", how="left")
+
+    keyed = transformed.dropna(subset=KEY_COLUMNS)
+    # Dòng có ngày không nằm trong dim_date bị bỏ qua, giống JOIN dim_date ở bước 2.3 của procedure
+    no_date = keyed["date_id"].isna()
+    if no_date.any():
+        missing = sorted(keyed.loc[no_date, "date_value"].astype(str).unique())
+        print(f"⚠️ Bỏ qua {int(no_date.sum())} dòng có ngày không nằm trong dim_date: {', '.join(missing)}")
+        keyed = keyed[~no_date]
+
+    # 2.3 Mỗi (product, province) chỉ giữ dòng mới nhất theo date_value (cùng ngày -> dòng nạp sau),
+    #     giống ROW_NUMBER() trong procedure
+    latest = keyed.assign(_order=np.arange(len(keyed))).sort_values(
+        ["date_value", "_order"], kind="stable"
+    ).drop_duplicates(KEY_COLUMNS, keep="last")
+    groups = latest[KEY_COLUMNS + ["row_hash", "name", "province", "price_value", "date_id"]].rename(
+        columns={"price_value": "price"}
+    ).reset_index(drop=True)
+    groups["name"] = groups["name"].astype(str)
+    groups["province"] = groups["province"].astype(str)
+
+    # Phiên bản active hiện tại; dòng cũ chưa có key/hash được bổ sung bằng join tên (bước 2.2)
+    active = _fetch_frame(
+        cursor,
+        """
+        SELECT s.id,
+               COALESCE(s.product_id, dp.product_id) AS product_id,
+               COALESCE(s.province_id, dv.province_id) AS province_id,
+               COALESCE(s.row_hash, UNHEX(MD5(CONCAT_WS('|', s.price)))) AS row_hash,
+               DATE(s.date_create) AS date_create
+        FROM stg_products_standardized s
+        LEFT JOIN dim_product dp ON s.product_id IS NULL AND dp.product_name = s.name
+        LEFT JOIN dim_province dv ON s.province_id IS NULL AND dv.province_name = s.province
+        WHERE s.is_active = 1
+        """
+    )
+    if active.empty:
+        active = pd.DataFrame(columns=["id", "product_id", "province_id", "row_hash", "date_create"])
+    active = active.dropna(subset=KEY_COLUMNS)
+    active[KEY_COLUMNS] = active[KEY_COLUMNS].astype("int64")
+    active["row_hash"] = active["row_hash"].map(bytes)
+    groups[KEY_COLUMNS] = groups[KEY_COLUMNS].astype("int64")
+
+    # 3. Đóng bản active khác hash với dòng mới nhất
+    pairs = active.merge(groups[KEY_COLUMNS + ["row_hash"]], on=KEY_COLUMNS, suffixes=("", "_new"))
+    close = pairs.loc[pairs["row_hash"] != pairs["row_hash_new"],
+                      ["id", "product_id", "province_id", "date_create"]].drop_duplicates("id")
+
+    # 4. Insert dòng mới nhất nếu không trùng hash với bản active còn lại
+    still_active = active[~active["id"].isin(close["id"])]
+    matched = groups.merge(still_active[KEY_COLUMNS + ["row_hash"]], on=KEY_COLUMNS + ["row_hash"],
+                           how="left", indicator=True)
+    insert = matched[matched["_merge"] == "left_only"].drop(columns="_merge").reset_index(drop=True)
+
+    # 5.2 Fact: bỏ qua cặp key đã có dòng date_create = load_date
+    existing = _fetch_frame(
+        cursor,
+        "SELECT product_id, province_id FROM fact_product_price WHERE date_create = %s",
+        (load_date,)
+    )
+    if existing.empty:
+        fact_insert = insert
+    else:
+        fact_matched = insert.merge(existing.drop_duplicates(), on=KEY_COLUMNS, how="left", indicator=True)
+        fact_insert = fact_matched[fact_matched["_merge"] == "left_only"].drop(columns="_merge")
+
+    return {
+        "load_date": load_date,
+        "transformed": transformed,
+        "close": close,
+        "insert": insert,
+        "fact_insert": fact_insert,
+    }
+
+
+def _executemany(cursor, query, records):
+    affected = 0
+    for i in range(0, len(records), TRANSFORM_WRITE_BATCH):
+        cursor.executemany(query, records[i:i + TRANSFORM_WRITE_BATCH])
+        affected += max(cursor.rowcount, 0)
+    return affected
+
+
+def apply_plan(cursor, plan):
+    """
+    Ghi delta của plan_transform: bổ sung key/hash dòng cũ, đóng dòng active,
+    insert phiên bản mới vào standardized và fact.
+    Trả về: {bảng: {op: số dòng}} lấy từ cursor.rowcount.
+    """
+    counts = {}
+    load_date = plan["load_date"]
+    expire_date = load_date - timedelta(days=1)
+    close, insert, fact_insert = plan["close"], plan["insert"], plan["fact_insert"]
+
+    # 2.2 Dòng active cũ (trước khi có cột key/hash)
+    cursor.execute(
+        """
+        UPDATE stg_products_standardized s
+        JOIN dim_product dp ON dp.product_name = s.name
+        JOIN dim_province dv ON dv.province_name = s.province
+        SET s.product_id = dp.product_id,
+            s.province_id = dv.province_id,
+            s.row_hash = UNHEX(MD5(CONCAT_WS('|', s.price)))
+        WHERE s.product_id IS NULL
+          AND s.is_active = 1
+        """
+    )
+
+    # 3. Đóng standardized + 5.1 đóng fact tương ứng (index (product_id, province_id, date_create))
+    ids = [int(i) for i in close["id"]]
+    for i in range(0, len(ids), TRANSFORM_WRITE_BATCH):
+        chunk = ids[i:i + TRANSFORM_WRITE_BATCH]
+        cursor.execute(
+            f"UPDATE stg_products_standardized SET expire_date = %s, is_delete = 1 "
+            f"WHERE id IN ({', '.join(['%s'] * len(chunk))})",
+            [expire_date] + chunk
+        )
+        add_count(counts, "stg_products_standardized", "updated", cursor.rowcount)
+    fact_closed = _executemany(
+        cursor,
+        """
+        UPDATE fact_product_price SET expire_date = %s, is_delete = 1
+        WHERE product_id = %s AND province_id = %s AND date_create = %s
+        """,
+        [(expire_date, int(r.product_id), int(r.province_id), r.date_create)
+         for r in close.itertuples(index=False)]
+    )
+    add_count(counts, "fact_product_price", "updated", fact_closed)
+
+    # 4. Phiên bản mới
+    std_inserted = _executemany(
+        cursor,
+        """
+        INSERT INTO stg_products_standardized (
+            name, province, product_id, province_id, price, row_hash,
+            date_id, is_delete, date_create, expire_date
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, 0, %s, %s)
+        """,
+        [(r.name, r.province, int(r.product_id), int(r.province_id), r.price, r.row_hash,
+          int(r.date_id), load_date, OPEN_END_DATE)
+         for r in insert.itertuples(index=False)]
+    )
+    add_count(counts, "stg_products_standardized", "inserted", std_inserted)
+
+    # 5.2 Fact
+    fact_inserted = _executemany(
+        cursor,
+        """
+        INSERT INTO fact_product_price (
+            product_id, province_id, date_id, price, date_create, expire_date, is_delete, load_date
+        ) VALUES (%s, %s, %s, %s, %s, %s, 0, %s)
+        """,
+        [(int(r.product_id), int(r.province_id), int(r.date_id), r.price, load_date, OPEN_END_DATE, load_date)
+         for r in fact_insert.itertuples(index=False)]
+    )
+    add_count(counts, "fact_product_price", "inserted", fact_inserted)
+
+    return counts
+
+
+def transform_pandas(load_date):
+    """
+    Engine pandas thay cho sp_transform_products: tính delta trong Python,
+    ghi standardized/fact trong 1 transaction.
+    Trả về: (số dòng đã transform, counts).
+    """
+    dim_caches = {dim: get_dim_key_cache(dim) for dim in ("product", "province")}
+    dims_before = {dim: cache.stats["inserted"] for dim, cache in dim_caches.items()}
+    conn = None
+    try:
+        conn = get_connection('STAGING')
+        cursor = conn.cursor()
+        plan = plan_transform(cursor, load_date)
+        counts = apply_plan(cursor, plan)
+        conn.commit()
+        for dim, cache in dim_caches.items():
+            add_count(counts, cache.table, "inserted", cache.stats["inserted"] - dims_before[dim])
+        return len(plan["transformed"]), counts
+    except Exception:
+        if conn:
+            conn.rollback()
+        raise
+    finally:
+        if conn:
+            conn.close()
+
+
+ENGINES = {
+    "pandas": transform_pandas,
+}
+
+
+def run_transform_engine(engine, load_date):
+    """
+    engine: phần sau 'python:' trong TRANSFORM_PROCEDURE.
+    Trả về: (số dòng đã transform, {bảng: {op: số dòng}}).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Transform engine '{engine}' không hợp lệ. Chọn một trong: {list(ENGINES.keys())}")
+    return ENGINES[engine](load_date)
@@ -0,0 +1,51 @@
+from datetime import datetime
+from db_pool import get_connection
+
+
+def get_watermark(process_config_id):
+    """
+    Đọc process_config.last_successful_watermark của 1 process.
+    Trả về: datetime hoặc None nếu process chưa chạy thành công lần nào.
+    """
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT last_successful_watermark FROM process_config WHERE id = %s",
+            (process_config_id,)
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    finally:
+        if conn:
+            conn.close()
+
+
+def advance_watermark(process_config_id, watermark):
+    """
+    Đẩy watermark lên `watermark` trong 1 câu UPDATE (atomic).
+    Chỉ tiến, không lùi: run cũ/backfill chạy song song không ghi đè watermark mới hơn.
+    Trả về: True nếu watermark được cập nhật.
+    """
+    if isinstance(watermark, str):
+        watermark = datetime.strptime(watermark, '%Y-%m-%d')
+
+    conn = None
+    try:
+        conn = get_connection('CONTROL')
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE process_config
+            SET last_successful_watermark = %s, last_updated_date = NOW()
+            WHERE id = %s
+              AND (last_successful_watermark IS NULL OR last_successful_watermark < %s)
+            """,
+            (watermark, process_config_id, watermark)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+    finally:
+        if conn:
+            conn.close()